@@ -0,0 +1,90 @@
+"""Compare file-order and sky-sorted upload batching against a local stand-in server.
+
+Usage: python benchmarks/bench_batching.py [--sources 20000] [--chunk-size 200]
+
+The stand-in keeps a synthetic S-PLUS-like catalog split into sky partitions
+and charges ``--partition-cost`` seconds for every partition a chunk's cone
+join has to open, on top of ``--latency`` per query, which is the behaviour
+of a spatially indexed server. Batches are built either in input-file order
+or after :func:`splus_match.chunking.sort_by_sky`.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from astropy.table import Table
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from splus_match.chunking import AdaptiveChunker, sort_by_sky  # noqa: E402
+from splus_match.matcher import LocalMatcher  # noqa: E402
+from splus_match.scheduler import QueryScheduler  # noqa: E402
+from splus_match.sphere import sky_index  # noqa: E402
+from splus_match.testing import FakeConnection  # noqa: E402
+
+PARTITION_ORDER = 5
+
+
+def random_stripe(n, rng):
+    # Positions in an S-PLUS-like stripe: RA 0-360, DEC -30..+5
+    ra = rng.uniform(0.0, 360.0, n)
+    s = rng.uniform(np.sin(np.radians(-30.0)), np.sin(np.radians(5.0)), n)
+    return ra, np.degrees(np.arcsin(s))
+
+
+class ConeJoinServer:
+    def __init__(self, catalog, radius_arcsec, latency, partition_cost):
+        self.catalog = catalog
+        self.matcher = LocalMatcher(catalog["RA"].to_numpy(), catalog["DEC"].to_numpy())
+        self.radius = radius_arcsec
+        self.latency = latency
+        self.partition_cost = partition_cost
+        self.partitions_opened = 0
+
+    def __call__(self, query, upload):
+        ra = upload["GALEX_RA"].to_numpy()
+        dec = upload["GALEX_DEC"].to_numpy()
+        opened = len(np.unique(sky_index(ra, dec, PARTITION_ORDER)))
+        self.partitions_opened += opened
+        time.sleep(self.latency + opened * self.partition_cost)
+        _, idx, _ = self.matcher.match_all(ra, dec, self.radius)
+        return Table.from_pandas(self.catalog.iloc[idx].reset_index(drop=True))
+
+
+def run(df, server, chunk_size, concurrency):
+    conn = FakeConnection(server)
+    chunker = AdaptiveChunker(initial=chunk_size, max_size=chunk_size, growth=1.0)
+    t0 = time.perf_counter()
+    with QueryScheduler(conn, max_concurrency=concurrency) as scheduler:
+        rows = sum(len(chunk.result) for chunk in chunker.run(scheduler, "cone join", df))
+    return time.perf_counter() - t0, rows, conn.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sources", type=int, default=20000)
+    parser.add_argument("--catalog", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--partition-cost", type=float, default=0.0005)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    ra, dec = random_stripe(args.catalog, rng)
+    catalog = pd.DataFrame({"ID": np.arange(args.catalog), "RA": ra, "DEC": dec})
+    pick = rng.integers(0, args.catalog, args.sources)
+    sources = pd.DataFrame({"GALEX_RA": ra[pick] + rng.normal(0, 1e-4, args.sources),
+                            "GALEX_DEC": dec[pick] + rng.normal(0, 1e-4, args.sources)})
+
+    print(f"{'batching':>10} {'time [s]':>9} {'queries':>8} {'partitions':>11} {'rows':>8}")
+    for name, df in (("file", sources), ("sky", sort_by_sky(sources, "GALEX_RA", "GALEX_DEC"))):
+        server = ConeJoinServer(catalog, 2.0, args.latency, args.partition_cost)
+        elapsed, rows, calls = run(df, server, args.chunk_size, args.concurrency)
+        print(f"{name:>10} {elapsed:>9.2f} {calls:>8} {server.partitions_opened:>11} {rows:>8}")
+
+
+if __name__ == "__main__":
+    main()
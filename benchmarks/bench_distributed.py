@@ -0,0 +1,83 @@
+"""Field strategy on a Dask LocalCluster against the fake S-PLUS server, checked against run_field.
+
+Usage: python benchmarks/bench_distributed.py [--splus-rows 1000000] [--galex-rows 20000]
+           [--workers 1 2 4] [--fields-per-task 1] [--latency 0.2] [--failure-rate 0.02]
+           [--mode best_right]
+
+Every Dask worker serves the same synthetic catalog through
+splus_match.testing.FakeServerFactory, with the given query latency and
+error rate. The same input is matched once with the process-pool pipeline
+(splus_match.strategies.run_field) and once per --workers value with
+splus_match.distributed.run_field_dask; each Dask output must have exactly
+the rows of the pipeline's. Reported: wall time, sources/s and the summed
+network and match seconds of each run.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from splus_match import strategies  # noqa: E402
+from splus_match.distributed import run_field_dask  # noqa: E402
+from splus_match.testing import FakeServerFactory, synthetic_galex  # noqa: E402
+
+
+def sorted_rows(path):
+    df = pd.read_parquet(path)
+    return df.sort_values(["GALEX_RA", "GALEX_DEC", "ID"]).reset_index(drop=True)
+
+
+def stage_seconds(stats, name):
+    return stats["telemetry"]["stages"].get(name, {}).get("seconds", 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--splus-rows", type=int, default=1000000)
+    parser.add_argument("--galex-rows", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--fields-per-task", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--mode", default="best_right")
+    parser.add_argument("--radius", type=float, default=2.0)
+    args = parser.parse_args()
+
+    from dask.distributed import Client, LocalCluster
+
+    connect = FakeServerFactory(args.splus_rows, latency=args.latency, failure_rate=args.failure_rate, seed=0)
+    server = connect.server()
+    galex = synthetic_galex(server.catalog, args.galex_rows)
+    fields = server.field_table()
+    common = dict(release="idr5", radius_arcsec=args.radius, ra_col="GALEX_RA", dec_col="GALEX_DEC",
+                  photometry=("PStotal",), mode=args.mode, fields=fields, retries=6, rate=None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = strategies.run_field(galex, connect(), os.path.join(tmp, "pipeline.parquet"),
+                                        cache_dir=os.path.join(tmp, "cache"), max_concurrency=4, **common)
+        expected = sorted_rows(baseline["output"])
+        runs = [("pipeline", baseline)]
+        for n_workers in args.workers:
+            with LocalCluster(n_workers=n_workers, threads_per_worker=1) as cluster, Client(cluster) as client:
+                out = os.path.join(tmp, f"dask{n_workers}.parquet")
+                stats = run_field_dask(galex, out, client=client, connect=connect,
+                                       fields_per_task=args.fields_per_task, **common)
+            if stats["failed"]:
+                raise SystemExit(f"{stats['failed']} fields failed with {n_workers} workers")
+            pd.testing.assert_frame_equal(sorted_rows(out), expected)
+            runs.append((f"dask x{n_workers}", stats))
+
+    print(f"\n{len(galex)} sources, {len(fields)} fields, {baseline['rows']} matched rows "
+          f"(identical in every run)")
+    print(f"{'run':<12} {'seconds':>9} {'sources/s':>10} {'network s':>10} {'match s':>9}")
+    for name, stats in runs:
+        print(f"{name:<12} {stats['seconds']:>9.2f} {stats['sources'] / stats['seconds']:>10.0f} "
+              f"{stage_seconds(stats, 'network'):>10.1f} {stage_seconds(stats, 'match'):>9.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
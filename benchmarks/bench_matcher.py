@@ -0,0 +1,78 @@
+"""Compare the LocalMatcher KD-tree against the SkyCoord.match_to_catalog_sky path.
+
+Usage: python benchmarks/bench_matcher.py [--sizes 100000 1000000 10000000] [--batches 20]
+
+The local catalog has ``size`` rows and is matched against ``batches`` field
+batches of ``size / batches`` rows each, mimicking the per-field loop.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from splus_match.matcher import LocalMatcher  # noqa: E402
+
+
+def random_sky(n, rng):
+    ra = rng.uniform(0.0, 360.0, n)
+    dec = np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, n)))
+    return ra, dec
+
+
+def run_skycoord(local_ra, local_dec, batches, radius):
+    local_coords = SkyCoord(ra=local_ra * u.deg, dec=local_dec * u.deg, frame='icrs')
+    n_matched = 0
+    for ra, dec in batches:
+        coords = SkyCoord(ra=ra * u.deg, dec=dec * u.deg, frame='icrs')
+        idx, sep2d, _ = coords.match_to_catalog_sky(local_coords)
+        n_matched += int((sep2d < radius * u.arcsec).sum())
+    return n_matched
+
+
+def run_matcher(local_ra, local_dec, batches, radius):
+    matcher = LocalMatcher(local_ra, local_dec)
+    n_matched = 0
+    for ra, dec in batches:
+        n_matched += len(matcher.match_nearest(ra, dec, radius)[0])
+    return n_matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10**5, 10**6, 10**7])
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--radius", type=float, default=2.0, help="match radius in arcsec")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'rows':>10} {'skycoord [s]':>13} {'matcher [s]':>12} {'speedup':>8}")
+    for size in args.sizes:
+        local_ra, local_dec = random_sky(size, rng)
+        # Half of each batch are jittered copies of local sources, so there are real matches
+        batch_size = max(size // args.batches, 1)
+        batches = []
+        for _ in range(args.batches):
+            pick = rng.integers(0, size, batch_size // 2)
+            ra, dec = random_sky(batch_size - len(pick), rng)
+            jitter = rng.normal(0.0, 0.5 / 3600.0, (2, len(pick)))
+            batches.append((np.concatenate([local_ra[pick] + jitter[0], ra]),
+                            np.concatenate([local_dec[pick] + jitter[1], dec])))
+
+        t0 = time.perf_counter()
+        n_sky = run_skycoord(local_ra, local_dec, batches, args.radius)
+        t1 = time.perf_counter()
+        n_kd = run_matcher(local_ra, local_dec, batches, args.radius)
+        t2 = time.perf_counter()
+        if n_sky != n_kd:
+            print(f"warning: match counts differ ({n_sky} vs {n_kd})")
+        print(f"{size:>10} {t1 - t0:>13.2f} {t2 - t1:>12.2f} {(t1 - t0) / (t2 - t1):>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
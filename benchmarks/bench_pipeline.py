@@ -0,0 +1,87 @@
+"""Compare serial download-then-match with the pipelined FieldPipeline.
+
+Usage: python benchmarks/bench_pipeline.py [--fields 64] [--rows 100000] [--local 500000]
+                                           [--latency 0.5] [--workers 8]
+
+Fields are "downloaded" from a FakeConnection with the given latency through
+the QueryScheduler, as in match-splusdatabase-v2.py. The serial run matches
+each field in the main process as it arrives (the scripts' former loop); the
+pipelined run overlaps the downloads with a pool of matcher processes. Both
+must find the same matches.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from splus_match.matcher import LocalMatcher  # noqa: E402
+from splus_match.pipeline import FieldPipeline  # noqa: E402
+from splus_match.scheduler import QueryScheduler  # noqa: E402
+from splus_match.testing import FakeConnection  # noqa: E402
+
+
+def make_fields(ra, dec, n_fields, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    tables = {}
+    for i in range(n_fields):
+        idx = rng.integers(0, len(ra), rows)
+        jitter = rng.normal(0, 1.0 / 3600, (2, rows))
+        tables[f"FIELD-{i:04d}"] = pd.DataFrame({"RA": ra[idx] + jitter[0], "DEC": dec[idx] + jitter[1]})
+    return tables
+
+
+def downloads(tables, latency, concurrency):
+    conn = FakeConnection(handler=lambda query, upload: tables[query], latency=latency, seed=1)
+    scheduler = QueryScheduler(conn, max_concurrency=concurrency, verbose=False)
+    try:
+        for res in scheduler.run((key, key, None) for key in tables):
+            yield res.key, res.result
+    finally:
+        scheduler.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fields", type=int, default=64)
+    parser.add_argument("--rows", type=int, default=100000, help="rows per field")
+    parser.add_argument("--local", type=int, default=500000, help="local catalog size")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per field download")
+    parser.add_argument("--concurrency", type=int, default=4, help="downloads in flight")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch", type=int, default=2, help="fields per matcher task")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    ra = rng.uniform(0, 20, args.local)
+    dec = np.degrees(np.arcsin(rng.uniform(np.sin(np.radians(-10)), np.sin(np.radians(10)), args.local)))
+    tables = make_fields(ra, dec, args.fields, args.rows)
+
+    t0 = time.perf_counter()
+    matcher = LocalMatcher(ra, dec)
+    serial = {}
+    for key, table in downloads(tables, args.latency, args.concurrency):
+        serial[key] = len(matcher.match(table["RA"].values, table["DEC"].values, 2, mode="best_right")[0])
+    t_serial = time.perf_counter() - t0
+    print(f"serial:    {sum(serial.values())} matches in {t_serial:.2f} s")
+
+    piped = {}
+
+    def sink(key, table, table_idx, local_idx, sep, rank):
+        piped[key] = len(table_idx)
+
+    pipeline = FieldPipeline(ra, dec, radius_arcsec=2, match_workers=args.workers, batch_size=args.batch,
+                             mode="best_right", report_every=5.0)
+    t0 = time.perf_counter()
+    pipeline.run([downloads(tables, args.latency, args.concurrency)], sink)
+    t_piped = time.perf_counter() - t0
+    print(f"pipelined: {sum(piped.values())} matches in {t_piped:.2f} s ({t_serial / t_piped:.1f}x)")
+    print(pipeline.summary())
+    assert piped == serial, "pipelined and serial matches differ"
+
+
+if __name__ == "__main__":
+    main()
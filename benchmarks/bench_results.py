@@ -0,0 +1,82 @@
+"""Memory/time of result ingestion: vstack + to_pandas + to_csv vs compact Arrow + Parquet.
+
+Usage: python benchmarks/bench_results.py [--rows 2000000] [--chunks 20]
+
+Each path runs in its own subprocess so that its peak RSS can be reported.
+The synthetic results mimic an idr5_dual upload join: Field, ID, RA/DEC,
+shape parameters, flags and 12-band PStotal magnitudes with errors, some of
+them masked, split into ``--chunks`` astropy Tables as returned per query.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from astropy.table import MaskedColumn, Table, vstack
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from splus_match.adql import BANDS  # noqa: E402
+from splus_match.results import compact  # noqa: E402
+from splus_match.writer import StreamingWriter  # noqa: E402
+
+
+def synthetic_chunks(rows, chunks, seed=3):
+    rng = np.random.default_rng(seed)
+    size = rows // chunks
+    for c in range(chunks):
+        t = Table()
+        t["Field"] = np.array([f"SPLUS-s{c:02d}s{f:02d}" for f in rng.integers(0, 40, size)])
+        t["ID"] = np.array([f"iDR5.{c}.{i:07d}" for i in range(size)])
+        t["RA"] = rng.uniform(0, 360, size)
+        t["DEC"] = rng.uniform(-30, 5, size)
+        for name in ("FWHM", "KRON_RADIUS", "ISOarea", "CLASS_STAR"):
+            t[name] = rng.random(size)
+        t["SEX_FLAGS_DET"] = rng.integers(0, 4, size)
+        for band in BANDS:
+            mag = rng.normal(20, 1.5, size)
+            t[f"{band}_PStotal"] = MaskedColumn(mag, mask=mag > 22)
+            t[f"e_{band}_PStotal"] = MaskedColumn(rng.random(size) * 0.1, mask=mag > 22)
+        yield t
+
+
+def run_path(path, rows, chunks, out_dir):
+    t0 = time.perf_counter()
+    if path == "vstack":
+        tables = list(synthetic_chunks(rows, chunks))
+        vstack(tables).to_pandas().to_csv(os.path.join(out_dir, "out.csv"), index=False)
+        out = os.path.join(out_dir, "out.csv")
+    else:
+        out = os.path.join(out_dir, "out.parquet")
+        with StreamingWriter(out) as writer:
+            for table in synthetic_chunks(rows, chunks):
+                writer.write(compact(table))
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{path} {elapsed:.2f} {peak_mb:.0f} {os.path.getsize(out) / 1e6:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--path", choices=("vstack", "arrow"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        if args.path:
+            run_path(args.path, args.rows, args.chunks, out_dir)
+            return
+        print(f"{'path':>8} {'time [s]':>9} {'peak RSS [MB]':>14} {'output [MB]':>12}")
+        for path in ("vstack", "arrow"):
+            out = subprocess.run([sys.executable, __file__, "--path", path, "--rows", str(args.rows),
+                                  "--chunks", str(args.chunks)],
+                                 check=True, capture_output=True, text=True).stdout.split()
+            print(f"{out[0]:>8} {float(out[1]):>9.2f} {float(out[2]):>14.0f} {float(out[3]):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
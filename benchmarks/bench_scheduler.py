@@ -0,0 +1,72 @@
+"""Exercise QueryScheduler against a FakeConnection with injected latency and failures.
+
+Usage: python benchmarks/bench_scheduler.py [--queries 200] [--latency 0.05] [--failure-rate 0.1]
+
+Runs the old pattern of match-splusdatabase-RA_DEC.py (4 threads, results read
+in submission order, fixed pause after each) and the scheduler on the same
+fake server, and checks that the scheduler returns every query, honours the
+concurrency limit and retries the injected failures.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from splus_match.scheduler import QueryScheduler  # noqa: E402
+from splus_match.testing import FakeConnection  # noqa: E402
+
+
+def run_fixed_pause(conn, n, pause):
+    ok = 0
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(conn.query, f"query {i}") for i in range(n)]
+        for future in futures:
+            try:
+                future.result()
+                ok += 1
+            except Exception:
+                pass
+            time.sleep(pause)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--pause", type=float, default=0.02,
+                        help="fixed pause after each result in the old pattern (2 s in the script)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=None, help="queries per second")
+    args = parser.parse_args()
+
+    conn = FakeConnection(latency=args.latency, jitter=args.jitter,
+                          failure_rate=args.failure_rate, seed=1)
+    t0 = time.perf_counter()
+    ok = run_fixed_pause(conn, args.queries, args.pause)
+    t_old = time.perf_counter() - t0
+    print(f"fixed pause: {ok}/{args.queries} ok in {t_old:.2f} s ({conn.calls} calls)")
+
+    conn = FakeConnection(latency=args.latency, jitter=args.jitter,
+                          failure_rate=args.failure_rate, seed=1)
+    scheduler = QueryScheduler(conn, max_concurrency=args.concurrency, rate=args.rate,
+                               burst=args.concurrency, retries=6, backoff=0.01, timeout=5.0, verbose=False)
+    t0 = time.perf_counter()
+    keys = [r.key for r in scheduler.run((i, f"query {i}", None) for i in range(args.queries))
+            if r.error is None]
+    t_new = time.perf_counter() - t0
+    scheduler.close()
+    print(f"scheduler:   {len(keys)}/{args.queries} ok in {t_new:.2f} s ({conn.calls} calls, "
+          f"{scheduler.stats['retries']} retries, max {conn.max_in_flight} in flight)")
+
+    assert sorted(keys) == list(range(args.queries)), "some queries were lost"
+    assert conn.max_in_flight <= args.concurrency, "concurrency limit exceeded"
+    assert conn.calls == args.queries + scheduler.stats["retries"]
+
+
+if __name__ == "__main__":
+    main()
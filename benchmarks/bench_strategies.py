@@ -0,0 +1,178 @@
+"""End-to-end comparison of the matching strategies against a local fake S-PLUS server.
+
+Usage: python benchmarks/bench_strategies.py [--splus-rows 1000000] [--galex-rows 10000]
+           [--strategies field upload acos lsdb] [--latency 0.05] [--failure-rate 0.01]
+           [--max-upload 5000] [--max-result 500000] [--json results.json]
+
+A synthetic S-PLUS-like catalog (--splus-rows, 10^3 to 10^7) and GALEX-like
+input (--galex-rows) are served by splus_match.testing.FakeSplusServer behind
+a FakeConnection with the given latency, jitter and error rate, and with
+payload limits on uploads and results. Each strategy runs in its own
+subprocess, so its peak RSS can be reported:
+
+  field   per-field downloads matched locally (splus_match.strategies.run_field)
+  upload  adaptive TAP_UPLOAD cone joins (splus_match.strategies.run_upload)
+  acos    the original v4 loop: one full-table ACOS query per source, run on the
+          first --acos-limit sources and extrapolated
+  lsdb    LSDB crossmatch of in-memory HiPSCat catalogs (needs lsdb)
+
+Reported per strategy: wall time, sources/s, output rows, peak RSS (and the
+RSS of the synthetic data alone) and server round trips. --json saves the
+same numbers to compare runs and catch regressions.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from splus_match import strategies  # noqa: E402
+from splus_match.adql import BANDS  # noqa: E402
+from splus_match.testing import FakeSplusServer, synthetic_galex, synthetic_splus  # noqa: E402
+from splus_match.writer import StreamingWriter  # noqa: E402
+
+STRATEGIES = ("field", "upload", "acos", "lsdb")
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def acos_query(ra, dec, fields, radius_arcsec):
+    # The query of the original match-splus-database-v4.py, for one source
+    columns = ", ".join(["dual.Field", "dual.ID", "dual.RA", "dual.DEC"]
+                        + [f"dual.{b}_PStotal, dual.e_{b}_PStotal" for b in BANDS])
+    field_list = ",".join(f"'{field}'" for field in fields)
+    return (f'SELECT {columns}\nFROM "idr5"."idr5_dual" AS dual\n'
+            f"WHERE dual.Field IN ({field_list})\n"
+            f"AND 60 * 60 * 2.0 * DEGREES(ACOS(SIN(RADIANS({dec})) * SIN(RADIANS(dual.DEC)) + "
+            f"COS(RADIANS({dec})) * COS(RADIANS(dual.DEC)) * COS(RADIANS(dual.RA - {ra})))) <= {radius_arcsec}")
+
+
+def run_acos(galex, conn, fields, out, radius_arcsec, limit):
+    t0 = time.perf_counter()
+    sample = galex.iloc[:limit]
+    crossmatched = pd.DataFrame()
+    for _, row in sample.iterrows():
+        try:
+            splus_data = conn.query(acos_query(row["GALEX_RA"], row["GALEX_DEC"], fields, radius_arcsec)).to_pandas()
+        except Exception as e:
+            print(f"Error querying near {row['GALEX_RA']}, {row['GALEX_DEC']}: {e}")
+            continue
+        splus_data["GALEX_RA"] = row["GALEX_RA"]
+        splus_data["GALEX_DEC"] = row["GALEX_DEC"]
+        crossmatched = pd.concat([crossmatched, splus_data], ignore_index=True)
+    crossmatched.to_csv(out, index=False)
+    seconds = time.perf_counter() - t0
+    # Extrapolated to the whole input at the measured rate
+    return {"strategy": "acos", "sources": len(galex), "rows": len(crossmatched), "output": out,
+            "seconds": seconds * len(galex) / max(len(sample), 1), "measured_sources": len(sample)}
+
+
+def run_lsdb(splus, galex, out, radius_arcsec, parallel):
+    import lsdb
+    from splus_match.lsdb_pipeline import stream_partitions
+
+    t0 = time.perf_counter()
+    dual = lsdb.from_dataframe(splus.astype({"Field": str}), ra_column="RA", dec_column="DEC",
+                               margin_threshold=radius_arcsec)
+    local = lsdb.from_dataframe(galex, ra_column="GALEX_RA", dec_column="GALEX_DEC")
+    writer = StreamingWriter(out)
+    try:
+        timings = stream_partitions(local.crossmatch(dual, radius_arcsec=radius_arcsec), writer,
+                                    parallel=parallel, report=None)
+    finally:
+        writer.close()
+    return {"strategy": "lsdb", "sources": len(galex), "rows": writer.rows, "output": str(writer.path),
+            "seconds": time.perf_counter() - t0, "partitions": sum(len(p) for p, _, _ in timings)}
+
+
+def run_strategy(args, work_dir):
+    splus = synthetic_splus(args.splus_rows, seed=0)
+    galex = synthetic_galex(splus, args.galex_rows, seed=1)
+    server = FakeSplusServer(splus, max_upload_rows=args.max_upload, max_result_rows=args.max_result)
+    fields = server.field_table()
+    data_rss = peak_rss_mb()
+    conn = server.connect(latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate, seed=2)
+    scheduling = dict(max_concurrency=args.concurrency, rate=None, retries=6, timeout=None)
+    common = dict(release="idr5", radius_arcsec=args.radius, ra_col="GALEX_RA", dec_col="GALEX_DEC")
+
+    out = os.path.join(work_dir, f"{args.run}.parquet")
+    if args.run == "field":
+        stats = strategies.run_field(galex, conn, out, **common, **scheduling, fields=fields,
+                                     cache_dir=os.path.join(work_dir, "cache"),
+                                     match_workers=args.workers, photometry=("PStotal",))
+    elif args.run == "upload":
+        stats = strategies.run_upload(galex, conn, out, **common, **scheduling, photometry=("PStotal",),
+                                      join="")
+    elif args.run == "acos":
+        stats = run_acos(galex, conn, fields["Field"], out.replace(".parquet", ".csv"), args.radius,
+                         args.acos_limit)
+    else:
+        try:
+            stats = run_lsdb(splus, galex, out, args.radius, args.workers or 4)
+        except ImportError as e:
+            stats = {"strategy": "lsdb", "skipped": f"not available: {e}"}
+    stats.update(round_trips=conn.calls, injected_failures=conn.failures, server=server.stats,
+                 peak_rss_mb=peak_rss_mb(), data_rss_mb=data_rss)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--splus-rows", type=int, default=1_000_000)
+    parser.add_argument("--galex-rows", type=int, default=10_000)
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=list(STRATEGIES))
+    parser.add_argument("--radius", type=float, default=1.0, help="match radius (arcsec)")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per query")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--max-upload", type=int, default=5000, help="largest accepted upload (rows)")
+    parser.add_argument("--max-result", type=int, default=500_000, help="largest accepted result (rows)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None, help="matcher processes / LSDB partitions")
+    parser.add_argument("--acos-limit", type=int, default=100, help="sources actually queried by acos")
+    parser.add_argument("--json", help="save the results to this file")
+    parser.add_argument("--run", choices=STRATEGIES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        with tempfile.TemporaryDirectory() as work_dir:
+            stats = run_strategy(args, work_dir)
+        print("RESULT " + json.dumps(stats, default=str))
+        return
+
+    results = []
+    for name in args.strategies:
+        proc = subprocess.run([sys.executable, __file__, *sys.argv[1:], "--run", name],
+                              capture_output=True, text=True)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("RESULT ")]
+        if proc.returncode != 0 or not lines:
+            print(f"{name}: failed\n{proc.stderr[-2000:]}")
+            continue
+        results.append(json.loads(lines[-1][len("RESULT "):]))
+
+    print(f"S-PLUS rows: {args.splus_rows}, GALEX rows: {args.galex_rows}, latency {args.latency} s, "
+          f"failure rate {args.failure_rate}")
+    print(f"{'strategy':>8} {'time [s]':>9} {'sources/s':>10} {'rows':>9} {'peak RSS [MB]':>14} "
+          f"{'data [MB]':>10} {'round trips':>12}")
+    for r in results:
+        if "skipped" in r:
+            print(f"{r['strategy']:>8}  skipped ({r['skipped']})")
+            continue
+        note = f"  (extrapolated from {r['measured_sources']} sources)" if "measured_sources" in r else ""
+        print(f"{r['strategy']:>8} {r['seconds']:>9.2f} {r['sources'] / max(r['seconds'], 1e-9):>10.1f} "
+              f"{r['rows']:>9} {r['peak_rss_mb']:>14.0f} {r['data_rss_mb']:>10.0f} {r['round_trips']:>12}{note}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared helpers for the S-PLUS crossmatch scripts."""
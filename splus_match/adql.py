@@ -0,0 +1,267 @@
+"""Build the S-PLUS dual/PSF photometry queries.
+
+iDR4 keeps each band in its own table (``idr4_dual.idr4_dual_<band>`` and
+``idr4_psf.idr4_psf_<band>``, joined to ``idr4_detection_image`` on ``id``);
+iDR5 has one merged ``idr5_dual`` table and one ``idr5_psf`` table. The builder
+selects only the requested bands and photometry types and joins only the
+tables those columns live in.
+
+Screening runs can push work to the server: ``filters`` such as
+``("r_PStotal", "<", 18)`` become ``WHERE`` conditions (the same tuples are
+LSDB/pyarrow ``filters``), and :func:`build_summary_query` returns one
+aggregated row per uploaded source instead of every matching detection.
+"""
+
+BANDS = ("u", "J0378", "J0395", "J0410", "J0430", "g", "J0515", "r", "J0660", "i", "J0861", "z")
+
+# Photometry type -> (table kind, per-band column patterns, error column patterns)
+PHOTOMETRY = {
+    "PStotal": ("dual", ("{b}_PStotal",), ("e_{b}_PStotal",)),
+    "auto": ("dual", ("{b}_auto",), ("e_{b}_auto",)),
+    "petro": ("dual", ("{b}_petro",), ("e_{b}_petro",)),
+    "iso": ("dual", ("{b}_iso",), ("e_{b}_iso",)),
+    "s2n": ("dual", ("s2n_{b}_PStotal",), ()),
+    "FWHM": ("dual", ("FWHM_{b}", "FWHM_n_{b}"), ()),
+    "flags": ("dual", ("SEX_FLAGS_{b}",), ()),
+    "psf": ("psf", ("{b}_psf",), ("e_{b}_psf",)),
+    "class_star": ("psf", ("CLASS_STAR_{b}",), ()),
+}
+
+# Band-independent columns of the detection image / merged dual table
+DEFAULT_COLUMNS = {
+    "idr4": ("Field", "ID", "RA", "DEC", "X", "Y", "FWHM", "FWHM_n", "ISOarea", "KRON_RADIUS",
+             "MU_MAX_INST", "PETRO_RADIUS", "SEX_FLAGS_DET", "SEX_NUMBER_DET", "CLASS_STAR",
+             "s2n_DET_PStotal", "THETA", "ELLIPTICITY", "ELONGATION",
+             "FLUX_RADIUS_20", "FLUX_RADIUS_50", "FLUX_RADIUS_70", "FLUX_RADIUS_90"),
+    "idr5": ("Field", "ID", "RA", "DEC", "X", "Y", "A", "B", "ELLIPTICITY", "ELONGATION",
+             "FWHM", "KRON_RADIUS", "ISOarea", "MU_MAX_r", "s2n_DET_PStotal",
+             "SEX_FLAGS_DET", "SEX_FLAGS_r"),
+}
+
+
+# Comparison operators of filters, longest first for parsing
+FILTER_OPS = ("<=", ">=", "!=", "==", "<", ">", "=")
+ADQL_OPS = {"==": "=", "!=": "<>"}
+
+
+def release_name(release):
+    # Accept "idr5", "iDR5", "dr5" or "5"
+    release = str(release).lower()
+    if not release.startswith("idr"):
+        release = "idr" + release.removeprefix("dr")
+    if release not in DEFAULT_COLUMNS:
+        raise ValueError(f"unknown data release {release!r}; expected one of {sorted(DEFAULT_COLUMNS)}")
+    return release
+
+
+def main_alias(release):
+    # Alias of the table holding RA/DEC in the queries built below
+    return "det" if release_name(release) == "idr4" else "dual"
+
+
+def _main_table(release):
+    return '"idr4_dual"."idr4_detection_image"' if release == "idr4" else '"idr5"."idr5_dual"'
+
+
+def _band_table(release, table_kind, band):
+    # (alias, table) of a photometry column; table is None for the main table
+    if release == "idr4":
+        return f"{table_kind[0]}_{band.lower()}", f'"idr4_{table_kind}"."idr4_{table_kind}_{band.lower()}"'
+    if table_kind == "psf":
+        return "psf", '"idr5"."idr5_psf"'
+    return main_alias(release), None
+
+
+def column_table(release, column):
+    """``(alias, table)`` of the table holding ``column``; ``table`` is None for the main table."""
+    release = release_name(release)
+    for table_kind, patterns, error_patterns in PHOTOMETRY.values():
+        for band in BANDS:
+            if column in [p.format(b=band) for p in patterns + error_patterns]:
+                return _band_table(release, table_kind, band)
+    return main_alias(release), None
+
+
+def parse_filter(text):
+    """``"r_PStotal<18"`` -> ``("r_PStotal", "<", 18.0)``."""
+    for op in FILTER_OPS:
+        column, found, value = text.partition(op)
+        if not found:
+            continue
+        column, value = column.strip(), value.strip()
+        if not column.isidentifier():
+            raise ValueError(f"invalid filter column in {text!r}")
+        try:
+            value = int(value)
+        except ValueError:
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValueError(f"filter values must be numbers: {text!r}") from None
+        return column, "==" if op == "=" else op, value
+    raise ValueError(f"invalid filter {text!r}; expected e.g. r_PStotal<18")
+
+
+def _filter_conditions(release, filters, tables):
+    # WHERE conditions of ``filters``; the tables they need are added to ``tables``
+    conditions = []
+    for column, op, value in filters:
+        alias, table = column_table(release, column)
+        if table is not None:
+            tables.setdefault(alias, table)
+        conditions.append(f"{alias}.{column} {ADQL_OPS.get(op, op)} {value!r}")
+    return conditions
+
+
+def _cone_join(main_table, main, ra_col, dec_col, radius, join, bbox):
+    join_kw = f"{join} JOIN".strip()
+    return [
+        "FROM TAP_UPLOAD.upload AS tap",
+        f"{join_kw} {main_table} AS {main}",
+        f"    ON (1=CONTAINS(POINT('ICRS', {main}.RA, {main}.DEC),",
+        f"        CIRCLE('ICRS', tap.{ra_col}, tap.{dec_col}, {radius!r})){{bbox}})" if bbox else
+        f"        CIRCLE('ICRS', tap.{ra_col}, tap.{dec_col}, {radius!r})))",
+    ]
+
+
+def _photometry_bands(photometry, bands):
+    # ``photometry`` is a list of types (all applied to ``bands``) or a {type: bands} dict
+    if isinstance(photometry, str):
+        photometry = (photometry,)
+    if not isinstance(photometry, dict):
+        photometry = {kind: bands for kind in photometry}
+    for kind in photometry:
+        if kind not in PHOTOMETRY:
+            raise ValueError(f"unknown photometry type {kind!r}; expected one of {sorted(PHOTOMETRY)}")
+    return photometry
+
+
+def build_query(release, bands=BANDS, photometry=("PStotal", "psf"), columns=None, errors=True,
+                field=None, radius=None, ra_col="GALEX_RA", dec_col="GALEX_DEC",
+                upload_columns=(), join="LEFT OUTER", bbox=False, where=None, filters=()):
+    """Return the smallest ADQL query for the requested bands and photometry.
+
+    ``release`` is ``"idr4"`` or ``"idr5"``. ``photometry`` lists types from
+    :data:`PHOTOMETRY` applied to every band in ``bands``, or maps each type
+    to its own bands. ``columns`` are band-independent columns (defaults to
+    :data:`DEFAULT_COLUMNS`); ``errors=False`` drops the ``e_`` columns.
+
+    The spatial predicate is either ``field`` (``WHERE Field = ...``; pass
+    ``"{field}"`` to get a template) or ``radius`` in degrees for a cone join
+    against ``TAP_UPLOAD.upload`` on ``ra_col``/``dec_col``, using ``join``
+    (``"LEFT OUTER"`` keeps unmatched uploads, ``""`` does not).
+    ``upload_columns`` are uploaded columns to return, and ``bbox=True``
+    leaves a ``{bbox}`` placeholder in the join condition for
+    :func:`splus_match.chunking.bbox_predicate`. ``where`` adds extra
+    conditions and ``filters`` are ``(column, op, value)`` cuts on any
+    selectable column; either drops uploads without a passing match, even
+    in a ``LEFT OUTER`` join.
+    """
+    release = release_name(release)
+    photometry = _photometry_bands(photometry, bands)
+    columns = DEFAULT_COLUMNS[release] if columns is None else columns
+    main = main_alias(release)
+
+    select = [f"tap.{c}" for c in upload_columns] + [f"{main}.{c}" for c in columns]
+    tables = {}  # alias -> table, in order of first use
+    for kind, kind_bands in photometry.items():
+        table_kind, patterns, error_patterns = PHOTOMETRY[kind]
+        for band in kind_bands:
+            alias, table = _band_table(release, table_kind, band)
+            if table is not None:
+                tables[alias] = table
+            for pattern in patterns + (error_patterns if errors else ()):
+                select.append(f"{alias}.{pattern.format(b=band)}")
+    filter_conditions = _filter_conditions(release, filters, tables)
+
+    main_table = _main_table(release)
+    lines = ["SELECT", "    " + ",\n    ".join(select)]
+    conditions = []
+    if radius is not None:
+        lines.extend(_cone_join(main_table, main, ra_col, dec_col, radius, join, bbox))
+    else:
+        lines.append(f"FROM {main_table} AS {main}")
+    for alias, table in tables.items():
+        lines.append(f"LEFT OUTER JOIN {table} AS {alias} ON {alias}.id = {main}.id")
+
+    if field is not None:
+        conditions.append(f"{main}.Field = '{field}'")
+    conditions.extend(filter_conditions)
+    if where:
+        conditions.extend([where] if isinstance(where, str) else where)
+    if conditions:
+        lines.append("WHERE " + "\n  AND ".join(conditions))
+    return "\n".join(lines) + "\n"
+
+
+def build_centre_query(release):
+    """One row per field with the mean unit vector (``x``, ``y``, ``z``) of its detections.
+
+    A full-table aggregate, meant to be run once per release and cached; see
+    :func:`splus_match.footprint.add_field_centres`.
+    """
+    release = release_name(release)
+    main = main_alias(release)
+    ra, dec = f"RADIANS({main}.RA)", f"RADIANS({main}.DEC)"
+    return "\n".join([
+        "SELECT",
+        f"    {main}.Field,",
+        f"    AVG(COS({dec}) * COS({ra})) AS x,",
+        f"    AVG(COS({dec}) * SIN({ra})) AS y,",
+        f"    AVG(SIN({dec})) AS z",
+        f"FROM {_main_table(release)} AS {main}",
+        f"GROUP BY {main}.Field",
+    ]) + "\n"
+
+
+def query_columns(query, upload=False):
+    """Names of the S-PLUS columns returned by a query built here (with ``upload``, the uploaded ones)."""
+    select = query.split("SELECT", 1)[1].split("\nFROM ", 1)[0]
+    names = []
+    for item in select.split(",\n"):
+        item = item.strip()
+        if item.startswith("tap.") != upload:
+            continue
+        names.append(item.rpartition(" AS ")[2] if " AS " in item else item.rpartition(".")[2])
+    return names
+
+
+def build_summary_query(release, radius, ra_col="GALEX_RA", dec_col="GALEX_DEC", key_col="row_id",
+                        aggregates=("count", "min_sep"), filters=(), bbox=False):
+    """Cone join returning one aggregated row per uploaded source with a match.
+
+    ``aggregates`` are ``count`` (``n_match``), ``min_sep`` (``min_sep_arcsec``,
+    the distance to the nearest match) and ``min:<column>``/``max:<column>``
+    (``min_<column>``, ...); rows are grouped on the uploaded ``key_col``.
+    Only matches passing ``filters`` are aggregated, and sources without one
+    are absent from the result.
+    """
+    release = release_name(release)
+    main = main_alias(release)
+    tables = {}
+    select = [f"tap.{key_col}"]
+    for aggregate in aggregates:
+        kind, _, column = aggregate.partition(":")
+        if kind == "count":
+            select.append("COUNT(*) AS n_match")
+        elif kind == "min_sep":
+            select.append(f"MIN(DISTANCE(POINT('ICRS', {main}.RA, {main}.DEC), "
+                          f"POINT('ICRS', tap.{ra_col}, tap.{dec_col}))) * 3600 AS min_sep_arcsec")
+        elif kind in ("min", "max") and column.isidentifier():
+            alias, table = column_table(release, column)
+            if table is not None:
+                tables.setdefault(alias, table)
+            select.append(f"{kind.upper()}({alias}.{column}) AS {kind}_{column}")
+        else:
+            raise ValueError(f"unknown aggregate {aggregate!r}; expected count, min_sep, min:<column> "
+                             f"or max:<column>")
+    conditions = _filter_conditions(release, filters, tables)
+
+    lines = ["SELECT", "    " + ",\n    ".join(select)]
+    lines.extend(_cone_join(_main_table(release), main, ra_col, dec_col, radius, "", bbox))
+    for alias, table in tables.items():
+        lines.append(f"LEFT OUTER JOIN {table} AS {alias} ON {alias}.id = {main}.id")
+    if conditions:
+        lines.append("WHERE " + "\n  AND ".join(conditions))
+    lines.append(f"GROUP BY tap.{key_col}")
+    return "\n".join(lines) + "\n"
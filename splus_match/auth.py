@@ -0,0 +1,61 @@
+"""S-PLUS credentials for unattended runs.
+
+Credentials are looked up, in order, in the ``SPLUS_USER``/``SPLUS_PASSWORD``
+environment variables, in the netrc file (``$NETRC`` or ``~/.netrc``) entry
+for ``splus.cloud``, and finally by prompting, but only when stdin is a
+terminal, so batch jobs fail fast instead of hanging on ``input()``.
+
+Example ``~/.netrc`` (``chmod 600``)::
+
+    machine splus.cloud login myuser password mypassword
+"""
+import netrc
+import os
+import sys
+from getpass import getpass
+
+NETRC_HOST = "splus.cloud"
+USER_VAR = "SPLUS_USER"
+PASSWORD_VAR = "SPLUS_PASSWORD"
+
+
+class CredentialsError(RuntimeError):
+    pass
+
+
+def _from_netrc(host):
+    path = os.environ.get("NETRC") or os.path.expanduser("~/.netrc")
+    if not os.path.exists(path):
+        return None
+    try:
+        entry = netrc.netrc(path).authenticators(host)
+    except (netrc.NetrcParseError, OSError) as e:
+        print(f"Ignoring unreadable netrc file {path}: {e}")
+        return None
+    if entry is None:
+        return None
+    login, _, password = entry
+    return login, password
+
+
+def get_credentials(host=NETRC_HOST, interactive=None):
+    """``(username, password)`` from the environment, netrc or a prompt."""
+    user, password = os.environ.get(USER_VAR), os.environ.get(PASSWORD_VAR)
+    if user and password:
+        return user, password
+    found = _from_netrc(host)
+    if found is not None:
+        return found
+    if interactive is None:
+        interactive = sys.stdin.isatty()
+    if not interactive:
+        raise CredentialsError(f"no S-PLUS credentials: set {USER_VAR}/{PASSWORD_VAR} "
+                               f"or add a '{host}' entry to ~/.netrc")
+    return input("S-PLUS Username: "), getpass("S-PLUS Password: ")
+
+
+def connect(host=NETRC_HOST, interactive=None):
+    """Log in to S-PLUS with :func:`get_credentials`; returns the ``splusdata`` connection."""
+    username, password = get_credentials(host, interactive)
+    import splusdata
+    return splusdata.connect(username, password)
@@ -0,0 +1,84 @@
+"""Local on-disk cache of downloaded S-PLUS field tables.
+
+Each field's query result is stored as a Parquet file named after a hash of the data release, the field name and the
+query template, so changing the local catalog or the match radius reuses the
+download while changing the selected columns does not. The cache is bounded
+in size and evicts the least recently used files first.
+"""
+import hashlib
+import os
+import re
+from pathlib import Path
+
+import pandas as pd
+
+SUFFIX = ".parquet"
+
+
+def query_fingerprint(template):
+    # Whitespace and SQL comments do not change the query
+    text = re.sub(r"--[^\n]*", "", template)
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+
+class FieldCache:
+    """Content-addressed cache of field tables under ``directory``; ``max_bytes`` bounds the total size."""
+
+    def __init__(self, directory, max_bytes=50 * 1024**3):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes_read": 0}
+
+    def key(self, release, field, template):
+        text = f"{release}\0{field}\0{query_fingerprint(template)}"
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, release, field, template):
+        key = self.key(release, field, template)
+        return self.directory / key[:2] / (key + SUFFIX)
+
+    def get(self, release, field, template):
+        """Cached table, or ``None`` on a miss."""
+        path = self.path(release, field, template)
+        if not path.exists():
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        self.stats["bytes_read"] += path.stat().st_size
+        # The modification time doubles as the last-used time for eviction
+        os.utime(path)
+        return pd.read_parquet(path)
+
+    def split(self, release, fields, template):
+        """``(cached, missing)`` lists of ``fields``; nothing is read, missing fields count as misses."""
+        cached, missing = [], []
+        for field in fields:
+            (cached if self.path(release, field, template).exists() else missing).append(field)
+        self.stats["misses"] += len(missing)
+        return cached, missing
+
+    def put(self, release, field, template, df):
+        path = self.path(release, field, template)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name("_tmp_" + path.name)
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        files = [(p.stat().st_mtime, p.stat().st_size, p)
+                 for p in self.directory.glob("*/*" + SUFFIX) if not p.name.startswith("_tmp_")]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.stats["evictions"] += 1
+
+    def summary(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        rate = self.stats["hits"] / lookups if lookups else 0.0
+        return (f"cache: {self.stats['hits']} hits, {self.stats['misses']} misses "
+                f"({rate:.0%} hit rate), {self.stats['evictions']} evictions")
@@ -0,0 +1,223 @@
+"""Adaptive chunking of ``TAP_UPLOAD`` cone joins.
+
+Instead of a hand-tuned fixed chunk size, the chunker grows the upload while
+queries come back quickly, halves and retries a chunk that the server rejects
+as too large or that times out, and caps the chunk size so that a query is
+expected to return about ``target_rows`` rows.
+"""
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+from .scheduler import is_retryable
+from .sphere import sky_index
+
+ChunkResult = namedtuple("ChunkResult", ["start", "stop", "result", "error", "elapsed"])
+
+# Substrings of error messages that mean the request or its result was too big
+TOO_LARGE_MESSAGES = (
+    "too large", "too big", "size limit", "limit exceeded", "exceeds", "maximum size",
+    "request entity", "413", "payload", "overflow", "timeout", "timed out",
+)
+
+
+def is_too_large(exc):
+    # Timeouts are treated like size rejections: a smaller chunk is the cure
+    if isinstance(exc, TimeoutError):
+        return True
+    message = str(exc).lower()
+    return any(text in message for text in TOO_LARGE_MESSAGES)
+
+
+def _retryable(exc):
+    # Size problems are handled by splitting, not by retrying the same chunk
+    return is_retryable(exc) and not is_too_large(exc)
+
+
+def sort_by_sky(df, ra_col, dec_col):
+    """Return ``df`` ordered along a space-filling curve over the sky.
+
+    Contiguous slices of the result cover compact sky regions, so each
+    upload chunk's cone join touches few server-side partitions. The sort is
+    stable, so the same input always gives the same order (and row spans).
+    """
+    order = np.argsort(sky_index(df[ra_col].to_numpy(), df[dec_col].to_numpy()), kind="stable")
+    return df.iloc[order]
+
+
+def bbox_predicate(chunk, ra_col, dec_col, radius_deg, alias, ra_name="RA", dec_name="DEC"):
+    """ADQL ``AND ...`` clause bounding the positions of ``chunk`` padded by ``radius_deg``.
+
+    Appended to the join condition it lets the server prune partitions before
+    evaluating ``CONTAINS``. The RA range is left out near the poles, and
+    chunks that straddle RA = 0 get a wrapped range.
+    """
+    ra = np.mod(chunk[ra_col].to_numpy(dtype=np.float64), 360.0)
+    dec = chunk[dec_col].to_numpy(dtype=np.float64)
+    ok = np.isfinite(ra) & np.isfinite(dec)
+    if not ok.any():
+        return ""
+    ra, dec = ra[ok], dec[ok]
+    dec_min, dec_max = dec.min() - radius_deg, dec.max() + radius_deg
+    clause = f" AND {alias}.{dec_name} BETWEEN {dec_min:.7f} AND {dec_max:.7f}"
+    if max(abs(dec_min), abs(dec_max)) >= 89.0:
+        return clause
+    pad = radius_deg / np.cos(np.radians(max(abs(dec_min), abs(dec_max))))
+
+    # The smallest RA interval holding every source ends at the largest gap
+    ra = np.sort(ra)
+    gaps = np.diff(np.concatenate([ra, [ra[0] + 360.0]]))
+    widest = int(np.argmax(gaps))
+    if gaps[widest] <= 2 * pad:
+        return clause
+    ra_lo = ra[(widest + 1) % len(ra)] - pad
+    ra_hi = ra[widest] + pad
+    if widest == len(ra) - 1 and ra_lo >= 0.0 and ra_hi < 360.0:
+        clause += f" AND {alias}.{ra_name} BETWEEN {ra_lo:.7f} AND {ra_hi:.7f}"
+    else:
+        # The interval crosses RA = 0
+        ra_lo, ra_hi = np.mod(ra_lo, 360.0), np.mod(ra_hi, 360.0)
+        clause += f" AND ({alias}.{ra_name} >= {ra_lo:.7f} OR {alias}.{ra_name} <= {ra_hi:.7f})"
+    return clause
+
+
+def remaining_spans(n_rows, done):
+    """Row spans ``[start, stop)`` of ``range(n_rows)`` not covered by the ``done`` spans."""
+    spans = []
+    position = 0
+    for start, stop in sorted(done):
+        if start > position:
+            spans.append((position, min(start, n_rows)))
+        position = max(position, stop)
+    if position < n_rows:
+        spans.append((position, n_rows))
+    return spans
+
+
+class AdaptiveChunker:
+    """Choose upload sizes on the fly from the server's response.
+
+    A chunk that finishes in under ``fast_seconds`` grows the next ones by
+    ``growth``; one slower than twice that shrinks them. Rows returned per
+    uploaded source are tracked as a moving average to keep each query near
+    ``target_rows`` result rows. A rejected chunk lowers the size limit and
+    is re-split into chunks of the new size, down to a single source; only
+    then is the chunk reported as failed.
+    """
+
+    def __init__(self, initial=100, min_size=1, max_size=50000, growth=2.0,
+                 fast_seconds=30.0, target_rows=200000, smoothing=0.3):
+        self.size = initial
+        self.min_size = min_size
+        self.max_size = max_size
+        self.growth = growth
+        self.fast_seconds = fast_seconds
+        self.target_rows = target_rows
+        self.smoothing = smoothing
+        self.rows_per_source = None
+        # Largest chunk the server has accepted
+        self.largest_ok = 0
+        self.stats = {"chunks": 0, "splits": 0, "failed": 0}
+
+    def next_size(self):
+        size = self.size
+        if self.rows_per_source:
+            size = min(size, int(self.target_rows / self.rows_per_source))
+        return max(self.min_size, min(self.max_size, int(size)))
+
+    def _record_success(self, n_sources, n_rows, elapsed):
+        rate = n_rows / max(n_sources, 1)
+        self.largest_ok = max(self.largest_ok, n_sources)
+        if self.rows_per_source is None:
+            self.rows_per_source = rate
+        else:
+            self.rows_per_source += self.smoothing * (rate - self.rows_per_source)
+        if elapsed < self.fast_seconds:
+            self.size = min(self.max_size, self.size * self.growth)
+        elif elapsed > 2 * self.fast_seconds:
+            self.size = max(self.min_size, self.size / self.growth)
+
+    def _record_too_large(self, n_sources):
+        # The server's limit lies between the largest accepted and the rejected
+        # size; never grow beyond the middle of that interval again
+        limit = (self.largest_ok + n_sources) // 2 if self.largest_ok < n_sources else n_sources - 1
+        self.max_size = max(self.min_size, min(self.max_size, limit))
+        self.size = max(self.min_size, min(self.size, n_sources // 2))
+
+    def run(self, scheduler, query, df, spans=None):
+        """Upload ``df`` in adaptive chunks and yield a :class:`ChunkResult` per chunk.
+
+        ``query`` is either an ADQL string or a function building the query
+        for a chunk (e.g. to add :func:`bbox_predicate`). ``spans`` restricts
+        the run to row ranges ``[start, stop)`` of ``df`` (all rows by
+        default). Up to ``scheduler.max_concurrency`` chunks are in flight;
+        results arrive in completion order. Chunks that still fail at the
+        minimum size are yielded with ``error`` set.
+        """
+        spans = deque(spans if spans is not None else [(0, len(df))])
+        retry = deque()
+        pending = {}
+
+        def next_span():
+            # Rejected spans go first; both are cut at the current size, so
+            # what is left of a rejected span shrinks as the limit is learned
+            for queue in (retry, spans):
+                while queue:
+                    start, stop = queue.popleft()
+                    if start >= stop:
+                        continue
+                    cut = min(stop, start + self.next_size())
+                    if cut < stop:
+                        queue.appendleft((cut, stop))
+                    return start, cut
+            return None
+
+        while True:
+            while len(pending) < scheduler.max_concurrency:
+                span = next_span()
+                if span is None:
+                    break
+                start, stop = span
+                chunk = df.iloc[start:stop]
+                adql = query(chunk) if callable(query) else query
+                future = scheduler.submit(span, adql, chunk, retryable=_retryable)
+                pending[future] = span
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, stop = pending.pop(future)
+                res = future.result()
+                n_sources = stop - start
+                if res.error is None:
+                    self.stats["chunks"] += 1
+                    n_rows = 0 if res.result is None else len(res.result)
+                    self._record_success(n_sources, n_rows, res.elapsed)
+                    yield ChunkResult(start, stop, res.result, None, res.elapsed)
+                elif is_too_large(res.error) and n_sources > self.min_size:
+                    self.stats["splits"] += 1
+                    # Every rejection lowers the limit and at least halves the size;
+                    # the span is re-split at the size current when it is resubmitted
+                    self._record_too_large(n_sources)
+                    print(f"Rows {start}-{stop} rejected ({res.error}); splitting into chunks of "
+                          f"{self.next_size()}")
+                    retry.appendleft((start, stop))
+                else:
+                    self.stats["failed"] += 1
+                    yield ChunkResult(start, stop, None, res.error, res.elapsed)
+
+
+def span_unit(start, stop):
+    # Manifest unit name for a row span; zero padding keeps names in row order
+    return f"rows-{start:010d}-{stop:010d}"
+
+
+def done_spans(run):
+    # Row spans recorded as done in a RunManifest
+    spans = []
+    for unit, record in run.units.items():
+        if record["status"] == "done" and unit.startswith("rows-"):
+            _, start, stop = unit.split("-")
+            spans.append((int(start), int(stop)))
+    return spans
@@ -0,0 +1,314 @@
+"""``splus-match``: crossmatch a local catalog with S-PLUS from the command line.
+
+Examples::
+
+    splus-match catalog.csv --out matches.parquet --strategy upload --release idr5 --radius 2 \\
+        --ra-col GALEX_RA --dec-col GALEX_DEC
+    splus-match catalog.parquet --out matches.parquet --strategy field --radius 5 \\
+        --ra-col RA --dec-col DEC --photometry PStotal psf --mode mutual
+    splus-match catalog.parquet --out matches.parquet --strategy field --ra-col RA --dec-col DEC \\
+        --dask tcp://scheduler:8786
+    splus-match catalog.csv --out matches.parquet --strategy lsdb --mirror splus-mirror \\
+        --ra-col RA --dec-col DEC
+    splus-match catalog.csv --out matches.parquet --ra-col RA --dec-col DEC \\
+        --incremental matches_store --id-col GALEX_ID
+    splus-match catalog.csv --out screen.parquet --ra-col RA --dec-col DEC \\
+        --where "r_PStotal<18" "SEX_FLAGS_DET=0" --summary count min_sep min:r_PStotal
+
+Only the input positions are read and sent to the server; the other input
+columns (``--keep-columns``) are joined back onto the output at the end.
+Input columns with the name of a selected S-PLUS column (``RA``, ``DEC``,
+``ID``, ...) are written as ``local_<name>``.
+Credentials come from ``SPLUS_USER``/``SPLUS_PASSWORD`` or ``~/.netrc`` (see
+:mod:`splus_match.auth`), so runs need no terminal. Each run ends with the
+strategy's throughput and a per-stage timing report; ``--telemetry`` also
+saves the individual events as JSON lines.
+"""
+import argparse
+import sys
+
+import pandas as pd
+
+from . import strategies
+from .adql import BANDS, PHOTOMETRY, build_query, column_table, parse_filter, query_columns, release_name
+from .auth import CredentialsError, connect
+from .distributed import run_field_dask
+from .features import ZeroPoints, add_features_in_place, feature_bands, parse_feature
+from .footprint import field_centres, select_fields
+from .incremental import INCREMENTAL_MODES, run_incremental
+from .inputs import SOURCE_ROW, avoid_clashes, load_catalog, rejoin_columns
+from .matcher import MODES
+from .telemetry import PROFILERS, Telemetry
+
+# Default match mode of each strategy (the lsdb crossmatch keeps the nearest
+# S-PLUS source per local source)
+DEFAULT_MODES = {"upload": "all", "field": "best_right"}
+
+
+def parse_photometry(items, bands):
+    """``["PStotal", "psf:r,g,i"]`` -> ``{"PStotal": bands, "psf": ("r", "g", "i")}``."""
+    photometry = {}
+    for item in items:
+        kind, _, kind_bands = item.partition(":")
+        if kind not in PHOTOMETRY:
+            raise argparse.ArgumentTypeError(f"unknown photometry type {kind!r}; expected one of "
+                                             f"{', '.join(PHOTOMETRY)}")
+        photometry[kind] = tuple(kind_bands.split(",")) if kind_bands else tuple(bands)
+    return photometry
+
+
+def filter_arg(text):
+    try:
+        return parse_filter(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def split_filters(release, filters):
+    """LSDB ``filters`` for the dual and the PSF catalog."""
+    dual, psf = [], []
+    for flt in filters:
+        alias, _ = column_table(release, flt[0])
+        (psf if alias.startswith("p") else dual).append(flt)
+    return dual or None, psf or None
+
+
+def feature_arg(text):
+    try:
+        parse_feature(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return text
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="splus-match", description="Crossmatch a local catalog with S-PLUS.")
+    parser.add_argument("input", help="local catalog (CSV, Parquet or FITS)")
+    parser.add_argument("--out", required=True, help="output file (.parquet, or .csv)")
+    parser.add_argument("--strategy", choices=strategies.STRATEGIES, default="upload",
+                        help="server-side upload joins, local matching of whole fields, or LSDB (default: upload)")
+    parser.add_argument("--release", default="idr5", help="data release (default: idr5)")
+    parser.add_argument("--radius", type=float, default=2.0, help="match radius in arcsec (default: 2)")
+    parser.add_argument("--ra-col", required=True, help="RA column of the local catalog (degrees)")
+    parser.add_argument("--dec-col", required=True, help="DEC column of the local catalog (degrees)")
+    parser.add_argument("--keep-columns", nargs="*", metavar="COLUMN",
+                        help="input columns joined back onto the output (default: all; none if empty)")
+    parser.add_argument("--mode", choices=MODES,
+                        help="how pairs are reduced (default: all for upload, best_right for field; "
+                             "ignored by lsdb)")
+
+    query = parser.add_argument_group("photometry")
+    query.add_argument("--bands", nargs="+", default=list(BANDS), help="bands (default: all 12)")
+    query.add_argument("--photometry", nargs="+", default=None, metavar="TYPE[:BANDS]",
+                       help="photometry types, optionally with their own bands, e.g. PStotal psf:r,g,i "
+                            "(default: PStotal for upload, PStotal psf for field)")
+    query.add_argument("--columns", nargs="+", help="band-independent columns (default: the release's set)")
+    query.add_argument("--no-errors", action="store_true", help="do not fetch the e_ error columns")
+    query.add_argument("--where", nargs="+", type=filter_arg, default=[], metavar="FILTER",
+                       help="cuts applied on the server (or by LSDB), e.g. r_PStotal<18 SEX_FLAGS_DET=0 "
+                            "CLASS_STAR_r>0.9")
+
+    tap = parser.add_argument_group("TAP queries (upload and field)")
+    tap.add_argument("--concurrency", type=int, default=4, help="queries in flight (default: 4)")
+    tap.add_argument("--rate", type=float, default=2.0, help="queries per second (default: 2)")
+    tap.add_argument("--retries", type=int, default=4)
+    tap.add_argument("--timeout", type=float, default=600, help="per-query timeout in s (default: 600)")
+    tap.add_argument("--run-dir", help="resumable run directory (default: <out>_run)")
+
+    features = parser.add_argument_group("photometric features")
+    features.add_argument("--features", nargs="+", type=feature_arg, metavar="EXPR",
+                          help="colours/indices added to the output with their errors, e.g. r-J0660 r-i "
+                               "halpha=(r-J0660)-0.25*(r-i)")
+    features.add_argument("--feature-photometry", default="PStotal", help="magnitudes used (default: PStotal)")
+    features.add_argument("--zero-points", metavar="CSV", help="per-field zero points added to the magnitudes, "
+                                                               "e.g. iDR5_fields_zps.csv")
+
+    incremental = parser.add_argument_group("incremental runs")
+    incremental.add_argument("--incremental", metavar="STORE_DIR",
+                             help="only match sources that are new or moved since the last run with this "
+                                  "store, and rebuild --out from the stored matches")
+    incremental.add_argument("--id-col", help="unique source ID column (required with --incremental)")
+
+    report = parser.add_argument_group("instrumentation")
+    report.add_argument("--telemetry", metavar="PATH", help="append per-stage events to this JSON-lines file")
+    report.add_argument("--profile", choices=PROFILERS, help="profile the local match stage (upload and field)")
+    report.add_argument("--profile-dir", help="where the profiles are written (default: <out>_profile)")
+
+    upload = parser.add_argument_group("upload strategy")
+    upload.add_argument("--inner", action="store_true", help="drop sources without a match (INNER JOIN)")
+    upload.add_argument("--chunk-size", type=int, default=100, help="initial upload size (default: 100)")
+    upload.add_argument("--target-rows", type=int, default=200000, help="result rows aimed for per query")
+    upload.add_argument("--no-bbox", action="store_true", help="no per-chunk RA/DEC box in the join")
+    upload.add_argument("--summary", nargs="+", metavar="AGGREGATE",
+                        help="return one row per source instead of the matches: count, min_sep, "
+                             "min:<column>, max:<column> (aggregated on the server)")
+
+    field = parser.add_argument_group("field strategy")
+    field.add_argument("--fields", help="field list CSV with Field/RA/DEC (default: the release's list)")
+    field.add_argument("--cache-dir", default="splus_field_cache")
+    field.add_argument("--cache-max-gb", type=float, default=50)
+    field.add_argument("--offline", action="store_true", help="only use cached fields; no login")
+    field.add_argument("--match-workers", type=int, default=None, help="matcher processes (default: all cores)")
+    field.add_argument("--fields-per-task", type=int, default=2)
+    field.add_argument("--write-workers", type=int, default=2)
+    field.add_argument("--dask", nargs="?", const="local", metavar="ADDRESS",
+                       help="run the fields as Dask tasks on the cluster at ADDRESS, or on a new local "
+                            "cluster; workers log in themselves and write to --run-dir")
+    field.add_argument("--dask-workers", type=int, default=None,
+                       help="workers of the local cluster (default: one per core)")
+
+    lsdb = parser.add_argument_group("lsdb strategy")
+    lsdb.add_argument("--mirror", help="local mirror made with python -m splus_match.mirror")
+    lsdb.add_argument("--prejoined", help="pre-joined catalog made with python -m splus_match.prejoin")
+    lsdb.add_argument("--dual-columns", nargs="+", default=["ID", "RA", "DEC", "Field", "FWHM", "KRON_RADIUS"])
+    lsdb.add_argument("--psf-columns", nargs="+", default=["ID", "RA", "DEC"])
+    lsdb.add_argument("--parallel-partitions", type=int, default=4, help="partitions computed at once")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.incremental and not args.id_col:
+        parser.error("--incremental needs the source ID column (--id-col)")
+    # Only the positions (and the ID of incremental runs) are read; the other
+    # input columns are joined back onto the output at the end
+    try:
+        local = load_catalog(args.input, args.ra_col, args.dec_col, id_col=args.id_col if args.incremental else None)
+    except KeyError as e:
+        parser.error(f"{e.args[0]}; use --ra-col/--dec-col/--id-col")
+    if args.incremental:
+        # Row numbers change as the input grows; incremental runs rejoin by ID
+        local = local.drop(columns=SOURCE_ROW)
+    print(f"{len(local)} sources read from {args.input}")
+
+    default_photometry = ["PStotal", "psf"] if args.strategy == "field" else ["PStotal"]
+    try:
+        photometry = parse_photometry(args.photometry or default_photometry, args.bands)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.summary and (args.strategy != "upload" or args.incremental):
+        parser.error("--summary is only available with the upload strategy, without --incremental")
+    if args.summary and args.features:
+        parser.error("--features needs the matched photometry; it cannot be combined with --summary")
+    if args.dask and (args.strategy != "field" or args.incremental or args.offline):
+        parser.error("--dask is only available with the field strategy, without --incremental or --offline")
+    mode = args.mode or DEFAULT_MODES.get(args.strategy)
+    if args.incremental and args.strategy != "lsdb":
+        # A source's matches must not depend on the other local sources
+        mode = args.mode or "best_left"
+        if mode not in INCREMENTAL_MODES:
+            parser.error(f"--mode {mode} cannot be used with --incremental; use one of {', '.join(INCREMENTAL_MODES)}")
+    query = dict(bands=args.bands, photometry=photometry, columns=args.columns, errors=not args.no_errors)
+
+    # Input columns named like a selected S-PLUS column (RA, DEC, ID, ...) are
+    # renamed, or the two would be confused in the matches
+    loaded = [c for c in local.columns if c != SOURCE_ROW]
+    reserved = []
+    if args.strategy != "lsdb" and not args.summary:
+        reserved = query_columns(build_query(args.release, **query, field="{field}"))
+    local, names = avoid_clashes(local, loaded, reserved)
+    ra_col, dec_col = names[args.ra_col], names[args.dec_col]
+    common = dict(release=args.release, radius_arcsec=args.radius, ra_col=ra_col, dec_col=dec_col)
+
+    # The zero points are checked against the bands and fields before anything is queried
+    zero_points = None
+    fields = pd.read_csv(args.fields) if args.fields else None
+    if args.zero_points:
+        if not args.features:
+            parser.error("--zero-points is only used with --features")
+        if reserved and "Field" not in reserved:
+            parser.error("--zero-points needs the S-PLUS Field column; add Field to --columns")
+        try:
+            zero_points = ZeroPoints(args.zero_points)
+            if args.strategy == "field":
+                # The fields the field strategy will query, when the table has their centres
+                if fields is None:
+                    fields = pd.read_csv(strategies.FIELD_TABLES[release_name(args.release)])
+                selected = fields
+                if field_centres(fields) is not None:
+                    selected, _ = select_fields(fields, local[ra_col].values, local[dec_col].values,
+                                                match_radius_arcsec=args.radius)
+                zero_points.check(feature_bands(args.features), selected["Field"])
+            else:
+                zero_points.check(feature_bands(args.features))
+        except (OSError, KeyError, ValueError) as e:
+            parser.error(f"--zero-points: {e}")
+
+    scheduling = dict(max_concurrency=args.concurrency, rate=args.rate, retries=args.retries,
+                      timeout=args.timeout, run_dir=args.run_dir)
+    profiling = dict(profile=args.profile, profile_dir=args.profile_dir)
+
+    # Log in unless everything is local
+    conn = None
+    if args.strategy == "field":
+        # Dask workers log in on their own
+        needs_login = not (args.offline or args.dask)
+    elif args.strategy == "lsdb":
+        needs_login = not (args.mirror or args.prejoined)
+    else:
+        needs_login = True
+    if needs_login:
+        try:
+            conn = connect()
+        except CredentialsError as e:
+            print(e)
+            return 1
+        except Exception as e:
+            print(f"Error connecting to S-PLUS: {e}")
+            return 1
+
+    telemetry = Telemetry(args.telemetry, strategy=args.strategy, release=args.release, radius=args.radius,
+                          mode=mode, sources=len(local))
+    if args.strategy == "upload":
+        options = dict(conn=conn, **query, **scheduling, **profiling, mode=mode,
+                       join="" if args.inner else "LEFT OUTER", initial_chunk=args.chunk_size,
+                       target_rows=args.target_rows, bbox=not args.no_bbox, filters=args.where,
+                       aggregates=args.summary, extra_columns=[] if args.incremental else [SOURCE_ROW])
+    elif args.strategy == "field":
+        options = dict(conn=conn, **query, **scheduling, **profiling, mode=mode,
+                       fields=fields, cache_dir=args.cache_dir, cache_max_gb=args.cache_max_gb,
+                       offline=args.offline, match_workers=args.match_workers,
+                       fields_per_task=args.fields_per_task, write_workers=args.write_workers,
+                       filters=args.where)
+    else:
+        dual_filters, psf_filters = split_filters(args.release, args.where)
+        options = dict(headers=conn.headers if conn else None, dual_columns=args.dual_columns,
+                       dual_filters=dual_filters, psf_filters=psf_filters,
+                       psf_columns=args.psf_columns, mirror_dir=args.mirror, prejoined_dir=args.prejoined,
+                       parallel=args.parallel_partitions)
+
+    if args.incremental:
+        stats = run_incremental(local, args.out, args.strategy, args.incremental, id_col=names[args.id_col],
+                                **common, telemetry=telemetry, **options)
+        print(f"{stats['matched']} sources matched, {stats['reused']} reused, {stats['removed']} removed")
+    elif args.dask:
+        stats = run_field_dask(local, args.out, client=args.dask, n_workers=args.dask_workers, **common, **query,
+                               mode=mode, fields=options["fields"], fields_per_task=args.fields_per_task,
+                               run_dir=args.run_dir, rate=args.rate, retries=args.retries, timeout=args.timeout,
+                               telemetry=telemetry, filters=args.where, cache_dir=args.cache_dir)
+    else:
+        run = getattr(strategies, f"run_{args.strategy}")
+        stats = run(local, out=args.out, **common, telemetry=telemetry, **options)
+
+    if args.keep_columns != [] and stats["rows"]:
+        with telemetry.stage("rejoin", rows=stats["rows"]):
+            added = rejoin_columns(stats["output"], args.input, args.keep_columns,
+                                   key=args.id_col if args.incremental else None, names=names)
+        if added:
+            print(f"Joined {len(added)} input columns back onto {stats['output']}")
+
+    if args.features and stats["rows"]:
+        with telemetry.stage("features", rows=stats["rows"]):
+            add_features_in_place(stats["output"], args.features, args.feature_photometry, zero_points)
+        print(f"Added {', '.join(args.features)} ({args.feature_photometry}) to {stats['output']}")
+
+    print(strategies.throughput_summary(stats))
+    print(telemetry.report())
+    telemetry.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
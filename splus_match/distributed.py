@@ -0,0 +1,239 @@
+"""The field strategy as Dask tasks on a ``dask.distributed`` cluster.
+
+:func:`run_field_dask` runs the per-field fetch and match of
+:func:`splus_match.strategies.run_field` on the workers of a Dask cluster,
+from a ``LocalCluster`` on one machine to many nodes:
+
+* the local catalog is scattered to every worker once (``broadcast=True``),
+  and each worker builds its search tree over it once;
+* every task queries a batch of fields, matches them and writes one shard
+  per field into the run directory, so only row counts and timings travel
+  back to the client, which records them in the run manifest and replays
+  the workers' stage events into its :class:`splus_match.telemetry.Telemetry`;
+* tasks are named ``splus-field-<field>``, so the dashboard's task stream
+  and progress bars show the fields as they are processed.
+
+Workers log in themselves with ``connect`` (by default
+:func:`splus_match.auth.connect`, from ``SPLUS_USER``/``SPLUS_PASSWORD`` or
+``~/.netrc`` on each worker) and share the ``rate`` limit evenly. On a
+multi-node cluster the run directory must be on a filesystem all workers
+and the client can reach. Field tables are not cached.
+
+Dask is only needed here (``pip install "dask[distributed]"``)::
+
+    splus-match catalog.parquet --out matches.parquet --strategy field --ra-col RA --dec-col DEC \\
+        --dask tcp://scheduler:8786
+"""
+import functools
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+import pandas as pd
+
+from .adql import BANDS, build_query, release_name
+from .auth import connect as splus_connect
+from .footprint import add_field_centres, select_fields
+from .manifest import RunManifest, write_shard
+from .matcher import LocalMatcher
+from .results import compact
+from .scheduler import QueryScheduler, TokenBucket
+from .strategies import (FIELD_TABLES, _stats, check_clashes, default_run_dir, field_centres_path,
+                         field_fingerprint, matched_rows)
+from .telemetry import Telemetry
+
+# Task name prefix shown in the dashboard
+TASK_PREFIX = "splus-field"
+
+
+def get_client(address=None, n_workers=None, threads_per_worker=1):
+    """``(client, cluster)`` connected to ``address``, or to a new ``LocalCluster`` (``cluster`` is then not None)."""
+    from dask.distributed import Client, LocalCluster
+    if address and address != "local":
+        return Client(address), None
+    cluster = LocalCluster(n_workers=n_workers, threads_per_worker=threads_per_worker)
+    return Client(cluster), cluster
+
+
+class _TaskEvents:
+    """Stand-in for a Telemetry on the workers; the client replays the events into its own."""
+
+    def __init__(self):
+        self.events = []
+        self.counters = defaultdict(int)
+
+    def event(self, stage, seconds=None, **fields):
+        self.events.append((stage, seconds, fields))
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    @contextmanager
+    def stage(self, name, **fields):
+        t0 = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.event(name, time.perf_counter() - t0, **fields)
+
+
+# Per-worker-process state, shared by the task threads of a worker
+_lock = threading.Lock()
+_connections = {}
+_buckets = {}
+_matchers = {}
+
+
+def _worker_state(connect, rate):
+    # One connection and one rate limiter per worker and connect function
+    from dask.base import tokenize
+    key = tokenize(connect)
+    with _lock:
+        if key not in _connections:
+            _connections[key] = connect()
+            _buckets[key] = TokenBucket(rate) if rate else None
+        return _connections[key], _buckets[key]
+
+
+def _local_matcher(local, ra_col, dec_col, events):
+    # The scattered catalog is the same object for every task on a worker, so
+    # its tree is built once; the catalog is kept to make the identity check safe
+    with _lock:
+        cached = _matchers.get(id(local))
+        if cached is not None and cached[0] is local:
+            return cached[1]
+        t0 = time.perf_counter()
+        matcher = LocalMatcher(local[ra_col].values, local[dec_col].values)
+        events.event("coords", time.perf_counter() - t0, sources=len(local))
+        _matchers.clear()
+        _matchers[id(local)] = (local, matcher)
+        return matcher
+
+
+def _match_fields(fields, local, query_template, shard_dir, radius_arcsec, ra_col, dec_col, connect, rate,
+                  query_retries, query_timeout):
+    """Dask task: query, match and write ``fields``; returns per-field results and the stage events."""
+    events = _TaskEvents()
+    conn, bucket = _worker_state(connect, rate)
+    matcher = _local_matcher(local, ra_col, dec_col, events)
+    scheduler = QueryScheduler(conn, max_concurrency=1, retries=query_retries, timeout=query_timeout,
+                               telemetry=events)
+    # Every task of the worker draws from the worker's rate limit
+    scheduler.bucket = bucket
+    results = []
+    try:
+        for field in fields:
+            try:
+                result, _ = scheduler.query(query_template.format(field=field), key=field)
+                with events.stage("decode", key=field):
+                    splus_data = compact(result).to_pandas()
+                t0 = time.perf_counter()
+                # Every pair is kept; the client applies the mode over all fields
+                splus_idx, local_idx, sep, rank = matcher.match(splus_data["RA"].values, splus_data["DEC"].values,
+                                                                radius_arcsec, "all")
+                events.event("match", time.perf_counter() - t0, key=field, sources=len(splus_data),
+                              pairs=len(splus_idx))
+                with events.stage("write", key=field, rows=len(splus_idx)):
+                    shard = write_shard(shard_dir, field, matched_rows(local, splus_data, splus_idx, local_idx,
+                                                                       sep, rank))
+                results.append({"field": field, "rows": len(splus_idx), "shard": shard and shard.name})
+            except Exception as e:
+                results.append({"field": field, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        scheduler.close()
+    return results, events.events, dict(events.counters)
+
+
+def run_field_dask(local, out, client=None, n_workers=None, connect=None, release="idr5", radius_arcsec=2.0,
+                   ra_col="RA", dec_col="DEC", bands=BANDS, photometry=("PStotal", "psf"), columns=None,
+                   errors=True, mode="best_right", fields=None, fields_per_task=1, run_dir=None, rate=2.0,
+                   retries=4, timeout=600, telemetry=None, filters=(), cache_dir="splus_field_cache"):
+    """Download and match the S-PLUS fields overlapping the catalog on a Dask cluster.
+
+    ``client`` is a ``dask.distributed.Client`` or a scheduler address; by
+    default a ``LocalCluster`` of ``n_workers`` single-threaded workers (one
+    per core by default) is started for the run. ``connect`` is a
+    picklable function returning a connection on a worker
+    (:func:`splus_match.auth.connect` without prompting by default). The
+    other options are those of :func:`splus_match.strategies.run_field`;
+    ``cache_dir`` only keeps the field centres derived for field lists
+    without them.
+    """
+    t0 = time.perf_counter()
+    telemetry = telemetry or Telemetry()
+    release = release_name(release)
+    connect = connect or functools.partial(splus_connect, interactive=False)
+    with telemetry.stage("query_build"):
+        query_template = build_query(release, bands=bands, photometry=photometry, columns=columns,
+                                     errors=errors, field="{field}", filters=filters)
+    check_clashes(local.columns, query_template)
+
+    if fields is None:
+        fields = pd.read_csv(FIELD_TABLES[release])
+    fields = add_field_centres(fields, connect, release, field_centres_path(cache_dir, release))
+    n_fields = len(fields)
+    fields, n_skipped = select_fields(fields, local[ra_col].values, local[dec_col].values,
+                                      match_radius_arcsec=radius_arcsec)
+    telemetry.count("fields_skipped", n_skipped)
+    print(f"Querying {len(fields)} of {n_fields} fields ({n_skipped} fields without input sources skipped)")
+
+    run = RunManifest(run_dir or default_run_dir(out), fingerprint=field_fingerprint(local, query_template,
+                                                                                   radius_arcsec, mode))
+    run.add(fields["Field"])
+    todo = run.todo(fields["Field"])
+    print(f"{len(fields) - len(todo)} fields already done, {len(todo)} to query")
+
+    cluster = None
+    if client is None or isinstance(client, str):
+        client, cluster = get_client(client, n_workers)
+    try:
+        from dask.distributed import as_completed
+        n_workers = max(len(client.scheduler_info()["workers"]), 1)
+        print(f"Dask cluster with {n_workers} workers; dashboard at {client.dashboard_link}")
+        local_future = client.scatter(local, broadcast=True)
+        batches = [todo[i:i + fields_per_task] for i in range(0, len(todo), fields_per_task)]
+        run_id = uuid.uuid4().hex[:8]
+        futures = client.map(
+            _match_fields, batches, key=[f"{TASK_PREFIX}-{batch[0]}-{run_id}" for batch in batches],
+            local=local_future, query_template=query_template, shard_dir=str(run.shard_dir.resolve()),
+            radius_arcsec=radius_arcsec, ra_col=ra_col, dec_col=dec_col, connect=connect,
+            rate=rate / n_workers if rate else None, query_retries=retries, query_timeout=timeout)
+        batch_of = dict(zip(futures, batches))
+        for future in as_completed(futures):
+            try:
+                results, events, counters = future.result()
+            except Exception as e:
+                # The task itself failed (e.g. its worker died too often)
+                for field in batch_of[future]:
+                    print(f"Error matching field {field}: {e}")
+                    run.mark_failed(field, e)
+                continue
+            finally:
+                future.release()
+            for stage, seconds, event_fields in events:
+                telemetry.event(stage, seconds, **event_fields)
+            for name, n in counters.items():
+                telemetry.count(name, n)
+            for result in results:
+                field = result["field"]
+                if "error" in result:
+                    print(f"Error matching field {field}: {result['error']}")
+                    run.mark_failed(field, result["error"])
+                    continue
+                shard = result["shard"] and str((run.shard_dir / result["shard"]).relative_to(run.run_dir))
+                run.mark_done(field, shard, result["rows"])
+                print(f"Found {result['rows']} matches for field {field}")
+        del local_future
+    finally:
+        if cluster is not None:
+            client.close()
+            cluster.close()
+
+    failed = run.counts()["failed"]
+    if failed:
+        print(f"{failed} fields failed; rerun to retry them")
+    writer = run.merge(out, units=fields["Field"], mode=mode, left=(ra_col, dec_col))
+    return _stats("field", local, writer.rows, writer.path, t0, telemetry, queries=len(todo), failed=failed,
+                  executor="dask")
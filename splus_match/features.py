@@ -0,0 +1,264 @@
+"""Photometric features of the matched output: colours, indices and their errors.
+
+A feature is a linear combination of band magnitudes of one photometry type,
+written as an expression such as ``r-J0660``, ``r-i`` or
+``halpha=(r-J0660)-0.25*(r-i)`` (``name=`` sets the output column). Its
+value and error, ``sqrt(sum(coef**2 * e_band**2))`` for independent
+magnitude errors, are computed with NumPy on whole columns.
+
+Per-field zero points from the release's zero-point table (the field list the
+field strategy already loads) can be added to the magnitudes first. S-PLUS
+marks non-detections with magnitude 99; those become NaN.
+
+:func:`add_features` works on a pandas or Arrow chunk and
+:func:`compute_features` streams a matched output file through it one row
+group (or CSV chunk) at a time, so the full matched table never has to fit
+in memory::
+
+    python -m splus_match.features matches.parquet --out features.parquet \\
+        --features r-J0660 r-i --zero-points iDR5_fields_zps.csv
+"""
+import argparse
+import ast
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .writer import StreamingWriter
+
+DEFAULT_FEATURES = ("r-J0660", "r-i", "g-r")
+
+# Magnitudes at or above this are S-PLUS non-detection sentinels (99)
+MISSING_MAG = 90.0
+
+# Column names used for the zero point of a band in the zero-point tables
+ZP_COLUMNS = ("ZP_{b}", "{b}_ZP", "zp_{b}", "{b}_zp", "ZP_{b}_PStotal")
+ZP_ERROR_COLUMNS = ("eZP_{b}", "e_ZP_{b}", "ZP_{b}_err", "{b}_zp_err", "e_zp_{b}")
+
+
+def _linear(node):
+    # {band: coefficient, None: constant} of an expression tree
+    if isinstance(node, ast.Expression):
+        return _linear(node.body)
+    if isinstance(node, ast.Name):
+        return {node.id: 1.0}
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return {None: float(node.value)}
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        sign = -1.0 if isinstance(node.op, ast.USub) else 1.0
+        return {k: sign * v for k, v in _linear(node.operand).items()}
+    if isinstance(node, ast.BinOp):
+        left, right = _linear(node.left), _linear(node.right)
+        if isinstance(node.op, (ast.Add, ast.Sub)):
+            sign = 1.0 if isinstance(node.op, ast.Add) else -1.0
+            terms = dict(left)
+            for k, v in right.items():
+                terms[k] = terms.get(k, 0.0) + sign * v
+            return terms
+        # Products and quotients are linear only with a constant factor
+        if isinstance(node.op, ast.Mult) and set(left) == {None}:
+            return {k: left[None] * v for k, v in right.items()}
+        if isinstance(node.op, (ast.Mult, ast.Div)) and set(right) == {None}:
+            factor = right[None] if isinstance(node.op, ast.Mult) else 1.0 / right[None]
+            return {k: factor * v for k, v in left.items()}
+    raise ValueError("features must be linear combinations of bands, e.g. (r-J0660)-0.25*(r-i)")
+
+
+def parse_feature(text):
+    """``"halpha=r-J0660"`` -> ``("halpha", {"r": 1.0, "J0660": -1.0}, 0.0)``."""
+    name, sep, expression = text.partition("=")
+    if not sep:
+        name, expression = None, text
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError:
+        raise ValueError(f"invalid feature {text!r}") from None
+    terms = _linear(tree)
+    constant = terms.pop(None, 0.0)
+    terms = {band: coef for band, coef in terms.items() if coef != 0.0}
+    return (name.strip() if name else expression.replace(" ", "")), terms, constant
+
+
+def feature_bands(features):
+    """The bands used by ``features`` (expressions or :func:`parse_feature` tuples)."""
+    features = [parse_feature(f) if isinstance(f, str) else f for f in features]
+    return sorted({band for _, terms, _ in features for band in terms})
+
+
+def _find_column(names, name):
+    # LSDB suffixes the columns of each side of a crossmatch
+    if name in names:
+        return name
+    for candidate in names:
+        if candidate.startswith(name + "_"):
+            return candidate
+    return None
+
+
+def _values(table, name):
+    column = table[name]
+    if isinstance(column, (pa.Array, pa.ChunkedArray)):
+        column = column.to_pandas()
+    # A copy: the non-detections are masked in place
+    return pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+
+
+class ZeroPoints:
+    """Per-field, per-band zero points read from a zero-point table."""
+
+    def __init__(self, table, field_col="Field"):
+        if not isinstance(table, pd.DataFrame):
+            table = pd.read_csv(table)
+        self.index = pd.Index(table[field_col].astype(str))
+        self.zp = {}
+        self.errors = {}
+        for pattern in ZP_COLUMNS:
+            for band in _bands_in(table.columns, pattern):
+                self.zp.setdefault(band, table[pattern.format(b=band)].to_numpy(dtype=np.float64))
+        for pattern in ZP_ERROR_COLUMNS:
+            for band in _bands_in(table.columns, pattern):
+                self.errors.setdefault(band, table[pattern.format(b=band)].to_numpy(dtype=np.float64))
+        if not self.zp:
+            raise ValueError("no zero-point columns found (expected e.g. ZP_r or r_ZP)")
+
+    def check(self, bands, fields=()):
+        """Raise ``ValueError`` if any of ``bands`` or ``fields`` is missing from the table."""
+        missing_bands = sorted(set(bands) - set(self.zp))
+        if missing_bands:
+            raise ValueError(f"no zero points for band(s) {', '.join(missing_bands)} in the zero-point table")
+        missing_fields = sorted(set(map(str, fields)) - set(self.index))
+        if missing_fields:
+            shown = ", ".join(missing_fields[:5]) + (", ..." if len(missing_fields) > 5 else "")
+            raise ValueError(f"{len(missing_fields)} fields have no zero points in the zero-point table: {shown}")
+
+    def lookup(self, fields, band):
+        """Zero points and their errors for each row's field; rows of unknown fields get NaN."""
+        if band not in self.zp:
+            raise KeyError(f"no zero point for band {band} in the zero-point table")
+        rows = self.index.get_indexer(np.asarray(fields, dtype=str))
+        known = rows >= 0
+        zp = np.full(len(rows), np.nan)
+        zp[known] = self.zp[band][rows[known]]
+        err = np.zeros(len(rows))
+        if band in self.errors:
+            err[known] = self.errors[band][rows[known]]
+        return zp, err
+
+
+def _bands_in(columns, pattern):
+    prefix, _, suffix = pattern.partition("{b}")
+    return [c[len(prefix):len(c) - len(suffix)] for c in columns
+            if c.startswith(prefix) and c.endswith(suffix) and len(c) > len(prefix) + len(suffix)]
+
+
+def add_features(table, features=DEFAULT_FEATURES, photometry="PStotal", zero_points=None, field_col="Field"):
+    """Return ``table`` (pandas or Arrow) with a value and an ``e_`` error column per feature.
+
+    Columns are named ``<feature>_<photometry>`` and ``e_<feature>_<photometry>``
+    (float32). ``features`` are expressions or the tuples of
+    :func:`parse_feature`; ``zero_points`` is a :class:`ZeroPoints`.
+    """
+    features = [parse_feature(f) if isinstance(f, str) else f for f in features]
+    names = list(table.column_names if isinstance(table, pa.Table) else table.columns)
+    fields = None
+    if zero_points is not None:
+        column = _find_column(names, field_col)
+        if column is None:
+            raise KeyError(f"field column {field_col!r} needed for the zero points not found")
+        fields = np.asarray(_strings(table[column]))
+
+    mags, errs = {}, {}
+    for band in feature_bands(features):
+        mag_col = _find_column(names, f"{band}_{photometry}")
+        if mag_col is None:
+            raise KeyError(f"column {band}_{photometry} not found")
+        mag = _values(table, mag_col)
+        mag[mag >= MISSING_MAG] = np.nan
+        err_col = _find_column(names, f"e_{band}_{photometry}")
+        err = _values(table, err_col) if err_col is not None else np.zeros(len(mag))
+        err[~np.isfinite(mag)] = np.nan
+        if zero_points is not None:
+            zp, zp_err = zero_points.lookup(fields, band)
+            mag = mag + zp
+            err = np.hypot(err, zp_err)
+        mags[band], errs[band] = mag, err
+
+    columns = {}
+    for name, terms, constant in features:
+        value = np.full(len(table), constant)
+        variance = np.zeros(len(table))
+        for band, coef in terms.items():
+            value += coef * mags[band]
+            variance += coef ** 2 * errs[band] ** 2
+        columns[f"{name}_{photometry}"] = value.astype(np.float32)
+        columns[f"e_{name}_{photometry}"] = np.sqrt(variance).astype(np.float32)
+
+    if isinstance(table, pa.Table):
+        for name, values in columns.items():
+            table = table.append_column(name, pa.array(values))
+        return table
+    return table.assign(**columns)
+
+
+def _strings(column):
+    if isinstance(column, (pa.Array, pa.ChunkedArray)):
+        return column.cast(pa.string()).to_pandas().fillna("").to_numpy()
+    return pd.Series(column).astype(str).to_numpy()
+
+
+def compute_features(path, out, features=DEFAULT_FEATURES, photometry="PStotal", zero_points=None,
+                     field_col="Field", chunk_rows=500000):
+    """Stream the matched output ``path`` through :func:`add_features` into ``out``.
+
+    Returns the closed :class:`splus_match.writer.StreamingWriter`.
+    """
+    features = [parse_feature(f) if isinstance(f, str) else f for f in features]
+    writer = StreamingWriter(out)
+    try:
+        if str(path).endswith(".parquet"):
+            parquet = pq.ParquetFile(path)
+            for batch in parquet.iter_batches(batch_size=chunk_rows):
+                writer.write(add_features(pa.Table.from_batches([batch]), features, photometry,
+                                          zero_points, field_col))
+        else:
+            for chunk in pd.read_csv(path, chunksize=chunk_rows):
+                writer.write(add_features(chunk, features, photometry, zero_points, field_col))
+    finally:
+        writer.close()
+    return writer
+
+
+def add_features_in_place(path, features=DEFAULT_FEATURES, photometry="PStotal", zero_points=None,
+                          field_col="Field"):
+    """Rewrite the output file ``path`` with the feature columns added."""
+    path = str(path)
+    root, suffix = os.path.splitext(path)
+    writer = compute_features(path, root + ".features_tmp" + suffix, features, photometry, zero_points,
+                              field_col)
+    os.replace(writer.path, path)
+    return writer.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add colours and indices with errors to a matched output file.")
+    parser.add_argument("input", help="matched output (Parquet or CSV)")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--features", nargs="+", default=list(DEFAULT_FEATURES), metavar="EXPR",
+                        help="e.g. r-J0660 r-i halpha=(r-J0660)-0.25*(r-i) (default: %(default)s)")
+    parser.add_argument("--photometry", default="PStotal", help="magnitude type, e.g. PStotal or psf")
+    parser.add_argument("--zero-points", help="zero-point table (e.g. iDR5_fields_zps.csv) added per field")
+    parser.add_argument("--field-col", default="Field")
+    args = parser.parse_args(argv)
+
+    zero_points = ZeroPoints(args.zero_points) if args.zero_points else None
+    writer = compute_features(args.input, args.out, args.features, args.photometry, zero_points, args.field_col)
+    print(f"{writer.rows} rows with {len(args.features)} features saved to {writer.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Prune the S-PLUS field list down to the fields that can contain input sources."""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from .adql import build_centre_query
+from .sphere import arcsec_to_chord, radec_to_xyz
+
+# S-PLUS tiles are 1.4 x 1.4 deg; a field is covered by the circle through its corners
+TILE_SIZE_DEG = 1.4
+TILE_RADIUS_DEG = TILE_SIZE_DEG / np.sqrt(2.0)
+
+# Column names used for the field centres in the different zero-point tables
+RA_COLUMNS = ("RA", "RA_d", "ra", "RA_deg", "RAJ2000")
+DEC_COLUMNS = ("DEC", "DEC_d", "dec", "Dec", "DEC_deg", "DEJ2000")
+
+
+def _find_column(table, candidates):
+    for name in candidates:
+        if name in table.columns:
+            return name
+    return None
+
+
+def field_centres(fields):
+    # Return the RA/DEC (deg) of every field, or None if the table has no coordinates
+    ra_col = _find_column(fields, RA_COLUMNS)
+    dec_col = _find_column(fields, DEC_COLUMNS)
+    if ra_col is None or dec_col is None:
+        return None
+    return fields[ra_col].to_numpy(dtype=np.float64), fields[dec_col].to_numpy(dtype=np.float64)
+
+
+def count_sources_per_field(field_ra, field_dec, ra, dec, match_radius_arcsec=0.0):
+    """Number of input sources falling inside each field footprint.
+
+    The footprint is the circle circumscribing the tile, padded by the match
+    radius, so sources near a tile edge are never lost.
+    """
+    valid = np.isfinite(ra) & np.isfinite(dec)
+    tree = cKDTree(radec_to_xyz(ra[valid], dec[valid]))
+    radius = arcsec_to_chord(TILE_RADIUS_DEG * 3600.0 + match_radius_arcsec)
+    return tree.query_ball_point(radec_to_xyz(field_ra, field_dec), r=radius, return_length=True)
+
+
+def query_field_centres(conn, release):
+    """Field centres (``Field``, ``RA``, ``DEC``) from the mean position of each field's detections."""
+    table = conn.query(build_centre_query(release)).to_pandas()
+    x, y, z = (table[c].to_numpy(dtype=np.float64) for c in ("x", "y", "z"))
+    return pd.DataFrame({
+        "Field": table["Field"].astype(str).str.strip().to_numpy(),
+        "RA": np.degrees(np.arctan2(y, x)) % 360.0,
+        "DEC": np.degrees(np.arctan2(z, np.hypot(x, y))),
+    })
+
+
+def add_field_centres(fields, connect=None, release="idr5", cache_path=None):
+    """Return ``fields`` with RA/DEC centres if it has none.
+
+    The centres are read from ``cache_path`` or, the first time, derived
+    with one aggregate query on the connection returned by ``connect()`` and
+    saved there. Without either the table is returned unchanged.
+    """
+    if field_centres(fields) is not None:
+        return fields
+    if cache_path is not None and os.path.exists(cache_path):
+        centres = pd.read_csv(cache_path)
+    elif connect is not None:
+        print("Field table has no RA/DEC columns; deriving the field centres from the server")
+        centres = query_field_centres(connect(), release)
+        if cache_path is not None:
+            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+            centres.to_csv(cache_path, index=False)
+            print(f"Field centres saved to {cache_path}")
+    else:
+        return fields
+    names = fields["Field"].astype(str).str.strip()
+    centres = centres.set_index("Field")
+    return fields.assign(RA=names.map(centres["RA"]).to_numpy(), DEC=names.map(centres["DEC"]).to_numpy())
+
+
+def select_fields(fields, ra, dec, match_radius_arcsec=0.0):
+    """Keep only the rows of ``fields`` whose footprint overlaps at least one source.
+
+    Returns the pruned table and the number of fields skipped. Fields without
+    centre coordinates are always kept (see :func:`add_field_centres`).
+    """
+    centres = field_centres(fields)
+    if centres is None:
+        print(f"Warning: the field table has no RA/DEC columns, so footprint pruning is off and all "
+              f"{len(fields)} fields will be queried")
+        return fields, 0
+    known = np.isfinite(centres[0]) & np.isfinite(centres[1])
+    if not known.all():
+        print(f"Warning: {int((~known).sum())} fields have no centre and will be queried")
+    counts = np.zeros(len(fields), dtype=np.int64)
+    counts[known] = count_sources_per_field(centres[0][known], centres[1][known], np.asarray(ra),
+                                            np.asarray(dec), match_radius_arcsec)
+    keep = (counts > 0) | ~known
+    return fields[keep].reset_index(drop=True), int((~keep).sum())
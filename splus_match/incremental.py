@@ -0,0 +1,322 @@
+"""Incremental crossmatch: only new or moved sources are matched again.
+
+A SQLite store (``<store_dir>/store.sqlite``) remembers, for every
+(source ID, data release, radius, settings), a hash of the source's ID and
+coordinates and the batch whose output shard holds its matches. The
+settings are a hash of the strategy, match mode and S-PLUS selection (see
+:func:`store_settings`), so every batch of a key has the same columns. A run
+
+1. hashes the input rows and compares them with the store: sources that are
+   new or whose coordinates changed are matched, sources that disappeared
+   are dropped and the rest are reused as they are;
+2. runs a strategy on the changed sources only, writing a new batch shard;
+3. records the batch and repoints its sources at it in one transaction;
+4. rebuilds the output from the shards, taking from each shard only the rows
+   of the sources that still point at it.
+
+Keys include the release, radius and settings, so iDR4 and iDR5 (or
+different radii or bands) live side by side and switching between them does
+not start from scratch. An interrupted or partly failed batch is not
+recorded; rerunning with the same input resumes it from its run directory.
+
+Only the ``all`` and ``best_left`` match modes can be updated this way: with
+``best_right`` and ``mutual`` an S-PLUS source's pairing depends on every
+local source, so adding one can change the matches of the others.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from . import strategies
+from .adql import build_query, release_name
+from .writer import StreamingWriter
+
+INCREMENTAL_MODES = ("all", "best_left")
+
+# Coordinates are hashed at this precision (degrees, ~0.4 mas), so rewriting
+# the input with different float formatting does not count as a move
+COORD_DECIMALS = 7
+
+# Strategy options that change the matched rows or their columns
+SETTINGS_OPTIONS = ("bands", "photometry", "columns", "errors", "filters", "mode", "join", "dual_columns",
+                    "dual_filters", "psf_columns", "psf_filters", "prejoined_columns")
+
+# Options of the S-PLUS query, for checking the ID column against it
+QUERY_OPTIONS = ("bands", "photometry", "columns", "errors", "filters")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch INTEGER PRIMARY KEY AUTOINCREMENT,
+    release TEXT NOT NULL,
+    radius REAL NOT NULL,
+    settings TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    shard TEXT,
+    sources INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    source_id TEXT NOT NULL,
+    release TEXT NOT NULL,
+    radius REAL NOT NULL,
+    settings TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    batch INTEGER NOT NULL REFERENCES batches(batch),
+    PRIMARY KEY (source_id, release, radius, settings)
+);
+CREATE INDEX IF NOT EXISTS sources_batch ON sources (batch);
+"""
+
+
+def source_hashes(local, id_col, ra_col, dec_col):
+    """Signed 64-bit hash of each row's ID and rounded coordinates."""
+    keys = pd.DataFrame({
+        "id": local[id_col].astype(str).values,
+        "ra": np.round(local[ra_col].values.astype(np.float64), COORD_DECIMALS),
+        "dec": np.round(local[dec_col].values.astype(np.float64), COORD_DECIMALS),
+    })
+    # SQLite integers are signed
+    return pd.util.hash_pandas_object(keys, index=False).values.view(np.int64)
+
+
+def store_settings(strategy, options):
+    """Short hash of the strategy and the ``options`` that shape its matches."""
+    settings = {"strategy": strategy, **{k: options.get(k) for k in SETTINGS_OPTIONS}}
+    return hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def _shard_columns(path):
+    return pq.read_schema(path).names if path.suffix == ".parquet" else list(pd.read_csv(path, nrows=0).columns)
+
+
+class MatchStore:
+    """The SQLite index and the batch shards of an incremental crossmatch."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.directory / "store.sqlite")
+        self.db.executescript(SCHEMA)
+        if "settings" not in [row[1] for row in self.db.execute("PRAGMA table_info(sources)")]:
+            self.db.close()
+            raise ValueError(f"{self.directory} was made by an older version without settings keys; "
+                             "delete it or use another store directory")
+
+    def close(self):
+        self.db.close()
+
+    def shard_dir(self, release, radius, settings):
+        return self.directory / f"{release}_r{radius:g}_{settings}"
+
+    def known(self, release, radius, settings):
+        """``source_id -> hash`` of the sources already matched for this release, radius and settings."""
+        rows = self.db.execute("SELECT source_id, hash FROM sources WHERE release = ? AND radius = ? "
+                               "AND settings = ?", (release, radius, settings))
+        return dict(rows.fetchall())
+
+    def diff(self, ids, hashes, release, radius, settings):
+        """Boolean mask of the ``ids`` to match and the list of known IDs no longer in the input."""
+        known = self.known(release, radius, settings)
+        changed = np.fromiter((known.get(i) != h for i, h in zip(ids, hashes.tolist())), bool, len(ids))
+        current = set(ids)
+        removed = [i for i in known if i not in current]
+        return changed, removed
+
+    def check_schema(self, release, radius, settings, path):
+        """Raise if the columns of the shard at ``path`` differ from those of the batches export merges it with."""
+        columns = _shard_columns(Path(path))
+        for _, other in self.batches(release, radius, settings):
+            if other:
+                expected = _shard_columns(self.directory / other)
+                if columns != expected:
+                    raise ValueError(f"the new matches have columns {columns}, but the batches in "
+                                     f"{self.directory} have {expected}; use another store directory")
+                return
+
+    def commit(self, release, radius, settings, strategy, ids, hashes, shard, rows, removed=()):
+        """Record a finished batch and repoint ``ids`` at it; drop the ``removed`` sources."""
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO batches (release, radius, settings, strategy, shard, sources, rows, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (release, radius, settings, strategy, shard, len(ids), rows, time.time()))
+            batch = cursor.lastrowid
+            self.db.executemany(
+                "INSERT OR REPLACE INTO sources (source_id, release, radius, settings, hash, batch) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((i, release, radius, settings, h, batch) for i, h in zip(ids, hashes.tolist())))
+            self.db.executemany(
+                "DELETE FROM sources WHERE source_id = ? AND release = ? AND radius = ? AND settings = ?",
+                ((i, release, radius, settings) for i in removed))
+        return batch
+
+    def batches(self, release, radius, settings):
+        """``(batch, shard)`` of every batch that still holds current matches, oldest first."""
+        rows = self.db.execute(
+            "SELECT b.batch, b.shard FROM batches b WHERE b.release = ? AND b.radius = ? AND b.settings = ? "
+            "AND EXISTS (SELECT 1 FROM sources s WHERE s.batch = b.batch) ORDER BY b.batch",
+            (release, radius, settings))
+        return rows.fetchall()
+
+    def batch_ids(self, batch):
+        rows = self.db.execute("SELECT source_id FROM sources WHERE batch = ?", (batch,))
+        return [r[0] for r in rows.fetchall()]
+
+    def prune(self, release, radius, settings):
+        """Delete the shards of batches whose sources have all been superseded or removed."""
+        with self.db:
+            stale = self.db.execute(
+                "SELECT batch, shard FROM batches b WHERE release = ? AND radius = ? AND settings = ? "
+                "AND NOT EXISTS (SELECT 1 FROM sources s WHERE s.batch = b.batch)",
+                (release, radius, settings)).fetchall()
+            for batch, shard in stale:
+                if shard:
+                    (self.directory / shard).unlink(missing_ok=True)
+                self.db.execute("DELETE FROM batches WHERE batch = ?", (batch,))
+        return len(stale)
+
+    def export(self, out, release, radius, settings, id_col):
+        """Write the current matches of every source to ``out``; returns the closed writer.
+
+        Shards are streamed one row group (or CSV chunk) at a time into a
+        temporary file that replaces ``out`` once complete, so a failed export
+        leaves the previous output in place.
+        """
+        root, suffix = os.path.splitext(str(out))
+        writer = StreamingWriter(root + ".export_tmp" + suffix)
+        try:
+            for batch, shard in self.batches(release, radius, settings):
+                if not shard:
+                    continue
+                ids = self.batch_ids(batch)
+                path = self.directory / shard
+                if path.suffix == ".parquet":
+                    value_set = pa.array(ids, type=pa.string())
+                    shard_file = pq.ParquetFile(path)
+                    for i in range(shard_file.num_row_groups):
+                        table = shard_file.read_row_group(i)
+                        column = pc.cast(table[_id_column(table.column_names, id_col)], pa.string())
+                        writer.write(table.filter(pc.is_in(column, value_set=value_set)))
+                else:
+                    ids = set(ids)
+                    for chunk in pd.read_csv(path, chunksize=500000):
+                        column = chunk[_id_column(list(chunk.columns), id_col)].astype(str)
+                        writer.write(chunk[column.isin(ids)])
+        except BaseException:
+            writer.close()
+            writer.path.unlink(missing_ok=True)
+            raise
+        writer.close()
+        final = Path(out)
+        if writer.path.exists():
+            os.replace(writer.path, final)
+        else:
+            # No current matches
+            final.unlink(missing_ok=True)
+        writer.path = final
+        return writer
+
+
+def _id_column(names, id_col):
+    # LSDB suffixes the columns of each side of a crossmatch
+    if id_col in names:
+        return id_col
+    for name in names:
+        if name.startswith(id_col + "_"):
+            return name
+    raise KeyError(f"source ID column {id_col!r} not found in the matches")
+
+
+def run_incremental(local, out, strategy="upload", store_dir=None, id_col="ID", release="idr5",
+                    radius_arcsec=2.0, ra_col="RA", dec_col="DEC", **options):
+    """Match only the sources of ``local`` that are new or moved since the last run, then rebuild ``out``.
+
+    ``options`` go to the strategy (``conn`` for upload and field). The ID
+    column must be unique and, for the upload and field strategies, must not
+    clash with an S-PLUS column name (e.g. ``GALEX_ID`` rather than ``ID``),
+    or it would be confused with the S-PLUS one in the matches. Returns the
+    strategy's stats with the number of reused, matched and removed sources.
+    """
+    t0 = time.perf_counter()
+    release = release_name(release)
+    radius = float(radius_arcsec)
+    if strategy != "lsdb" and options.get("mode") not in INCREMENTAL_MODES:
+        raise ValueError(f"match mode {options.get('mode')!r} cannot be updated incrementally; "
+                         f"use one of {', '.join(INCREMENTAL_MODES)}")
+    if local[id_col].duplicated().any():
+        raise ValueError(f"{id_col} is not unique in the local catalog")
+    if strategy != "lsdb":
+        query = build_query(release, **{k: options[k] for k in QUERY_OPTIONS if k in options}, field="{field}")
+        strategies.check_clashes([id_col], query)
+    settings = store_settings(strategy, options)
+
+    store = MatchStore(store_dir or str(Path(out).with_suffix("")) + "_store")
+    try:
+        ids = local[id_col].astype(str).tolist()
+        hashes = source_hashes(local, id_col, ra_col, dec_col)
+        changed, removed = store.diff(ids, hashes, release, radius, settings)
+        delta = local[changed]
+        print(f"{len(local) - len(delta)} sources unchanged, {len(delta)} new or moved, "
+              f"{len(removed)} removed ({release}, {radius:g} arcsec, settings {settings})")
+
+        stats = None
+        shard_dir = store.shard_dir(release, radius, settings)
+        if len(delta):
+            # The pending run is named after the delta, so a rerun with the same
+            # input resumes it and a different delta starts afresh
+            fingerprint = hashlib.sha1(np.sort(hashes[changed]).tobytes()).hexdigest()[:16]
+            pending = shard_dir / f"pending-{fingerprint}"
+            shard = pending / "matches.parquet"
+            common = dict(release=release, radius_arcsec=radius, ra_col=ra_col, dec_col=dec_col)
+            if strategy == "lsdb":
+                stats = strategies.run_lsdb(delta, shard, **common, **options)
+            else:
+                options["run_dir"] = str(pending / "run")
+                if strategy == "upload":
+                    options["extra_columns"] = [*options.get("extra_columns", ()), id_col]
+                stats = getattr(strategies, f"run_{strategy}")(delta, out=shard, **common, **options)
+            # The strategies count what is still unmatched (fields, or row spans
+            # that no done span covers), so a resumed batch that completes commits
+            if stats.get("failed"):
+                print(f"Batch not recorded: {stats['failed']} units failed; rerun to retry them")
+                return dict(stats, sources=len(local), matched=0, reused=len(local) - len(delta),
+                            removed=0, seconds=time.perf_counter() - t0)
+
+            final = Path(stats["output"])
+            rows = stats["rows"]
+            shard_path = None
+            if rows:
+                # Checked before anything is recorded, so the store stays exportable
+                store.check_schema(release, radius, settings, final)
+                target = shard_dir / f"batch-{int(time.time() * 1000)}{final.suffix}"
+                final.replace(target)
+                shard_path = str(target.relative_to(store.directory))
+            store.commit(release, radius, settings, strategy, delta[id_col].astype(str).tolist(),
+                         hashes[changed], shard_path, rows, removed)
+            shutil.rmtree(pending, ignore_errors=True)
+        elif removed:
+            store.commit(release, radius, settings, strategy, [], hashes[:0], None, 0, removed)
+
+        pruned = store.prune(release, radius, settings)
+        if pruned:
+            print(f"{pruned} superseded batch shards deleted")
+        writer = store.export(out, release, radius, settings, id_col)
+    finally:
+        store.close()
+
+    result = dict(stats or {"strategy": strategy})
+    result.update(sources=len(local), rows=writer.rows, output=str(writer.path),
+                  seconds=time.perf_counter() - t0, matched=len(delta),
+                  reused=len(local) - len(delta), removed=len(removed))
+    return result
@@ -0,0 +1,202 @@
+"""Low-memory loading of the local input catalog.
+
+Only the columns a run needs (RA, DEC and optionally an ID) are read: CSV
+with pyarrow's multithreaded parser restricted to those columns (pandas
+``usecols`` otherwise), Parquet memory-mapped with column projection and
+FITS tables memory-mapped so only the selected columns are copied. The
+positions are validated and normalised in one vectorized pass, and every row
+keeps its row number in the file as ``source_row``.
+
+That row number is what the upload strategy sends with the positions, so the
+server receives a three-column table. The wide input attributes are joined
+back onto the output afterwards by :func:`rejoin_columns`, which reads them
+once (projected to the requested columns) and streams the output through a
+positional take.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from .writer import StreamingWriter
+
+# Row number of each source in the input file, carried through the matching
+SOURCE_ROW = "source_row"
+
+# Prefix of input columns renamed because S-PLUS returns a column of that name
+LOCAL_PREFIX = "local_"
+
+FITS_SUFFIXES = (".fits", ".fit", ".fits.gz")
+
+
+class InvalidPositions(ValueError):
+    pass
+
+
+def _format(path):
+    name = str(path).lower()
+    if name.endswith(".parquet") or name.endswith(".pq"):
+        return "parquet"
+    if name.endswith(FITS_SUFFIXES):
+        return "fits"
+    return "csv"
+
+
+def catalog_columns(path):
+    """Column names of a catalog file, without reading its rows."""
+    fmt = _format(path)
+    if fmt == "parquet":
+        return list(pq.read_schema(path).names)
+    if fmt == "fits":
+        from astropy.io import fits
+        with fits.open(path, memmap=True) as hdul:
+            return list(hdul[1].columns.names)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_columns(path, columns, dtypes=None):
+    """Read only ``columns`` of a CSV, Parquet or FITS table into a DataFrame."""
+    fmt = _format(path)
+    dtypes = dtypes or {}
+    if fmt == "parquet":
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+    if fmt == "fits":
+        from astropy.io import fits
+        with fits.open(path, memmap=True) as hdul:
+            data = hdul[1].data
+            # Byte-swapped to native order; only these columns leave the memory map
+            return pd.DataFrame({c: np.asarray(data[c]).astype(data[c].dtype.newbyteorder("="))
+                                 for c in columns})
+    convert = pa_csv.ConvertOptions(include_columns=columns,
+                                    column_types={c: pa.from_numpy_dtype(np.dtype(t)) for c, t in dtypes.items()})
+    return pa_csv.read_csv(path, convert_options=convert).to_pandas()
+
+
+def validate_positions(ra, dec, on_invalid="drop"):
+    """Boolean mask of valid positions; RA is wrapped into [0, 360) in place.
+
+    Positions are invalid if either coordinate is missing or not finite, or
+    DEC is outside [-90, 90]. ``on_invalid="raise"`` raises
+    :class:`InvalidPositions` instead of returning a partial mask.
+    """
+    valid = np.isfinite(ra) & np.isfinite(dec) & (np.abs(dec) <= 90.0)
+    np.mod(ra, 360.0, out=ra, where=valid)
+    n_invalid = len(valid) - int(valid.sum())
+    if n_invalid and on_invalid == "raise":
+        raise InvalidPositions(f"{n_invalid} sources have missing or invalid coordinates")
+    return valid
+
+
+def load_catalog(path, ra_col="RA", dec_col="DEC", id_col=None, on_invalid="drop"):
+    """Read the positions (and ``id_col``) of a catalog with :data:`SOURCE_ROW`.
+
+    Sources with invalid positions are dropped with a message, or raise with
+    ``on_invalid="raise"``.
+    """
+    available = catalog_columns(path)
+    columns = [c for c in (id_col, ra_col, dec_col) if c]
+    missing = [c for c in columns if c not in available]
+    if missing:
+        raise KeyError(f"column(s) {', '.join(missing)} not found in {path}")
+    local = read_columns(path, columns, dtypes={ra_col: np.float64, dec_col: np.float64})
+    ra = local[ra_col].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+    dec = local[dec_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = validate_positions(ra, dec, on_invalid)
+    local[ra_col], local[dec_col] = ra, dec
+    local.insert(0, SOURCE_ROW, np.arange(len(local), dtype=np.int64))
+    if not valid.all():
+        print(f"Skipping {len(valid) - int(valid.sum())} sources with missing or invalid coordinates")
+        local = local[valid].reset_index(drop=True)
+    return local
+
+
+def avoid_clashes(local, columns, reserved):
+    """Rename the ``columns`` of ``local`` that clash with the ``reserved`` names to ``local_<name>``.
+
+    Names are compared case-insensitively, as ADQL does. Returns the frame
+    and a ``{name: output name}`` mapping for every column in ``columns``.
+    """
+    reserved = {name.lower() for name in reserved}
+    names = {c: LOCAL_PREFIX + c if c.lower() in reserved else c for c in columns}
+    renamed = {c: name for c, name in names.items() if c != name}
+    if renamed:
+        print(f"Input columns {', '.join(renamed)} clash with S-PLUS columns; "
+              f"they are named {', '.join(renamed.values())} in the output")
+        local = local.rename(columns=renamed)
+    return local, names
+
+
+def _row_column(names):
+    # LSDB suffixes the columns of each side of a crossmatch
+    if SOURCE_ROW in names:
+        return SOURCE_ROW
+    for name in names:
+        if name.startswith(SOURCE_ROW + "_"):
+            return name
+    raise KeyError(f"{SOURCE_ROW} not found in the output")
+
+
+def _positions(index, keys, key):
+    # Input rows of the output rows: the row numbers themselves, or looked up by ID
+    if index is None:
+        return np.asarray(keys, dtype=np.int64)
+    rows = index.get_indexer(pd.Series(keys).astype(str))
+    if (rows < 0).any():
+        raise KeyError(f"{int((rows < 0).sum())} output rows have a {key} not in the input")
+    return rows
+
+
+def rejoin_columns(output, path, columns=None, key=None, skip=(), names=None):
+    """Add input ``columns`` (all by default) to ``output``, in place.
+
+    Output rows are matched to input rows by :data:`SOURCE_ROW`, or by the
+    ``key`` column (an ID) when row numbers are not stable, e.g. across
+    incremental runs. ``names`` maps the input columns already in the output
+    to their output names (see :func:`avoid_clashes`); those and the columns
+    in ``skip`` are not added. Columns whose name is taken in the output
+    are added as ``local_<name>``. Returns the names of the added columns.
+    """
+    names = names or {}
+    output = str(output)
+    if not os.path.exists(output):
+        return []
+    fmt = _format(output)
+    out_names = pq.read_schema(output).names if fmt == "parquet" else list(pd.read_csv(output, nrows=0).columns)
+    columns = catalog_columns(path) if columns is None else list(columns)
+    columns = [c for c in columns if c not in names and c not in skip and c != key and c != SOURCE_ROW]
+    if not columns:
+        return []
+    attributes = read_columns(path, columns + ([key] if key else []))
+    row_col = _row_column(out_names) if key is None else names.get(key, key)
+    added = [LOCAL_PREFIX + c if c in out_names else c for c in columns]
+    index = pd.Index(attributes[key].astype(str)) if key else None
+
+    root, suffix = os.path.splitext(output)
+    writer = StreamingWriter(root + ".rejoin_tmp" + suffix)
+    try:
+        if fmt == "parquet":
+            parquet = pq.ParquetFile(output)
+            for i in range(parquet.num_row_groups):
+                table = parquet.read_row_group(i)
+                rows = _positions(index, table[row_col].to_pandas(), key)
+                extra = pa.Table.from_pandas(attributes[columns].take(rows), preserve_index=False)
+                for name, out_name in zip(columns, added):
+                    table = table.append_column(out_name, extra[name])
+                writer.write(table)
+        else:
+            for chunk in pd.read_csv(output, chunksize=500000):
+                rows = _positions(index, chunk[row_col], key)
+                extra = attributes[columns].take(rows).set_index(chunk.index)
+                extra.columns = added
+                writer.write(pd.concat([chunk, extra], axis=1))
+    except BaseException:
+        writer.close()
+        writer.path.unlink(missing_ok=True)
+        raise
+    writer.close()
+    os.replace(writer.path, Path(output))
+    return added
@@ -0,0 +1,77 @@
+"""Lazy, partition-at-a-time LSDB crossmatch.
+
+The S-PLUS HiPSCat catalogs are far larger than memory, so nothing here calls
+``compute()`` on a whole catalog. Catalogs are opened with column and row
+filter pushdown, crossmatched lazily (LSDB aligns the HEALPix partitions),
+and the matched partitions are computed and written to disk a few at a time,
+so memory is bounded by the partition size rather than the catalog size.
+"""
+import time
+
+import dask
+import lsdb
+
+
+def read_catalog(links, headers=None, columns=None, filters=None):
+    """Open a HiPSCat catalog and its margin cache without loading any data.
+
+    ``links`` is the ``(catalog, margin)`` pair returned by
+    ``splusdata.get_hipscats``; ``columns`` and ``filters`` (e.g.
+    ``[("r_auto", "<", 18)]``) are pushed down to the Parquet reader. The
+    margin may be None, at the cost of matches across partition edges.
+    """
+    storage_options = dict(headers=headers) if headers else None
+    margin = None
+    if len(links) > 1 and links[1]:
+        margin = lsdb.read_hipscat(links[1], storage_options=storage_options)
+    return lsdb.read_hipscat(links[0], margin_cache=margin, storage_options=storage_options,
+                             columns=columns, filters=filters)
+
+
+def n_partitions(catalog):
+    # Known from the catalog metadata; no data is read
+    return len(catalog.get_healpix_pixels())
+
+
+def _partitions(catalog):
+    if hasattr(catalog, "to_delayed"):
+        return catalog.to_delayed()
+    return catalog._ddf.to_delayed()
+
+
+def stream_partitions(catalog, writer, parallel=1, report=print):
+    """Compute ``catalog`` ``parallel`` partitions at a time and append them to ``writer``.
+
+    Returns a list of ``(partitions, rows, seconds)`` timings, one per batch:
+    the partitions of a batch are computed together in one dask call, so only
+    the batch as a whole can be timed. ``report`` is called with a progress
+    line per batch.
+    """
+    parts = _partitions(catalog)
+    timings = []
+    for start in range(0, len(parts), parallel):
+        batch = parts[start:start + parallel]
+        t0 = time.perf_counter()
+        frames = dask.compute(*batch)
+        elapsed = time.perf_counter() - t0
+        for df in frames:
+            writer.write(df)
+        rows = sum(len(df) for df in frames)
+        timings.append((range(start, start + len(batch)), rows, elapsed))
+        if report is not None:
+            report(f"Partitions {start + 1}-{start + len(batch)}/{len(parts)}: "
+                   f"{rows} rows in {elapsed:.1f} s")
+    return timings
+
+
+def timing_summary(timings):
+    if not timings:
+        return "no partitions processed"
+    seconds = sorted(t for _, _, t in timings)
+    partitions = sum(len(p) for p, _, _ in timings)
+    rows = sum(r for _, r, _ in timings)
+    total = sum(seconds)
+    size = max(len(p) for p, _, _ in timings)
+    return (f"{partitions} partitions, {rows} rows in {total:.1f} s "
+            f"(median {seconds[len(seconds) // 2]:.2f} s, slowest {seconds[-1]:.2f} s "
+            f"per batch of up to {size} partitions)")
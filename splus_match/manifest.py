@@ -0,0 +1,194 @@
+"""Checkpointed runs: a JSON-lines manifest of per-field / per-chunk progress.
+
+Every unit of work (a field or an upload chunk) is recorded as ``pending``,
+``done`` or ``failed`` in ``<run_dir>/manifest.jsonl`` together with the path
+and row count of its output shard. Re-running with the same run directory
+skips the units that are already done and retries the others.
+
+A run directory also keeps the fingerprint of the settings and input it was
+made with (``<run_dir>/fingerprint``); a run with a different fingerprint
+discards the old progress and starts afresh instead of resuming it.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .matcher import reduce_pairs
+from .writer import StreamingWriter
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+
+def write_shard(shard_dir, unit, df, shard_format="parquet"):
+    """Write ``df`` as the shard of ``unit`` in ``shard_dir``; returns its path, or None if empty."""
+    if df is None or not len(df):
+        return None
+    unit = str(unit)
+    suffix = ".parquet" if shard_format == "parquet" else ".csv"
+    # Write under a temporary name so a crash never leaves a partial shard
+    writer = StreamingWriter(Path(shard_dir) / ("_tmp_" + unit.replace("/", "_") + suffix), fmt=shard_format)
+    writer.write(df)
+    tmp = writer.close()
+    final = tmp.with_name(tmp.name[len("_tmp_"):])
+    os.replace(tmp, final)
+    return final
+
+
+def run_fingerprint(settings, local=None):
+    """Hash of the run ``settings`` (a JSON-serialisable dict) and the rows of the ``local`` input."""
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True, default=str).encode())
+    if local is not None:
+        digest.update(pd.util.hash_pandas_object(local, index=False).values.tobytes())
+        digest.update(json.dumps(list(map(str, local.columns))).encode())
+    return digest.hexdigest()
+
+
+class RunManifest:
+    def __init__(self, run_dir, shard_format="parquet", fingerprint=None):
+        self.run_dir = Path(run_dir)
+        self.shard_dir = self.run_dir / "shards"
+        self.path = self.run_dir / "manifest.jsonl"
+        if fingerprint is not None:
+            self._check_fingerprint(fingerprint)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_format = shard_format
+        self.units = {}
+        # Units may be saved from several writer threads
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash; the unit will simply be redone
+                        continue
+                    # The last record for a unit wins
+                    self.units[record["unit"]] = record
+
+    def _check_fingerprint(self, fingerprint):
+        # Progress made with other settings or input is not resumed
+        stored_path = self.run_dir / "fingerprint"
+        stored = stored_path.read_text().strip() if stored_path.exists() else None
+        if stored != fingerprint and (self.path.exists() or self.shard_dir.exists()):
+            print(f"Run directory {self.run_dir} was made with different settings or input; starting afresh")
+            self.path.unlink(missing_ok=True)
+            shutil.rmtree(self.shard_dir, ignore_errors=True)
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+        stored_path.write_text(fingerprint + "\n")
+
+    def _append(self, record):
+        record["time"] = time.time()
+        with self._lock:
+            self.units[record["unit"]] = record
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def status(self, unit):
+        record = self.units.get(str(unit))
+        return record["status"] if record else None
+
+    def add(self, units):
+        # Register new units as pending; already known units keep their status
+        for unit in units:
+            if str(unit) not in self.units:
+                self._append({"unit": str(unit), "status": PENDING})
+
+    def todo(self, units):
+        # Units that still have to be processed, in the given order
+        return [unit for unit in units if self.status(unit) != DONE]
+
+    def counts(self):
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        for record in self.units.values():
+            counts[record["status"]] += 1
+        return counts
+
+    def save(self, unit, df):
+        """Write the shard for ``unit`` and mark it as done."""
+        path = write_shard(self.shard_dir, unit, df, self.shard_format)
+        self.mark_done(unit, str(path.relative_to(self.run_dir)) if path else None, 0 if df is None else len(df))
+
+    def mark_done(self, unit, shard, rows):
+        """Mark ``unit`` as done; ``shard`` is its output relative to the run directory, or None."""
+        self._append({"unit": str(unit), "status": DONE, "shard": shard, "rows": rows})
+
+    def mark_failed(self, unit, error):
+        self._append({"unit": str(unit), "status": FAILED, "error": str(error)})
+
+    def _done_shards(self, units):
+        for unit in (units if units is not None else list(self.units)):
+            record = self.units.get(str(unit))
+            if record and record["status"] == DONE and record.get("shard"):
+                yield self.run_dir / record["shard"]
+
+    def merge(self, output_path, units=None, mode=None, left=None, right=("RA", "DEC")):
+        """Concatenate the shards of all done units into ``output_path``.
+
+        Shards are streamed one at a time, so the merge never holds more than
+        one shard in memory. With a match ``mode`` the shards hold every
+        candidate pair (``sep_arcsec``) of their field or chunk, with the
+        local positions in the ``left`` columns and the S-PLUS ones in
+        ``right``; the mode is applied once over the pairs of all shards (see
+        :func:`splus_match.matcher.reduce_pairs`), which only needs those
+        columns in memory, and ``match_rank`` is recomputed. Returns the
+        closed :class:`StreamingWriter`.
+        """
+        shards = list(self._done_shards(units))
+        keep = rank = None
+        if mode is not None:
+            keep, rank = self._reduce(shards, mode, left, right)
+        writer = StreamingWriter(output_path)
+        offset = 0
+        for shard in shards:
+            if shard.suffix == ".parquet":
+                # Copy row group by row group; nothing is converted to pandas
+                shard_file = pq.ParquetFile(shard)
+                batches = (shard_file.read_row_group(i) for i in range(shard_file.num_row_groups))
+            else:
+                batches = pd.read_csv(shard, chunksize=500000)
+            for batch in batches:
+                if keep is not None:
+                    rows = slice(offset, offset + len(batch))
+                    offset += len(batch)
+                    batch = _with_rank(batch, rank[rows])
+                    batch = batch.filter(pa.array(keep[rows])) if isinstance(batch, pa.Table) else batch[keep[rows]]
+                writer.write(batch)
+        writer.close()
+        return writer
+
+    def _reduce(self, shards, mode, left, right):
+        columns = [*left, *right, "sep_arcsec"]
+        parts = []
+        for shard in shards:
+            if shard.suffix == ".parquet":
+                parts.append(pq.read_table(shard, columns=columns).to_pandas())
+            else:
+                parts.append(pd.read_csv(shard, usecols=columns)[columns])
+        if not parts:
+            return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int32)
+        pairs = pd.concat(parts, ignore_index=True)
+        return reduce_pairs(pairs[left[0]], pairs[left[1]], pairs[right[0]], pairs[right[1]],
+                            pairs["sep_arcsec"], mode)
+
+
+def _with_rank(batch, rank):
+    if isinstance(batch, pa.Table):
+        return batch.set_column(batch.column_names.index("match_rank"), "match_rank", pa.array(rank))
+    return batch.assign(match_rank=rank)
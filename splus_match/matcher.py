@@ -0,0 +1,203 @@
+"""In-memory spherical crossmatch against a local catalog.
+
+The KD-tree over the local catalog is built once and reused for every field
+or chunk, instead of being rebuilt by ``SkyCoord.match_to_catalog_sky`` on
+each call.
+
+Candidate pairs are reduced with one of the match modes below, the same for
+local matches and for the pairs returned by the server-side joins. The left
+side is the local (user) catalog, the right side S-PLUS:
+
+``all``         every pair within the radius
+``best_left``   the nearest S-PLUS source of each local source
+``best_right``  the nearest local source of each S-PLUS source
+``mutual``      pairs that are the nearest in both directions (one-to-one)
+
+The strategies match field by field or chunk by chunk, but fields overlap
+and upload chunks share S-PLUS sources, so they keep every pair and apply the
+mode once over all of them when merging (:func:`reduce_pairs`).
+
+Ties in separation go to the lower index on the other side, so the result
+does not depend on the row order of the server's response. Every mode
+reports the separation and the pair's rank among the candidates of its local
+source (1 = nearest).
+"""
+import numpy as np
+import pyarrow as pa
+from scipy.spatial import cKDTree
+
+from .sphere import arcsec_to_chord, chord_to_arcsec, radec_to_xyz
+
+
+MODES = ("all", "best_left", "best_right", "mutual")
+
+
+class LocalMatcher:
+    """Unit-vector KD-tree over the local catalog positions (degrees)."""
+
+    def __init__(self, ra, dec):
+        xyz = radec_to_xyz(ra, dec)
+        # Rows with missing coordinates are kept in the indexing but never matched
+        self._index = np.flatnonzero(np.isfinite(xyz).all(axis=1))
+        self.tree = cKDTree(xyz[self._index])
+        self.size = len(xyz)
+
+    def match_all(self, ra, dec, radius_arcsec):
+        """All (batch, local) pairs closer than ``radius_arcsec``.
+
+        Returns ``(batch_idx, local_idx, sep_arcsec)``; a batch source may
+        appear several times and so may a local source (many-to-many).
+        """
+        xyz = radec_to_xyz(ra, dec)
+        valid = np.flatnonzero(np.isfinite(xyz).all(axis=1))
+        if len(valid) == 0 or self.tree.n == 0:
+            return _empty_pairs()
+        batch_tree = cKDTree(xyz[valid])
+        pairs = batch_tree.sparse_distance_matrix(
+            self.tree, arcsec_to_chord(radius_arcsec), output_type="ndarray")
+        order = np.lexsort((pairs["j"], pairs["i"]))
+        pairs = pairs[order]
+        return (valid[pairs["i"]], self._index[pairs["j"]], chord_to_arcsec(pairs["v"]))
+
+    def match(self, ra, dec, radius_arcsec, mode="all"):
+        """Pairs within ``radius_arcsec`` reduced with a match ``mode`` (see :data:`MODES`).
+
+        Returns ``(batch_idx, local_idx, sep_arcsec, rank)``, ordered by local
+        source and separation; the local catalog is the left side.
+        """
+        batch_idx, local_idx, sep = self.match_all(ra, dec, radius_arcsec)
+        keep, rank = select_pairs(local_idx, batch_idx, sep, mode)
+        return batch_idx[keep], local_idx[keep], sep[keep], rank
+
+    def match_nearest(self, ra, dec, radius_arcsec):
+        """Nearest local source for each batch source within ``radius_arcsec``.
+
+        Returns ``(batch_idx, local_idx, sep_arcsec)`` for the batch sources that
+        have a neighbour, the same shape of result as :meth:`match_all`.
+        """
+        xyz = radec_to_xyz(ra, dec)
+        valid = np.flatnonzero(np.isfinite(xyz).all(axis=1))
+        if len(valid) == 0 or self.tree.n == 0:
+            return _empty_pairs()
+        dist, idx = self.tree.query(xyz[valid], k=1,
+                                    distance_upper_bound=arcsec_to_chord(radius_arcsec))
+        found = np.isfinite(dist)
+        return (valid[found], self._index[idx[found]], chord_to_arcsec(dist[found]))
+
+
+def _empty_pairs():
+    return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+
+
+def _group_rank(group, sep, other):
+    # 1-based rank of each pair by separation within its group (ties: lower other index first)
+    n = len(group)
+    order = np.lexsort((other, sep, group))
+    sorted_group = group[order]
+    first = np.empty(n, dtype=bool)
+    first[:1] = True
+    first[1:] = sorted_group[1:] != sorted_group[:-1]
+    positions = np.arange(n)
+    group_start = np.maximum.accumulate(np.where(first, positions, 0))
+    rank = np.empty(n, dtype=np.int32)
+    rank[order] = positions - group_start + 1
+    return rank
+
+
+def select_pairs(left_idx, right_idx, sep, mode="all"):
+    """Reduce candidate pairs with a match ``mode``.
+
+    Returns ``(keep, rank)``: the indices of the kept pairs, ordered by left
+    source and separation, and each kept pair's rank among its left source's
+    candidates.
+    """
+    if mode not in MODES:
+        raise ValueError(f"unknown match mode {mode!r}; expected one of {', '.join(MODES)}")
+    left_idx = np.asarray(left_idx)
+    right_idx = np.asarray(right_idx)
+    sep = np.asarray(sep, dtype=np.float64)
+    left_rank = _group_rank(left_idx, sep, right_idx)
+    if mode == "all":
+        mask = np.ones(len(sep), dtype=bool)
+    elif mode == "best_left":
+        mask = left_rank == 1
+    else:
+        mask = _group_rank(right_idx, sep, left_idx) == 1
+        if mode == "mutual":
+            mask &= left_rank == 1
+    keep = np.flatnonzero(mask)
+    keep = keep[np.lexsort((left_rank[keep], left_idx[keep]))]
+    return keep, left_rank[keep]
+
+
+def _column(table, name):
+    # pandas Series and Arrow columns both convert nulls to NaN for floats
+    return np.asarray(table[name].to_numpy(), dtype=np.float64)
+
+
+def _position_ids(ra, dec):
+    # Same position -> same source; NaN positions get -1
+    valid = np.isfinite(ra) & np.isfinite(dec)
+    ids = np.full(len(ra), -1, dtype=np.int64)
+    if valid.any():
+        _, ids[valid] = np.unique(np.column_stack((ra[valid], dec[valid])), axis=0, return_inverse=True)
+    return ids
+
+
+def reduce_pairs(left_ra, left_dec, right_ra, right_dec, sep, mode="all"):
+    """Apply a match ``mode`` to pairs gathered from several fields or chunks.
+
+    Sources are identified by position on both sides, so a local source
+    matched in two overlapping fields (or an S-PLUS source matched from two
+    upload chunks) is reduced once over all its candidates. Returns ``(keep,
+    rank)``: a boolean mask of the pairs to keep and every pair's rank among
+    its local source's candidates. Rows without an S-PLUS source (``LEFT
+    OUTER JOIN`` misses) are kept in the ``all`` and ``best_left`` modes with
+    rank 0.
+    """
+    left_ids = _position_ids(np.asarray(left_ra, dtype=np.float64), np.asarray(left_dec, dtype=np.float64))
+    right_ids = _position_ids(np.asarray(right_ra, dtype=np.float64), np.asarray(right_dec, dtype=np.float64))
+    matched = np.flatnonzero((left_ids >= 0) & (right_ids >= 0))
+    kept, kept_rank = select_pairs(left_ids[matched], right_ids[matched], np.asarray(sep)[matched], mode)
+    keep = np.zeros(len(left_ids), dtype=bool)
+    rank = np.zeros(len(left_ids), dtype=np.int32)
+    keep[matched[kept]] = True
+    rank[matched[kept]] = kept_rank
+    if mode in ("all", "best_left"):
+        keep[right_ids < 0] = True
+    return keep, rank
+
+
+def resolve_pairs(table, mode="all", left=("GALEX_RA", "GALEX_DEC"), right=("RA", "DEC")):
+    """Apply a match ``mode`` to the pairs returned by an upload join.
+
+    ``table`` (pandas or Arrow) has one row per (upload, S-PLUS) pair, with
+    the uploaded positions in the ``left`` columns and the S-PLUS positions
+    in ``right``; sources are identified by position. Adds ``sep_arcsec``
+    and ``match_rank`` columns. Rows of a ``LEFT OUTER JOIN`` without a match
+    are kept in the ``all`` and ``best_left`` modes, with a NaN separation
+    and rank 0.
+    """
+    left_ra, left_dec = _column(table, left[0]), _column(table, left[1])
+    right_ra, right_dec = _column(table, right[0]), _column(table, right[1])
+    left_ids = _position_ids(left_ra, left_dec)
+    right_ids = _position_ids(right_ra, right_dec)
+
+    matched = np.flatnonzero((left_ids >= 0) & (right_ids >= 0))
+    chord = np.linalg.norm(radec_to_xyz(left_ra[matched], left_dec[matched])
+                           - radec_to_xyz(right_ra[matched], right_dec[matched]), axis=1)
+    keep, rank = select_pairs(left_ids[matched], right_ids[matched], chord_to_arcsec(chord), mode)
+    rows = matched[keep]
+    sep = chord_to_arcsec(chord[keep])
+
+    if mode in ("all", "best_left"):
+        # Unmatched uploads stay in the output, as in the LEFT OUTER JOIN
+        unmatched = np.flatnonzero(right_ids < 0)
+        rows = np.concatenate((rows, unmatched))
+        sep = np.concatenate((sep, np.full(len(unmatched), np.nan)))
+        rank = np.concatenate((rank, np.zeros(len(unmatched), dtype=np.int32)))
+
+    if hasattr(table, "iloc"):
+        return table.iloc[rows].reset_index(drop=True).assign(sep_arcsec=sep, match_rank=rank)
+    table = table.take(rows)
+    return table.append_column("sep_arcsec", pa.array(sep)).append_column("match_rank", pa.array(rank))
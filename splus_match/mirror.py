@@ -0,0 +1,154 @@
+"""Local mirror of the S-PLUS HiPSCat catalogs for offline matching.
+
+Copies the chosen columns and sky region of a remote HiPSCat catalog (and its
+margin cache) into ``<root>/<release>/<kind>/{catalog,margin}``. Syncing is
+incremental: each partition's remote checksum (ETag/Content-MD5, or size) and
+column list are kept in ``mirror_state.json`` and unchanged partitions are not
+downloaded again. The mirror is a regular HiPSCat directory, so every LSDB
+entry point can read it in place of the remote URL.
+
+Usage: python -m splus_match.mirror idr5/dual splus-mirror --columns ID RA DEC r_auto \\
+           [--cone RA DEC RADIUS_DEG]
+"""
+import argparse
+import json
+import shutil
+from pathlib import Path
+
+import fsspec
+import pandas as pd
+import pyarrow.parquet as pq
+
+STATE_FILE = "mirror_state.json"
+INDEX_COLUMNS = ("_hipscat_index",)
+
+
+def mirror_links(root, name):
+    """``(catalog, margin)`` paths of a mirrored catalog, as ``splusdata.get_hipscats`` returns URLs."""
+    base = Path(root) / name
+    return str(base / "catalog"), str(base / "margin")
+
+
+def partition_path(order, pixel):
+    return f"Norder={order}/Dir={(pixel // 10000) * 10000}/Npix={pixel}.parquet"
+
+
+def _checksum(info):
+    for field in ("ETag", "Content-MD5", "Digest"):
+        if info.get(field):
+            return str(info[field])
+    return f"size:{info.get('size')}"
+
+
+def _region_pixels(url, headers, cone):
+    # HEALPix pixels of the catalog partitions overlapping the cone (ra, dec, radius in deg)
+    import lsdb
+    storage_options = dict(headers=headers) if headers else None
+    catalog = lsdb.read_hipscat(url, storage_options=storage_options)
+    ra, dec, radius = cone
+    return {(p.order, p.pixel) for p in catalog.cone_search(ra, dec, radius * 3600).get_healpix_pixels()}
+
+
+def sync_catalog(url, dest, headers=None, columns=None, pixels=None, report=print):
+    """Mirror one HiPSCat catalog from ``url`` into ``dest``.
+
+    ``columns`` selects the columns to keep (the index and position columns
+    are always kept); ``pixels`` is a set of ``(order, pixel)`` partitions to
+    keep, all by default. Returns the set of mirrored partitions.
+    """
+    fs, root = fsspec.core.url_to_fs(url, **({"headers": headers} if headers else {}))
+    root = root.rstrip("/")
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+
+    with fs.open(f"{root}/catalog_info.json") as f:
+        info = json.load(f)
+    (dest / "catalog_info.json").write_text(json.dumps(info, indent=2))
+    with fs.open(f"{root}/partition_info.csv") as f:
+        partitions = pd.read_csv(f)
+    if pixels is not None:
+        keep = [(o, p) in pixels for o, p in zip(partitions["Norder"], partitions["Npix"])]
+        partitions = partitions[keep]
+
+    if columns is not None:
+        columns = list(dict.fromkeys(list(INDEX_COLUMNS) + [info.get("ra_column", "RA"),
+                                                            info.get("dec_column", "DEC")] + list(columns)))
+
+    state_path = dest / STATE_FILE
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+    new_state = {}
+    schema = None
+    downloaded = 0
+    for order, pixel in zip(partitions["Norder"], partitions["Npix"]):
+        rel = partition_path(int(order), int(pixel))
+        remote = f"{root}/{rel}"
+        local = dest / rel
+        checksum = _checksum(fs.info(remote))
+        entry = {"checksum": checksum, "columns": columns}
+        if state.get(rel) == entry and local.exists():
+            new_state[rel] = entry
+            continue
+        local.parent.mkdir(parents=True, exist_ok=True)
+        tmp = local.with_name("_tmp_" + local.name)
+        with fs.open(remote) as f:
+            if columns is None:
+                with open(tmp, "wb") as out:
+                    shutil.copyfileobj(f, out)
+            else:
+                file_columns = pq.ParquetFile(f).schema_arrow.names
+                f.seek(0)
+                table = pq.read_table(f, columns=[c for c in columns if c in file_columns])
+                pq.write_table(table, tmp)
+        tmp.replace(local)
+        new_state[rel] = entry
+        downloaded += 1
+        if schema is None:
+            schema = pq.read_schema(local)
+
+    # Drop partitions that are no longer part of the selection
+    for rel in set(state) - set(new_state):
+        (dest / rel).unlink(missing_ok=True)
+
+    partitions.to_csv(dest / "partition_info.csv", index=False)
+    if schema is None and new_state:
+        schema = pq.read_schema(dest / next(iter(new_state)))
+    if schema is not None:
+        pq.write_metadata(schema, dest / "_common_metadata")
+    # The remote _metadata lists row groups of every remote file; without it
+    # readers fall back to partition_info.csv
+    (dest / "_metadata").unlink(missing_ok=True)
+    state_path.write_text(json.dumps(new_state, indent=1))
+    if report is not None:
+        report(f"{url}: {len(new_state)} partitions mirrored, {downloaded} downloaded, "
+               f"{len(new_state) - downloaded} unchanged")
+    return {(int(o), int(p)) for o, p in zip(partitions["Norder"], partitions["Npix"])}
+
+
+def sync(links, root, name, headers=None, columns=None, cone=None, report=print):
+    """Mirror a catalog and its margin cache (``links`` from ``splusdata.get_hipscats``)."""
+    catalog_dest, margin_dest = mirror_links(root, name)
+    pixels = _region_pixels(links[0], headers, cone) if cone is not None else None
+    sync_catalog(links[0], catalog_dest, headers, columns, pixels, report)
+    if len(links) > 1 and links[1]:
+        # Margin caches are partitioned like their catalog
+        sync_catalog(links[1], margin_dest, headers, columns, pixels, report)
+    return catalog_dest, margin_dest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mirror an S-PLUS HiPSCat catalog to local disk.")
+    parser.add_argument("name", help="catalog name as in splusdata.get_hipscats, e.g. idr5/dual")
+    parser.add_argument("root", help="local mirror directory")
+    parser.add_argument("--columns", nargs="+", help="columns to keep (default: all)")
+    parser.add_argument("--cone", nargs=3, type=float, metavar=("RA", "DEC", "RADIUS"),
+                        help="only mirror partitions overlapping this cone (degrees)")
+    args = parser.parse_args(argv)
+
+    import splusdata
+    headers = splusdata.Core().headers
+    links = splusdata.get_hipscats(args.name, headers=headers)[0]
+    sync(links, args.root, args.name, headers=headers, columns=args.columns, cone=args.cone)
+
+
+if __name__ == "__main__":
+    main()
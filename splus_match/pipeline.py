@@ -0,0 +1,283 @@
+"""Pipelined field crossmatch: download, match and write stages run concurrently.
+
+Field tables arrive from one or more sources (cache reads, the query
+scheduler's download threads), each drained by its own feeder thread into a
+bounded queue. The matching stage is a process pool: the local catalog
+coordinates live in a shared-memory block that every worker attaches to once
+and indexes with its own :class:`LocalMatcher`, and only the RA/DEC columns
+of each field are sent to the workers, several fields per task. Matched
+index arrays go to a pool of writer threads, which build and persist the
+output. Network I/O, CPU-bound matching and disk writes therefore overlap
+instead of alternating, and the queue depths show which stage is the
+bottleneck. With a :class:`splus_match.telemetry.Telemetry` the tree
+build, every field's match and every write are reported as ``coords``,
+``match`` and ``write`` events.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .matcher import LocalMatcher
+from .telemetry import MatchProfiler, merge_profiles
+
+_END = object()
+
+
+class SharedCoordinates:
+    """RA/DEC arrays (degrees) in a shared-memory block, attached by name in the workers."""
+
+    def __init__(self, ra, dec):
+        ra = np.asarray(ra, dtype=np.float64)
+        dec = np.asarray(dec, dtype=np.float64)
+        self.shape = (2, len(ra))
+        self._shm = shared_memory.SharedMemory(create=True, size=max(ra.nbytes * 2, 1))
+        coords = np.ndarray(self.shape, dtype=np.float64, buffer=self._shm.buf)
+        coords[0] = ra
+        coords[1] = dec
+        self.name = self._shm.name
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+# Per-process state of the matching workers
+_shm = None
+_matcher = None
+_build_seconds = None
+_profiler = None
+
+
+def _attach(name, shape, profile=None):
+    global _shm, _matcher, _build_seconds, _profiler
+    _shm = shared_memory.SharedMemory(name=name)
+    coords = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    # The tree is built once per worker and reused for every field it matches
+    t0 = time.perf_counter()
+    _matcher = LocalMatcher(coords[0], coords[1])
+    _build_seconds = time.perf_counter() - t0
+    if profile is not None:
+        kind, directory = profile
+        _profiler = MatchProfiler(kind, os.path.join(directory, f"match-{os.getpid()}"))
+
+
+def _match(ra, dec, radius_arcsec, mode):
+    if _profiler is None:
+        return _matcher.match(ra, dec, radius_arcsec, mode)
+    with _profiler:
+        return _matcher.match(ra, dec, radius_arcsec, mode)
+
+
+def _match_batch(batch, radius_arcsec, mode):
+    global _build_seconds
+    t0 = time.process_time()
+    matches = []
+    for key, ra, dec in batch:
+        t_field = time.perf_counter()
+        matches.append((key,) + _match(ra, dec, radius_arcsec, mode) + (time.perf_counter() - t_field,))
+    if _profiler is not None:
+        _profiler.save()
+    # The tree build time is reported with the worker's first batch only
+    build_seconds, _build_seconds = _build_seconds, None
+    return matches, time.process_time() - t0, build_seconds
+
+
+class FieldPipeline:
+    """Match field tables against a local catalog with overlapping stages.
+
+    ``match_workers`` processes (all cores by default) match batches of
+    ``batch_size`` fields within ``radius_arcsec``, reducing the pairs with a
+    match ``mode`` (see :data:`splus_match.matcher.MODES`); ``write_workers``
+    threads run the sink. At most ``queue_size`` downloaded fields wait for a
+    matcher, which bounds memory and throttles the sources when matching
+    falls behind. ``profile=(kind, directory)`` profiles the matching in
+    every worker with a :class:`splus_match.telemetry.MatchProfiler`.
+    """
+
+    def __init__(self, ra, dec, radius_arcsec, match_workers=None, write_workers=1, batch_size=1,
+                 queue_size=None, mode="all", ra_col="RA", dec_col="DEC",
+                 report=print, report_every=30.0, telemetry=None, profile=None):
+        self.ra = ra
+        self.dec = dec
+        self.radius_arcsec = radius_arcsec
+        self.match_workers = match_workers or os.cpu_count() or 1
+        self.write_workers = max(write_workers, 1)
+        self.batch_size = max(batch_size, 1)
+        self.queue_size = queue_size or 2 * self.match_workers * self.batch_size
+        self.mode = mode
+        self.ra_col = ra_col
+        self.dec_col = dec_col
+        self.report = report
+        self.report_every = report_every
+        self.telemetry = telemetry
+        self.profile = profile
+        self.stats = {"fields": 0, "matches": 0, "errors": 0, "match_cpu_seconds": 0.0,
+                      "wall_seconds": 0.0, "max_download_queue": 0, "max_matching": 0,
+                      "max_write_queue": 0}
+        self._download_queue = None
+        self._write_queue = None
+        self._matching = 0
+
+    def queue_depths(self):
+        """Fields currently waiting for a matcher, being matched and waiting to be written."""
+        return {
+            "download_queue": self._download_queue.qsize() if self._download_queue else 0,
+            "matching": self._matching,
+            "write_queue": self._write_queue.qsize() if self._write_queue else 0,
+        }
+
+    def _sample(self):
+        depths = self.queue_depths()
+        for name, stat in (("download_queue", "max_download_queue"), ("matching", "max_matching"),
+                           ("write_queue", "max_write_queue")):
+            self.stats[stat] = max(self.stats[stat], depths[name])
+        return depths
+
+    def run(self, sources, sink, on_error=None):
+        """Match every ``(key, table)`` yielded by ``sources`` and pass the result to ``sink``.
+
+        ``sources`` is a list of iterables, each consumed by its own thread.
+        ``sink(key, table, table_idx, local_idx, sep_arcsec, rank)`` is called on a
+        writer thread; ``on_error(key, exc)`` is called for fields whose
+        matching or writing failed. Returns :attr:`stats`.
+        """
+        t_start = time.perf_counter()
+        self._download_queue = queue.Queue(maxsize=self.queue_size)
+        self._write_queue = queue.Queue(maxsize=self.queue_size)
+        source_errors = []
+        stats_lock = threading.Lock()
+
+        def fail(key, exc):
+            with stats_lock:
+                self.stats["errors"] += 1
+            if on_error is not None:
+                on_error(key, exc)
+            else:
+                print(f"Error processing {key}: {exc}")
+
+        def feed(source):
+            try:
+                for item in source:
+                    self._download_queue.put(item)
+            except Exception as exc:
+                source_errors.append(exc)
+            finally:
+                self._download_queue.put(_END)
+
+        def write():
+            while True:
+                item = self._write_queue.get()
+                if item is _END:
+                    return
+                key = item[0]
+                t0 = time.perf_counter()
+                try:
+                    sink(*item)
+                except Exception as exc:
+                    fail(key, exc)
+                else:
+                    if self.telemetry is not None:
+                        self.telemetry.event("write", time.perf_counter() - t0, key=key, rows=len(item[2]))
+                    with stats_lock:
+                        self.stats["fields"] += 1
+                        self.stats["matches"] += len(item[2])
+
+        coords = SharedCoordinates(self.ra, self.dec)
+        # Spawned workers do not inherit the feeder threads' locks, unlike forked ones
+        pool = ProcessPoolExecutor(self.match_workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_attach, initargs=(coords.name, coords.shape, self.profile))
+        feeders = [threading.Thread(target=feed, args=(source,), daemon=True) for source in sources]
+        writers = [threading.Thread(target=write, daemon=True) for _ in range(self.write_workers)]
+        for thread in feeders + writers:
+            thread.start()
+
+        pending = {}
+        batch = []
+        open_sources = len(feeders)
+        max_pending = 2 * self.match_workers
+        last_report = time.perf_counter()
+
+        def submit():
+            tasks = [(key, table[self.ra_col].values, table[self.dec_col].values) for key, table in batch]
+            future = pool.submit(_match_batch, tasks, self.radius_arcsec, self.mode)
+            pending[future] = dict(batch)
+            self._matching += len(batch)
+            batch.clear()
+
+        try:
+            while open_sources or pending or batch:
+                # Take downloaded fields while there is room in the pool; wait for
+                # the sources only when nothing else is in progress
+                while open_sources and len(pending) < max_pending:
+                    try:
+                        item = self._download_queue.get(timeout=None if not (pending or batch) else 0.05)
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        open_sources -= 1
+                        continue
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        submit()
+                # A partial batch is not held back while the sources are idle
+                if batch and len(pending) < max_pending:
+                    submit()
+                self._sample()
+                if not pending:
+                    continue
+
+                done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tables = pending.pop(future)
+                    self._matching -= len(tables)
+                    try:
+                        matches, cpu_seconds, build_seconds = future.result()
+                    except Exception as exc:
+                        for key in tables:
+                            fail(key, exc)
+                        continue
+                    self.stats["match_cpu_seconds"] += cpu_seconds
+                    if self.telemetry is not None and build_seconds is not None:
+                        self.telemetry.event("coords", build_seconds, sources=len(self.ra))
+                    for key, table_idx, local_idx, sep, rank, seconds in matches:
+                        if self.telemetry is not None:
+                            self.telemetry.event("match", seconds, key=key, sources=len(tables[key]),
+                                                 pairs=len(table_idx))
+                        self._write_queue.put((key, tables[key], table_idx, local_idx, sep, rank))
+
+                now = time.perf_counter()
+                if self.report is not None and now - last_report >= self.report_every:
+                    depths = self._sample()
+                    self.report(f"Pipeline: {depths['download_queue']} fields waiting, "
+                                f"{depths['matching']} matching, {depths['write_queue']} to write; "
+                                f"{self.stats['fields']} done")
+                    last_report = now
+        finally:
+            for _ in writers:
+                self._write_queue.put(_END)
+            for thread in writers:
+                thread.join()
+            pool.shutdown(cancel_futures=True)
+            coords.close()
+            self.stats["wall_seconds"] = time.perf_counter() - t_start
+            if self.profile is not None and self.profile[0] == "cprofile":
+                self.stats["profile"] = merge_profiles(self.profile[1])
+
+        if source_errors:
+            raise source_errors[0]
+        return self.stats
+
+    def summary(self):
+        s = self.stats
+        return (f"pipeline: {s['fields']} fields, {s['matches']} matches, {s['errors']} errors in "
+                f"{s['wall_seconds']:.1f} s ({s['match_cpu_seconds']:.1f} s matching CPU on "
+                f"{self.match_workers} workers); peak queues: {s['max_download_queue']} downloaded, "
+                f"{s['max_matching']} matching, {s['max_write_queue']} to write")
@@ -0,0 +1,131 @@
+"""Pre-joined dual x PSF catalog, built once per data release.
+
+The PSF photometry of an S-PLUS source shares the ``ID`` of its dual-mode
+detection, which is how the SQL scripts join them (``psf.id = dual.id``).
+Joining the two HiPSCat catalogs on ``ID`` instead of crossmatching them by
+position gives exactly one row per source (a 2" positional match can pair a
+PSF row with several dual rows in crowded regions), and writing the result
+as its own HiPSCat catalog -- partitioned like the dual catalog -- means user
+catalogs need a single crossmatch against it rather than a full-survey
+dual x PSF crossmatch on every run.
+
+The catalog is written next to the mirrors, as
+``<root>/<release>/dual_psf/{catalog,margin}`` (see :func:`mirror_links`).
+
+Usage: python -m splus_match.prejoin idr5 splus-prejoined [--mirror splus-mirror] \\
+           [--dual-columns ID RA DEC ...] [--psf-columns ID r_psf ...]
+"""
+import argparse
+from pathlib import Path
+
+from .lsdb_pipeline import n_partitions, read_catalog
+from .mirror import mirror_links
+
+try:
+    from dask.distributed import Client
+    from hipscat_import.margin_cache.margin_cache_arguments import MarginCacheArguments
+    from hipscat_import.pipeline import pipeline_with_client
+except ImportError:  # pragma: no cover - depends on the environment
+    MarginCacheArguments = None
+
+NAME = "dual_psf"
+SUFFIXES = ("_dual", "_psf")
+# Same width as the margin caches served by splus.cloud (e.g. dual_2arcsec)
+MARGIN_THRESHOLD = 2.0
+
+
+def prejoined_links(root, release):
+    """``(catalog, margin)`` paths of the pre-joined catalog; the margin is None if it was not built."""
+    catalog, margin = mirror_links(root, f"{release}/{NAME}")
+    return catalog, (margin if Path(margin).exists() else None)
+
+
+def prejoined_filters(dual_filters=None, psf_filters=None):
+    """The dual and PSF ``(column, op, value)`` filters renamed to the pre-joined catalog's columns.
+
+    The join suffixes every column with the catalog it came from (``r_auto``
+    becomes ``r_auto_dual``). Returns None when there are no filters.
+    """
+    filters = [(column + suffix, op, value)
+               for suffix, side in zip(SUFFIXES, (dual_filters, psf_filters))
+               for column, op, value in side or ()]
+    return filters or None
+
+
+def build_margin(catalog_path, margin_path, threshold=MARGIN_THRESHOLD, workers=4):
+    """Build the margin cache of ``catalog_path`` with hipscat-import.
+
+    Without a margin, user sources within ``threshold`` of a partition edge
+    can miss their counterpart in the neighbouring partition.
+    """
+    margin_path = Path(margin_path)
+    args = MarginCacheArguments(input_catalog_path=str(catalog_path),
+                                output_path=str(margin_path.parent),
+                                output_artifact_name=margin_path.name,
+                                margin_threshold=threshold)
+    with Client(n_workers=workers) as client:
+        pipeline_with_client(args, client)
+
+
+def build(dual_links, psf_links, root, release, headers=None, dual_columns=None, psf_columns=None,
+          margin=True, workers=4, report=print):
+    """Join the dual and PSF catalogs on ``ID`` and write the result as HiPSCat.
+
+    ``dual_links``/``psf_links`` are ``(catalog, margin)`` pairs, remote (from
+    ``splusdata.get_hipscats``) or local mirrors. The join runs partition by
+    partition (the PSF margin covers rows that landed in a neighbouring
+    pixel), so memory is bounded by the partition size. Returns the
+    :func:`prejoined_links` of the new catalog.
+    """
+    dual = read_catalog(dual_links, headers, columns=dual_columns)
+    psf = read_catalog(psf_links, headers, columns=psf_columns)
+    if report is not None:
+        report(f"Joining {n_partitions(dual)} dual partitions with {n_partitions(psf)} PSF partitions on ID")
+
+    joined = dual.join(psf, left_on="ID", right_on="ID", suffixes=SUFFIXES, output_catalog_name=NAME)
+    catalog_path, margin_path = mirror_links(root, f"{release}/{NAME}")
+    Path(catalog_path).parent.mkdir(parents=True, exist_ok=True)
+    joined.to_hipscat(catalog_path, catalog_name=NAME)
+    if report is not None:
+        report(f"Pre-joined catalog written to {catalog_path}")
+
+    if margin:
+        if MarginCacheArguments is None:
+            print("hipscat-import is not installed; the pre-joined catalog has no margin cache.")
+        else:
+            build_margin(catalog_path, margin_path, workers=workers)
+            if report is not None:
+                report(f"Margin cache written to {margin_path}")
+    return prejoined_links(root, release)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the ID-joined dual x PSF catalog of an S-PLUS release.")
+    parser.add_argument("release", help="data release, e.g. idr5")
+    parser.add_argument("root", help="output directory")
+    parser.add_argument("--mirror", help="read dual/psf from this local mirror instead of splus.cloud")
+    parser.add_argument("--dual-columns", nargs="+", help="dual columns to keep (default: all)")
+    parser.add_argument("--psf-columns", nargs="+", help="PSF columns to keep (default: all)")
+    parser.add_argument("--no-margin", action="store_true", help="do not build the margin cache")
+    parser.add_argument("--workers", type=int, default=4, help="dask workers for the margin cache")
+    args = parser.parse_args(argv)
+
+    if args.mirror:
+        headers = None
+        dual_links = mirror_links(args.mirror, f"{args.release}/dual")
+        psf_links = mirror_links(args.mirror, f"{args.release}/psf")
+    else:
+        import splusdata
+        headers = splusdata.Core().headers
+        dual_links = splusdata.get_hipscats(f"{args.release}/dual", headers=headers)[0]
+        psf_links = splusdata.get_hipscats(f"{args.release}/psf", headers=headers)[0]
+
+    # The join key must be kept on both sides
+    dual_columns = list(dict.fromkeys(["ID"] + args.dual_columns)) if args.dual_columns else None
+    psf_columns = list(dict.fromkeys(["ID"] + args.psf_columns)) if args.psf_columns else None
+    build(dual_links, psf_links, args.root, args.release, headers=headers, dual_columns=dual_columns,
+          psf_columns=psf_columns, margin=not args.no_margin, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
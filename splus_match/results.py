@@ -0,0 +1,61 @@
+"""Turn TAP query results into compact Arrow tables.
+
+``conn.query`` hands back an astropy ``Table`` (parsed from the VOTable
+response). Going through ``to_pandas()`` copies every column into float64 or
+object arrays; here the columns are moved into Arrow directly and downcast to
+compact types: float32 photometry, int16 flags and a dictionary-encoded
+``Field``. Positions stay float64.
+"""
+import io
+import re
+
+import numpy as np
+import pyarrow as pa
+
+# Columns kept in double precision: sky positions need it at the arcsec level
+FLOAT64_COLUMNS = re.compile(r"^(.*_)?(RA|DEC|ALPHA_J2000|DELTA_J2000)(_.*)?$", re.IGNORECASE)
+FLAG_COLUMNS = re.compile(r"(^|_)(SEX_)?FLAGS(_|$)", re.IGNORECASE)
+CATEGORY_COLUMNS = ("Field",)
+
+
+def _column_to_arrow(col):
+    data = np.asarray(col)
+    mask = np.ma.getmaskarray(col) if hasattr(col, "mask") else None
+    if data.dtype.kind == "S":
+        data = np.char.decode(data, "utf-8")
+    if data.dtype.kind == "U":
+        return pa.array(data.astype(object), mask=mask, type=pa.string())
+    if data.dtype.kind == "O":
+        return pa.array(data.tolist(), mask=mask)
+    return pa.array(data, mask=mask if mask is not None and mask.any() else None)
+
+
+def to_arrow(result):
+    """Arrow table from an astropy Table, a VOTable file/bytes, a DataFrame or an Arrow table."""
+    if isinstance(result, pa.Table):
+        return result
+    if hasattr(result, "colnames"):
+        return pa.table({name: _column_to_arrow(result[name]) for name in result.colnames})
+    if isinstance(result, (bytes, str)) or hasattr(result, "read"):
+        from astropy.io.votable import parse_single_table
+        source = io.BytesIO(result) if isinstance(result, bytes) else result
+        return to_arrow(parse_single_table(source).to_table())
+    return pa.Table.from_pandas(result, preserve_index=False)
+
+
+def compact_type(name, type_):
+    """The compact Arrow type for column ``name`` (decided by name, so every batch agrees)."""
+    if name in CATEGORY_COLUMNS and (pa.types.is_string(type_) or pa.types.is_large_string(type_)):
+        return pa.dictionary(pa.int32(), pa.string())
+    if pa.types.is_floating(type_) and not FLOAT64_COLUMNS.match(name):
+        return pa.float32()
+    if pa.types.is_integer(type_) and FLAG_COLUMNS.search(name):
+        return pa.int16()
+    return type_
+
+
+def compact(table):
+    """Downcast ``table`` to compact column types."""
+    table = to_arrow(table)
+    schema = pa.schema([pa.field(f.name, compact_type(f.name, f.type)) for f in table.schema])
+    return table.cast(schema, safe=False)
@@ -0,0 +1,209 @@
+"""Concurrent TAP query scheduler.
+
+Wraps ``conn.query`` for both field queries and ``TAP_UPLOAD`` joins with a
+bounded number of queries in flight, a token-bucket rate limit, exponential
+backoff with jitter on transient errors and a per-query timeout. Results are
+handed back in completion order.
+
+``splusdata`` queries are blocking calls, so the scheduler runs them on a
+thread pool rather than an event loop.
+"""
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .telemetry import result_nbytes
+
+QueryResult = namedtuple("QueryResult", ["key", "result", "error", "elapsed", "attempts"])
+
+# Substrings of error messages that indicate a transient server/network problem
+RETRYABLE_MESSAGES = (
+    "timeout", "timed out", "temporarily", "unavailable", "too many requests",
+    "429", "500", "502", "503", "504", "connection reset", "connection aborted",
+    "connection refused", "remote end closed",
+)
+
+
+class QueryTimeout(TimeoutError):
+    pass
+
+
+def is_retryable(exc):
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    message = str(exc).lower()
+    return any(text in message for text in RETRYABLE_MESSAGES)
+
+
+class TokenBucket:
+    """Allow on average ``rate`` acquisitions per second, in bursts of up to ``burst``."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = float(max(burst, 1))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait_time = (1.0 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class QueryScheduler:
+    """Run ``conn.query`` calls concurrently with rate limiting and retries.
+
+    ``max_concurrency`` bounds the queries in flight, ``rate`` (queries per
+    second, ``None`` for unlimited) and ``burst`` configure the token bucket,
+    ``retries`` is the number of extra attempts on retryable errors, with a
+    delay drawn from ``[d/2, d]`` where ``d = min(max_backoff, backoff * 2**attempt)``,
+    and ``timeout`` (seconds) bounds each attempt. Retries are printed unless
+    ``verbose`` is false. Each attempt is reported as a ``network`` event to
+    ``telemetry`` (a :class:`splus_match.telemetry.Telemetry`) if given.
+    """
+
+    def __init__(self, conn, max_concurrency=4, rate=None, burst=1, retries=4,
+                 backoff=1.0, max_backoff=60.0, timeout=None, retryable=is_retryable,
+                 verbose=True, telemetry=None):
+        self.conn = conn
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retryable = retryable
+        self.verbose = verbose
+        self.telemetry = telemetry
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.lock = threading.Lock()
+        self.stats = {"queries": 0, "attempts": 0, "retries": 0, "failures": 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def _call(self, query, upload):
+        if upload is None:
+            call = lambda: self.conn.query(query)  # noqa: E731
+        else:
+            call = lambda: self.conn.query(query, upload)  # noqa: E731
+        if self.timeout is None:
+            return call()
+
+        # The blocking call cannot be cancelled, so it runs on a daemon thread
+        # that is abandoned if it outlives the timeout
+        outcome = {}
+
+        def target():
+            try:
+                outcome["result"] = call()
+            except BaseException as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        if thread.is_alive():
+            raise QueryTimeout(f"query timed out after {self.timeout} s")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    def _attempt(self, key, attempt, query, upload):
+        if self.telemetry is None:
+            return self._call(query, upload)
+        t0 = time.perf_counter()
+        try:
+            result = self._call(query, upload)
+        except Exception as e:
+            self.telemetry.event("network", time.perf_counter() - t0, key=key, attempt=attempt,
+                                 ok=False, error=str(e)[:200])
+            raise
+        self.telemetry.event("network", time.perf_counter() - t0, key=key, attempt=attempt, ok=True,
+                             rows=len(result) if hasattr(result, "__len__") else None,
+                             bytes=result_nbytes(result))
+        return result
+
+    def query(self, query, upload=None, retryable=None, key=None):
+        """Run one query in the calling thread, retrying transient errors.
+
+        Returns ``(result, attempts)``; the last error is raised once the
+        retries are exhausted or the error is not retryable.
+        """
+        retryable = retryable or self.retryable
+        self._count("queries")
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            self._count("attempts")
+            try:
+                return self._attempt(key, attempt + 1, query, upload), attempt + 1
+            except Exception as e:
+                if attempt >= self.retries or not retryable(e):
+                    self._count("failures")
+                    raise
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+                delay = random.uniform(delay / 2.0, delay)
+                if self.verbose:
+                    print(f"Retrying query after error ({e}); attempt {attempt + 2} in {delay:.1f} s")
+                self._count("retries")
+                if self.telemetry is not None:
+                    self.telemetry.count("retries")
+                attempt += 1
+                time.sleep(delay)
+
+    def _run_job(self, key, query, upload, retryable):
+        start = time.monotonic()
+        try:
+            result, attempts = self.query(query, upload, retryable, key=key)
+            return QueryResult(key, result, None, time.monotonic() - start, attempts)
+        except Exception as e:
+            return QueryResult(key, None, e, time.monotonic() - start, None)
+
+    def submit(self, key, query, upload=None, retryable=None):
+        """Schedule one query; the future resolves to a :class:`QueryResult`."""
+        return self.executor.submit(self._run_job, key, query, upload, retryable)
+
+    def run(self, jobs):
+        """Run ``(key, query, upload)`` jobs and yield :class:`QueryResult` in completion order.
+
+        Jobs are submitted lazily, keeping at most twice ``max_concurrency``
+        queued, so a long job list does not hold all uploads in memory.
+        """
+        jobs = iter(jobs)
+        pending = set()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < 2 * self.max_concurrency:
+                try:
+                    key, query, upload = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(self.submit(key, query, upload))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
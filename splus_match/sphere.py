@@ -0,0 +1,55 @@
+"""Small spherical-geometry helpers shared by the matching code."""
+import numpy as np
+
+ARCSEC_PER_RAD = 180.0 / np.pi * 3600.0
+
+
+def radec_to_xyz(ra, dec):
+    # RA/DEC in degrees -> unit vectors, shape (N, 3)
+    ra = np.radians(np.asarray(ra, dtype=np.float64))
+    dec = np.radians(np.asarray(dec, dtype=np.float64))
+    cos_dec = np.cos(dec)
+    return np.column_stack((cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)))
+
+
+def arcsec_to_chord(radius_arcsec):
+    # Angular separation on the sphere -> straight-line distance between unit vectors
+    return 2.0 * np.sin(np.asarray(radius_arcsec, dtype=np.float64) / ARCSEC_PER_RAD / 2.0)
+
+
+def chord_to_arcsec(chord):
+    return 2.0 * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2.0, 0.0, 1.0)) * ARCSEC_PER_RAD
+
+
+try:
+    import healpy
+except ImportError:  # pragma: no cover - optional dependency
+    healpy = None
+
+
+def _spread_bits(v):
+    # Put the low 32 bits of v on the even bit positions of a 64-bit integer
+    v = v & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def sky_index(ra, dec, order=16):
+    """Space-filling-curve index of each position; nearby cells get nearby values.
+
+    Uses the nested HEALPix pixel at ``order`` when healpy is installed, and
+    otherwise a Morton (Z-order) code on an equal-area (RA, sin DEC) grid
+    of ``2**order`` cells per axis.
+    """
+    ra = np.mod(np.asarray(ra, dtype=np.float64), 360.0)
+    dec = np.clip(np.asarray(dec, dtype=np.float64), -90.0, 90.0)
+    if healpy is not None:
+        return healpy.ang2pix(2 ** order, ra, dec, nest=True, lonlat=True).astype(np.uint64)
+    cells = 2 ** order
+    x = np.minimum(ra / 360.0 * cells, cells - 1).astype(np.uint64)
+    y = np.minimum((np.sin(np.radians(dec)) + 1.0) / 2.0 * cells, cells - 1).astype(np.uint64)
+    return _spread_bits(x) | (_spread_bits(y) << np.uint64(1))
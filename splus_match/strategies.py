@@ -0,0 +1,387 @@
+"""The three ways of crossmatching a local catalog with S-PLUS.
+
+``upload``  the local positions are uploaded in adaptive chunks and joined on
+            the server with a cone predicate (formerly v3, v4 and RA_DEC)
+``field``   whole S-PLUS fields overlapping the catalog are downloaded (and
+            cached) and matched locally on all cores (formerly v2 and dr4),
+            or on a Dask cluster with :mod:`splus_match.distributed`
+``lsdb``    the HiPSCat catalogs are crossmatched partition by partition with
+            LSDB, remotely or from a local mirror (formerly the lsdb script)
+
+Every strategy writes its matches to ``out`` and returns a stats dict with
+the number of input sources, output rows and wall time, so the strategies
+can be compared on the same workload. The upload and field strategies keep
+a run manifest next to the output and resume interrupted runs. Their stages
+are reported to a :class:`splus_match.telemetry.Telemetry`, and ``profile``
+(``"cprofile"`` or ``"pyinstrument"``) profiles the local matching into
+``profile_dir`` (default ``<out>_profile``).
+"""
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .adql import BANDS, build_query, build_summary_query, main_alias, query_columns, release_name
+from .cache import FieldCache
+from .chunking import AdaptiveChunker, bbox_predicate, done_spans, remaining_spans, sort_by_sky, span_unit
+from .footprint import add_field_centres, select_fields
+from .inputs import validate_positions
+from .manifest import RunManifest, run_fingerprint
+from .matcher import resolve_pairs
+from .pipeline import FieldPipeline
+from .results import compact
+from .scheduler import QueryScheduler
+from .telemetry import MatchProfiler, Telemetry
+from .writer import StreamingWriter
+
+STRATEGIES = ("upload", "field", "lsdb")
+
+# Uploaded row number that summary rows are grouped on and joined back by
+SUMMARY_KEY = "row_id"
+
+# Radius pairing PSF rows with their dual detections in the LSDB strategy,
+# independent of the user's match radius (as in the original LSDB script)
+DUAL_PSF_RADIUS_ARCSEC = 2.0
+
+# Field lists with the S-PLUS field names and centres, per data release
+FIELD_TABLES = {
+    "idr4": "https://splus.cloud/files/documentation/iDR4/tabelas/iDR4_zero-points.csv",
+    "idr5": "iDR5_fields_zps.csv",
+}
+
+
+def default_run_dir(out):
+    return str(Path(out).with_suffix("")) + "_run"
+
+
+def default_profile_dir(out):
+    return str(Path(out).with_suffix("")) + "_profile"
+
+
+def check_clashes(columns, query):
+    """Raise if local ``columns`` share a name (case-insensitively) with a column the ``query`` returns."""
+    returned = {name.lower() for name in query_columns(query)}
+    clashes = [c for c in columns if c.lower() in returned]
+    if clashes:
+        raise ValueError(f"local columns {', '.join(clashes)} have the same names as S-PLUS columns in the "
+                         f"query; rename them (e.g. to local_{clashes[0]})")
+
+
+def field_centres_path(cache_dir, release):
+    # Field centres derived from the server, for field lists without them
+    return Path(cache_dir) / f"{release}_field_centres.csv"
+
+
+def field_fingerprint(local, query_template, radius_arcsec, mode):
+    # Shared by the process-pool and the Dask field runs, which write the same shards
+    return run_fingerprint({"strategy": "field", "query": query_template, "radius": radius_arcsec, "mode": mode},
+                           local)
+
+
+def _stats(strategy, local, rows, output, t0, telemetry, **extra):
+    stats = {"strategy": strategy, "sources": len(local), "rows": rows, "output": str(output),
+             "seconds": time.perf_counter() - t0, "telemetry": telemetry.summary()}
+    stats.update(extra)
+    return stats
+
+
+def run_upload(local, conn, out, release="idr5", radius_arcsec=2.0, ra_col="RA", dec_col="DEC",
+               bands=BANDS, photometry=("PStotal",), columns=None, errors=True, join="LEFT OUTER",
+               mode="all", initial_chunk=100, target_rows=200000, bbox=True, run_dir=None,
+               max_concurrency=4, rate=2.0, retries=4, timeout=600, telemetry=None, profile=None,
+               profile_dir=None, extra_columns=(), filters=(), aggregates=None):
+    """Upload the local positions in chunks and join them with the dual/PSF tables on the server.
+
+    ``extra_columns`` (e.g. an ID or :data:`splus_match.inputs.SOURCE_ROW`)
+    are uploaded and returned along with the positions.
+    ``filters`` are ``(column, op, value)`` cuts applied by the server. With
+    ``aggregates`` (see :func:`splus_match.adql.build_summary_query`) the
+    server returns one summary row per source instead of the matches, and
+    the output has one row per local source (``n_match`` 0 where nothing
+    passed the filters).
+    """
+    t0 = time.perf_counter()
+    telemetry = telemetry or Telemetry()
+    release = release_name(release)
+    radius = radius_arcsec / 3600.0
+    alias = main_alias(release)
+
+    # Only the positions are uploaded, sorted along a space-filling curve so that
+    # each chunk covers a compact patch of sky (the order is deterministic, so
+    # row ranges stay valid between runs); they come back with the matches
+    upload_columns = list(dict.fromkeys([*extra_columns, ra_col, dec_col]))
+    upload = local[upload_columns]
+    if aggregates:
+        upload = upload.assign(**{SUMMARY_KEY: np.arange(len(local))})[[SUMMARY_KEY, ra_col, dec_col]]
+    upload = sort_by_sky(upload, ra_col, dec_col)
+    with telemetry.stage("query_build"):
+        if aggregates:
+            query_template = build_summary_query(release, radius, ra_col=ra_col, dec_col=dec_col,
+                                                 key_col=SUMMARY_KEY, aggregates=aggregates,
+                                                 filters=filters, bbox=bbox)
+        else:
+            query_template = build_query(release, bands=bands, photometry=photometry, columns=columns,
+                                         errors=errors, radius=radius, ra_col=ra_col, dec_col=dec_col,
+                                         upload_columns=upload_columns, join=join, bbox=bbox, filters=filters)
+    if not aggregates:
+        # Uploaded and S-PLUS columns of the same name would be confused in the result
+        check_clashes(upload_columns, query_template)
+    profiler = MatchProfiler(profile, Path(profile_dir or default_profile_dir(out)) / "match") if profile else None
+
+    def chunk_query(chunk):
+        if not bbox:
+            return query_template
+        return query_template.format(bbox=bbox_predicate(chunk, ra_col, dec_col, radius, alias))
+
+    # Row spans only mean the same rows for the same sorted upload
+    fingerprint = run_fingerprint({"strategy": "upload", "query": query_template, "mode": mode,
+                                   "aggregates": aggregates}, upload)
+    run = RunManifest(run_dir or default_run_dir(out), fingerprint=fingerprint)
+    spans = remaining_spans(len(upload), done_spans(run))
+    print(f"{sum(stop - start for start, stop in spans)} of {len(upload)} sources left to query")
+
+    chunker = AdaptiveChunker(initial=initial_chunk, target_rows=target_rows)
+    with QueryScheduler(conn, max_concurrency=max_concurrency, rate=rate, burst=max_concurrency,
+                        retries=retries, timeout=timeout, telemetry=telemetry) as scheduler:
+        for chunk in chunker.run(scheduler, chunk_query, upload, spans):
+            unit = span_unit(chunk.start, chunk.stop)
+            if chunk.error is not None:
+                print(f"Error querying rows {chunk.start}-{chunk.stop}: {chunk.error}")
+                run.mark_failed(unit, chunk.error)
+                continue
+            # Compact Arrow columns with the separation and rank of each pair
+            matched_table = None
+            if chunk.result and aggregates:
+                # Already one row per source
+                with telemetry.stage("decode", key=unit):
+                    matched_table = compact(chunk.result)
+            elif chunk.result:
+                with telemetry.stage("decode", key=unit):
+                    table = compact(chunk.result)
+                # Every pair is kept: an S-PLUS source can be matched from several
+                # chunks, so the mode is applied over all of them when merging
+                with telemetry.stage("match", key=unit, pairs=len(table)):
+                    if profiler is None:
+                        matched_table = resolve_pairs(table, "all", left=(ra_col, dec_col))
+                    else:
+                        with profiler:
+                            matched_table = resolve_pairs(table, "all", left=(ra_col, dec_col))
+            with telemetry.stage("write", key=unit, rows=len(matched_table) if matched_table is not None else 0):
+                run.save(unit, matched_table)
+            print(f"Rows {chunk.start}-{chunk.stop} done in {chunk.elapsed:.1f} s "
+                  f"(next chunk size {chunker.next_size()})")
+    print(f"{chunker.stats['chunks']} chunks done, {chunker.stats['splits']} splits, "
+          f"{chunker.stats['failed']} failed")
+    if profiler is not None:
+        print(f"Match profile saved to {profiler.save()}")
+
+    # Failed spans are cut at new boundaries on resume, so their manifest
+    # records are never replaced; what is left is what no done span covers
+    missing = remaining_spans(len(upload), done_spans(run))
+    failed = len(missing)
+    if failed:
+        print(f"{failed} row ranges ({sum(stop - start for start, stop in missing)} sources) failed; "
+              "rerun to retry them")
+    if aggregates:
+        writer = _summary_output(local, run, out, upload_columns)
+    else:
+        writer = run.merge(out, units=sorted(run.units), mode=mode, left=(ra_col, dec_col))
+    return _stats("upload", local, writer.rows, writer.path, t0, telemetry, queries=chunker.stats["chunks"],
+                  failed=failed)
+
+
+def _summary_output(local, run, out, columns):
+    # One row per local source: its positions (and ID) with the server's summary
+    merged = run.merge(run.run_dir / "summary.parquet", units=sorted(run.units)).path
+    if merged.exists():
+        summary = pd.read_parquet(merged) if merged.suffix == ".parquet" else pd.read_csv(merged)
+    else:
+        summary = pd.DataFrame({SUMMARY_KEY: pd.Series(dtype=np.int64)})
+    table = local[columns].reset_index(drop=True)
+    table = table.join(summary.set_index(SUMMARY_KEY), how="left")
+    if "n_match" in table:
+        table["n_match"] = table["n_match"].fillna(0).astype(np.int64)
+    writer = StreamingWriter(out)
+    writer.write(table)
+    writer.close()
+    return writer
+
+
+def matched_rows(local, splus_data, splus_idx, local_idx, sep, rank):
+    """Output rows of a field: the matched local and S-PLUS rows side by side."""
+    matched_splus = splus_data.iloc[splus_idx]
+    matched_local = local.iloc[local_idx]
+    matched_table = pd.concat([matched_local.reset_index(drop=True), matched_splus.reset_index(drop=True)], axis=1)
+    matched_table["sep_arcsec"] = sep
+    matched_table["match_rank"] = rank
+    return matched_table
+
+
+def run_field(local, conn, out, release="idr5", radius_arcsec=2.0, ra_col="RA", dec_col="DEC",
+              bands=BANDS, photometry=("PStotal", "psf"), columns=None, errors=True, mode="best_right",
+              fields=None, cache_dir="splus_field_cache", cache_max_gb=50, offline=False,
+              match_workers=None, fields_per_task=2, write_workers=2, run_dir=None,
+              max_concurrency=4, rate=2.0, retries=4, timeout=600, telemetry=None, profile=None,
+              profile_dir=None, filters=()):
+    """Download the S-PLUS fields overlapping the catalog and match them locally.
+
+    ``filters`` are ``(column, op, value)`` cuts applied by the server to the
+    downloaded rows.
+    """
+    t0 = time.perf_counter()
+    telemetry = telemetry or Telemetry()
+    release = release_name(release)
+    ra, dec = local[ra_col].values, local[dec_col].values
+    with telemetry.stage("query_build"):
+        query_template = build_query(release, bands=bands, photometry=photometry, columns=columns,
+                                     errors=errors, field="{field}", filters=filters)
+    # The local and S-PLUS columns of a match are written side by side
+    check_clashes(local.columns, query_template)
+
+    # Only query fields whose footprint overlaps at least one local source
+    if fields is None:
+        fields = pd.read_csv(FIELD_TABLES[release])
+    fields = add_field_centres(fields, None if conn is None else (lambda: conn), release,
+                               field_centres_path(cache_dir, release))
+    n_fields = len(fields)
+    fields, n_skipped = select_fields(fields, ra, dec, match_radius_arcsec=radius_arcsec)
+    telemetry.count("fields_skipped", n_skipped)
+    print(f"Querying {len(fields)} of {n_fields} fields ({n_skipped} fields without input sources skipped)")
+
+    run = RunManifest(run_dir or default_run_dir(out), fingerprint=field_fingerprint(local, query_template,
+                                                                                   radius_arcsec, mode))
+    run.add(fields["Field"])
+    todo = run.todo(fields["Field"])
+    print(f"{len(fields) - len(todo)} fields already done, {len(todo)} to query")
+
+    def save_field(field, splus_data, splus_idx, local_idx, sep, rank):
+        matched_table = matched_rows(local, splus_data, splus_idx, local_idx, sep, rank)
+        run.save(field, matched_table)
+        print(f"Found {len(matched_table)} matches for field {field}")
+
+    def field_failed(field, error):
+        print(f"Error matching field {field}: {error}")
+        run.mark_failed(field, error)
+
+    # Fields already in the local cache are matched without contacting the server
+    cache = FieldCache(cache_dir, max_bytes=cache_max_gb * 1024**3)
+    cached, to_download = cache.split(release, todo, query_template)
+    if offline:
+        for field in to_download:
+            print(f"Field {field} is not in the cache (offline mode)")
+            run.mark_failed(field, "not in cache (offline mode)")
+        to_download = []
+
+    def cached_fields():
+        for field in cached:
+            with telemetry.stage("cache_read", key=field):
+                splus_data = cache.get(release, field, query_template)
+            if splus_data is None:
+                run.mark_failed(field, "evicted from the cache during the run")
+                continue
+            yield field, splus_data
+
+    def downloaded_fields():
+        scheduler = QueryScheduler(conn, max_concurrency=max_concurrency, rate=rate,
+                                   burst=max_concurrency, retries=retries, timeout=timeout,
+                                   telemetry=telemetry)
+        jobs = ((field, query_template.format(field=field), None) for field in to_download)
+        try:
+            for res in scheduler.run(jobs):
+                field = res.key
+                if res.error is not None:
+                    print(f"Error querying field {field}: {res.error}")
+                    run.mark_failed(field, res.error)
+                    continue
+                # Compact types (float32 photometry, int16 flags, categorical Field)
+                # carry through matching and into the cache
+                with telemetry.stage("decode", key=field):
+                    splus_data = compact(res.result).to_pandas()
+                cache.put(release, field, query_template, splus_data)
+                print(f"Downloaded field {field} in {res.elapsed:.1f} s")
+                yield field, splus_data
+        finally:
+            scheduler.close()
+
+    # Fields overlap, so a local source can be matched in several of them: every
+    # pair is kept and the mode is applied over all fields when merging
+    pipeline = FieldPipeline(ra, dec, radius_arcsec=radius_arcsec, match_workers=match_workers,
+                             write_workers=write_workers, batch_size=fields_per_task, mode="all",
+                             telemetry=telemetry,
+                             profile=(profile, profile_dir or default_profile_dir(out)) if profile else None)
+    pipeline.run([cached_fields(), downloaded_fields()], save_field, on_error=field_failed)
+    print(pipeline.summary())
+    if profile:
+        print(f"Match profiles saved to {pipeline.stats.get('profile') or profile_dir or default_profile_dir(out)}")
+    print(cache.summary())
+
+    failed = run.counts()["failed"]
+    if failed:
+        print(f"{failed} fields failed; rerun to retry them")
+    writer = run.merge(out, units=fields["Field"], mode=mode, left=(ra_col, dec_col))
+    return _stats("field", local, writer.rows, writer.path, t0, telemetry, queries=len(to_download),
+                  failed=failed)
+
+
+def run_lsdb(local, out, release="idr5", radius_arcsec=2.0, ra_col="RA", dec_col="DEC", headers=None,
+             dual_columns=None, dual_filters=None, psf_columns=None, psf_filters=None,
+             mirror_dir=None, prejoined_dir=None, prejoined_columns=None, parallel=4, telemetry=None):
+    """Crossmatch the catalog with the dual/PSF HiPSCat catalogs, partition by partition.
+
+    ``dual_filters`` and ``psf_filters`` are also applied to the pre-joined
+    catalog, under its suffixed column names.
+    """
+    # LSDB is only needed by this strategy
+    import lsdb
+    from .lsdb_pipeline import n_partitions, read_catalog, stream_partitions, timing_summary
+    from .mirror import mirror_links
+    from .prejoin import prejoined_filters, prejoined_links
+
+    t0 = time.perf_counter()
+    telemetry = telemetry or Telemetry()
+    release = release_name(release)
+    if prejoined_dir:
+        # ID-joined dual x PSF catalog built once per release
+        dual_psf = read_catalog(prejoined_links(prejoined_dir, release), columns=prejoined_columns,
+                                filters=prejoined_filters(dual_filters, psf_filters))
+        print(f"Pre-joined dual_psf catalog: {n_partitions(dual_psf)} partitions")
+    else:
+        if mirror_dir:
+            headers = None
+            dual_links = mirror_links(mirror_dir, f"{release}/dual")
+            psf_links = mirror_links(mirror_dir, f"{release}/psf")
+        else:
+            import splusdata
+            dual_links = splusdata.get_hipscats(f"{release}/dual", headers=headers)[0]
+            psf_links = splusdata.get_hipscats(f"{release}/psf", headers=headers)[0]
+        dual = read_catalog(dual_links, headers, columns=dual_columns, filters=dual_filters)
+        psf = read_catalog(psf_links, headers, columns=psf_columns, filters=psf_filters)
+        print(f"Dual catalog: {n_partitions(dual)} partitions, psf catalog: {n_partitions(psf)} partitions")
+        dual_psf = psf.crossmatch(dual, radius_arcsec=DUAL_PSF_RADIUS_ARCSEC)
+
+    validate_positions(local[ra_col].to_numpy(dtype=np.float64, na_value=np.nan, copy=True),
+                       local[dec_col].to_numpy(dtype=np.float64, na_value=np.nan), on_invalid="raise")
+    local_hips = lsdb.from_dataframe(local, ra_column=ra_col, dec_column=dec_col, margin_threshold=3600)
+    matched_table = local_hips.crossmatch(dual_psf, radius_arcsec=radius_arcsec)
+
+    writer = StreamingWriter(out)
+    try:
+        timings = stream_partitions(matched_table, writer, parallel=parallel)
+    finally:
+        writer.close()
+    print(timing_summary(timings))
+    # Reading, matching and writing a batch of partitions happen in one dask computation
+    for partitions, rows, seconds in timings:
+        telemetry.event("partition_batch", seconds, key=f"{partitions.start}-{partitions.stop - 1}",
+                        rows=rows, partitions=len(partitions))
+    telemetry.count("write_rows", writer.rows)
+    return _stats("lsdb", local, writer.rows, writer.path, t0, telemetry,
+                  partitions=sum(len(p) for p, _, _ in timings))
+
+
+def throughput_summary(stats):
+    seconds = max(stats["seconds"], 1e-9)
+    return (f"{stats['strategy']}: {stats['sources']} sources -> {stats['rows']} rows in "
+            f"{stats['seconds']:.1f} s ({stats['sources'] / seconds:.1f} sources/s, "
+            f"{stats['rows'] / seconds:.1f} rows/s); saved to {stats['output']}")
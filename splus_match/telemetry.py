@@ -0,0 +1,226 @@
+"""Per-stage timings and counters of a crossmatch run.
+
+Every stage of a run reports events to a :class:`Telemetry`:
+
+``query_build``  building the ADQL template
+``network``      one query attempt, from submission to the parsed response
+                 (``rows``, ``bytes`` of the decoded table, ``ok``)
+``decode``       converting a response to pandas/Arrow
+``coords``       building the local catalog's search tree
+``match``        matching one field or chunk against the local catalog
+``write``        persisting the matches of one field or chunk
+
+Events are appended to a JSON-lines file as they happen (one object per
+line with ``t``, ``stage``, ``seconds`` and the stage's own fields), and
+:meth:`Telemetry.summary` condenses them into the end-of-run report: query
+latency percentiles, rows/s, retries, skipped fields and peak memory, so a
+slow run shows whether the time went to the server, the network or local
+CPU.
+
+:class:`MatchProfiler` is the optional cProfile/pyinstrument hook for the
+local match stage.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where unavailable."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+def result_nbytes(result):
+    """Size of a query result in memory (astropy Table, DataFrame or Arrow table)."""
+    if result is None:
+        return 0
+    if hasattr(result, "nbytes") and not hasattr(result, "colnames"):
+        return int(result.nbytes)
+    if hasattr(result, "memory_usage"):
+        return int(result.memory_usage(index=False).sum())
+    if hasattr(result, "itercols"):
+        return int(sum(col.nbytes for col in result.itercols()))
+    return 0
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+class Telemetry:
+    """Collect stage events and counters; write them to ``path`` as JSON lines if given.
+
+    Thread-safe: the scheduler's download threads and the pipeline's writer
+    threads report to the same instance.
+    """
+
+    def __init__(self, path=None, **run_info):
+        self.path = Path(path) if path else None
+        self._file = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a")
+        self.lock = threading.Lock()
+        self.seconds = defaultdict(list)
+        self.counters = defaultdict(int)
+        self.t0 = time.perf_counter()
+        self.event("start", **run_info)
+
+    def _emit(self, record):
+        if self._file is not None:
+            self._file.write(json.dumps(record, default=str) + "\n")
+            self._file.flush()
+
+    def event(self, stage, seconds=None, **fields):
+        """Record one event of ``stage``; numeric ``rows`` and ``bytes`` fields are also summed."""
+        record = {"t": round(time.time(), 3), "stage": stage}
+        if seconds is not None:
+            record["seconds"] = round(seconds, 6)
+        record.update(fields)
+        with self.lock:
+            if seconds is not None:
+                self.seconds[stage].append(seconds)
+            for name in ("rows", "bytes"):
+                if isinstance(fields.get(name), int):
+                    self.counters[f"{stage}_{name}"] += fields[name]
+            self._emit(record)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Time the ``with`` block as one ``name`` event; the yielded dict adds fields to it."""
+        t0 = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.event(name, time.perf_counter() - t0, **fields)
+
+    def summary(self):
+        """End-of-run report as a dict."""
+        with self.lock:
+            wall = time.perf_counter() - self.t0
+            stages = {}
+            for name, values in self.seconds.items():
+                stages[name] = {"events": len(values), "seconds": sum(values),
+                                "p50": percentile(values, 50), "p95": percentile(values, 95)}
+            counters = dict(self.counters)
+        latency = stages.get("network", {})
+        return {
+            "wall_seconds": wall,
+            "stages": stages,
+            "counters": counters,
+            "query_p50": latency.get("p50"),
+            "query_p95": latency.get("p95"),
+            "retries": counters.get("retries", 0),
+            "fields_skipped": counters.get("fields_skipped", 0),
+            "rows_per_second": counters.get("write_rows", 0) / max(wall, 1e-9),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+    def report(self):
+        s = self.summary()
+        lines = [f"Run telemetry ({s['wall_seconds']:.1f} s wall):"]
+        for name, stage in sorted(s["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            lines.append(f"  {name:<12} {stage['events']:>7} events {stage['seconds']:>10.1f} s "
+                         f"(p50 {stage['p50']:.3f} s, p95 {stage['p95']:.3f} s)")
+        if s["query_p50"] is not None:
+            # In-memory size of the decoded results; the transfer size is not exposed by the client
+            decoded = s["counters"].get("network_bytes", 0) / 1024**2
+            lines.append(f"  queries: p50 {s['query_p50']:.2f} s, p95 {s['query_p95']:.2f} s, "
+                         f"{s['retries']} retries, {decoded:.1f} MB decoded")
+        lines.append(f"  {s['counters'].get('write_rows', 0)} rows written ({s['rows_per_second']:.1f} rows/s), "
+                     f"{s['fields_skipped']} fields skipped")
+        if s["peak_rss_mb"] is not None:
+            lines.append(f"  peak memory {s['peak_rss_mb']:.0f} MB")
+        return "\n".join(lines)
+
+    def close(self):
+        """Write the summary event and close the events file; returns the summary."""
+        summary = self.summary()
+        with self.lock:
+            self._emit({"t": round(time.time(), 3), "stage": "summary", **summary})
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        return summary
+
+
+class MatchProfiler:
+    """Accumulate a cProfile or pyinstrument profile over repeated ``with`` blocks.
+
+    ``save()`` writes what has been collected so far to ``path`` + ``.prof``
+    (cProfile, readable with ``pstats`` or snakeviz) or ``.txt`` (pyinstrument).
+    """
+
+    def __init__(self, kind, path):
+        if kind not in PROFILERS:
+            raise ValueError(f"unknown profiler {kind!r}; expected one of {', '.join(PROFILERS)}")
+        if kind == "pyinstrument" and pyinstrument is None:
+            raise ImportError("pyinstrument is not installed")
+        self.kind = kind
+        self.path = Path(str(path) + (".prof" if kind == "cprofile" else ".txt"))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if kind == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+        else:
+            self._profiler = pyinstrument.Profiler()
+
+    def __enter__(self):
+        if self.kind == "cprofile":
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.kind == "cprofile":
+            self._profiler.disable()
+        else:
+            self._profiler.stop()
+
+    def save(self):
+        if self.kind == "cprofile":
+            self._profiler.dump_stats(str(self.path))
+        else:
+            self.path.write_text(self._profiler.output_text(unicode=False, color=False))
+        return self.path
+
+
+def merge_profiles(directory, pattern="match-*.prof", output="match.prof"):
+    """Combine the per-process cProfile files in ``directory``; returns the merged path or None."""
+    import pstats
+    paths = sorted(str(p) for p in Path(directory).glob(pattern))
+    if not paths:
+        return None
+    stats = pstats.Stats(*paths)
+    merged = os.path.join(directory, output)
+    stats.dump_stats(merged)
+    return merged
@@ -0,0 +1,324 @@
+"""Local stand-ins for a ``splusdata.connect(...)`` connection and the S-PLUS database.
+
+Used by the benchmarks to exercise the query machinery and the matching
+strategies without the live splus.cloud service. :class:`FakeConnection`
+injects latency and failures; :class:`FakeSplusServer` answers the queries
+the scripts send (field queries, ``TAP_UPLOAD`` cone joins and the old
+per-source ``ACOS`` queries) from a synthetic catalog made by
+:func:`synthetic_splus`.
+"""
+import random
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+from astropy.table import Table
+
+from .footprint import TILE_SIZE_DEG
+from .matcher import LocalMatcher
+from .sphere import chord_to_arcsec, radec_to_xyz
+
+# WHERE conditions the server evaluates: alias.column <op> number
+CONDITION = re.compile(r"\w+\.(\w+) (<=|>=|<>|<|>|=) ([-+0-9.eE]+)")
+OPS = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+       "=": np.equal, "<>": np.not_equal}
+
+
+class FakeConnection:
+    """Mimics ``conn.query(query, table_upload=None)``.
+
+    Every call sleeps ``latency`` seconds (plus up to ``jitter`` more) and
+    fails with probability ``failure_rate`` by raising ``failure``. The result
+    comes from ``handler(query, upload)``, an empty table by default.
+    """
+
+    def __init__(self, handler=None, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 failure=None, seed=None):
+        self.handler = handler
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure = failure or (lambda: ConnectionError("503 Service Unavailable (injected)"))
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def query(self, query, table_upload=None):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = self.latency + self.random.uniform(0.0, self.jitter)
+            fail = self.random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        try:
+            time.sleep(delay)
+            if fail:
+                raise self.failure()
+            if self.handler is None:
+                return Table()
+            return self.handler(query, table_upload)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def synthetic_splus(n_rows, n_fields=None, seed=0):
+    """S-PLUS-like detections: ``Field``, ``ID``, ``RA``, ``DEC``, sorted by field.
+
+    Fields are 1.4 deg tiles on a grid starting at RA 150, DEC -20, with
+    about 50000 sources each unless ``n_fields`` is given.
+    """
+    rng = np.random.default_rng(seed)
+    n_fields = n_fields or int(np.clip(n_rows // 50000, 1, 2000))
+    side = int(np.ceil(np.sqrt(n_fields)))
+    field_of = np.sort(rng.integers(0, n_fields, n_rows))
+    ra0 = 150.0 + (np.arange(n_fields) % side) * TILE_SIZE_DEG * 1.2
+    dec0 = -20.0 + (np.arange(n_fields) // side) * TILE_SIZE_DEG
+    dec = dec0[field_of] + (rng.random(n_rows) - 0.5) * TILE_SIZE_DEG
+    ra = ra0[field_of] + (rng.random(n_rows) - 0.5) * TILE_SIZE_DEG / np.cos(np.radians(dec))
+    names = np.array([f"SPLUS-b{i // side:03d}n{i % side:03d}" for i in range(n_fields)])
+    return pd.DataFrame({
+        "Field": pd.Categorical.from_codes(field_of, categories=names),
+        "ID": np.arange(n_rows, dtype=np.int64),
+        "RA": ra,
+        "DEC": dec,
+    })
+
+
+def synthetic_galex(splus, n_rows, match_fraction=0.5, offset_arcsec=0.5, seed=1):
+    """GALEX-like input positions: ``match_fraction`` of them near an S-PLUS source, the rest at random."""
+    rng = np.random.default_rng(seed)
+    n_matched = int(n_rows * match_fraction)
+    pick = rng.integers(0, len(splus), n_rows)
+    ra = splus["RA"].to_numpy()[pick]
+    dec = splus["DEC"].to_numpy()[pick]
+    offset = rng.normal(0.0, offset_arcsec / 3600.0, (2, n_rows))
+    # Unmatched sources are moved well outside any match radius
+    offset[:, n_matched:] += rng.choice([-1.0, 1.0], (2, n_rows - n_matched)) * 30.0 / 3600.0
+    return pd.DataFrame({"GALEX_RA": ra + offset[0] / np.cos(np.radians(dec)),
+                         "GALEX_DEC": dec + offset[1],
+                         "NUVmag": rng.normal(20.0, 1.0, n_rows).astype(np.float32)})
+
+
+def _synthetic_column(name, ids):
+    # Deterministic per-source values for any selected photometry column
+    phase = (ids * 0.6180339887498949 + zlib.crc32(name.encode()) / 2**32) % 1.0
+    if name.startswith("e_"):
+        return (0.005 + 0.2 * phase).astype(np.float32)
+    if "FLAGS" in name.upper():
+        return (phase * 4).astype(np.int16)
+    return (14.0 + 10.0 * phase).astype(np.float32)
+
+
+class FakeSplusServer:
+    """Answer S-PLUS ADQL queries from a synthetic catalog; use as a :class:`FakeConnection` handler.
+
+    Understands the queries built by :func:`splus_match.adql.build_query`
+    (``Field = '...'`` and ``TAP_UPLOAD`` cone joins, inner or left outer,
+    with numeric ``WHERE`` filters), the ``GROUP BY`` summaries of
+    :func:`splus_match.adql.build_summary_query` and
+    :func:`splus_match.adql.build_centre_query` and the per-source ``ACOS``
+    queries of the original v4 script, which are evaluated as the full-table
+    scan they are on the real server. Only the selected columns are
+    returned; photometry is synthesized per source.
+    Uploads over ``max_upload_rows`` and results over ``max_result_rows``
+    are rejected with the server's "too large" errors.
+    """
+
+    def __init__(self, catalog, max_upload_rows=None, max_result_rows=None):
+        self.catalog = catalog
+        self.ra = catalog["RA"].to_numpy()
+        self.dec = catalog["DEC"].to_numpy()
+        self.ids = catalog["ID"].to_numpy()
+        codes = catalog["Field"].cat.codes.to_numpy()
+        # Rows of each field (the catalog is sorted by field)
+        bounds = np.searchsorted(codes, np.arange(len(catalog["Field"].cat.categories) + 1))
+        self.field_rows = {name: slice(bounds[i], bounds[i + 1])
+                           for i, name in enumerate(catalog["Field"].cat.categories)}
+        self.matcher = LocalMatcher(self.ra, self.dec)
+        self.max_upload_rows = max_upload_rows
+        self.max_result_rows = max_result_rows
+        self.lock = threading.Lock()
+        self.stats = {"field": 0, "upload": 0, "summary": 0, "acos": 0, "rejected": 0,
+                      "rows_uploaded": 0, "rows_returned": 0}
+
+    def field_table(self):
+        """Field list with centres, like ``iDR5_fields_zps.csv``."""
+        names = list(self.field_rows)
+        centres = [(self.ra[self.field_rows[n]].mean(), self.dec[self.field_rows[n]].mean()) for n in names]
+        ra, dec = zip(*centres) if centres else ((), ())
+        return pd.DataFrame({"Field": names, "RA": ra, "DEC": dec})
+
+    def connect(self, **kwargs):
+        """A :class:`FakeConnection` backed by this server (``kwargs`` set latency and failures)."""
+        return FakeConnection(handler=self, **kwargs)
+
+    def _count(self, kind, uploaded=0, returned=0):
+        with self.lock:
+            self.stats[kind] += 1
+            self.stats["rows_uploaded"] += uploaded
+            self.stats["rows_returned"] += returned
+
+    def _reject(self, message):
+        with self.lock:
+            self.stats["rejected"] += 1
+        raise RuntimeError(message)
+
+    def _values(self, name, rows):
+        if name in ("RA", "DEC", "ID", "Field"):
+            values = self.catalog[name].to_numpy()[rows]
+            return np.asarray(values, dtype=str) if name == "Field" else values
+        return _synthetic_column(name, self.ids[rows])
+
+    def _filter(self, query, rows):
+        # Boolean mask of the rows passing the numeric WHERE conditions
+        where = query.split("\nWHERE ", 1)[1].split("GROUP BY", 1)[0] if "\nWHERE " in query else ""
+        keep = rows >= 0
+        for name, op, value in CONDITION.findall(where):
+            keep &= OPS[op](self._values(name, np.where(rows >= 0, rows, 0)), float(value))
+        return keep
+
+    def _result(self, query, rows, upload_rows=None, upload=None):
+        if self.max_result_rows is not None and len(rows) > self.max_result_rows:
+            self._reject("Query result size limit exceeded")
+        select = query.split("SELECT", 1)[1].split("FROM", 1)[0]
+        columns = {}
+        for item in select.split(","):
+            alias, _, name = item.strip().rpartition(".")
+            if alias == "tap":
+                columns[name] = np.asarray(upload[name])[upload_rows]
+                continue
+            matched = rows >= 0
+            values = self._values(name, np.where(matched, rows, 0))
+            if not matched.all():
+                # Left outer join rows without a match are null (NaN / masked)
+                values = np.where(matched, values, np.nan) if values.dtype.kind == "f" else \
+                    np.ma.masked_array(values, mask=~matched)
+            columns[name] = values
+        return Table(columns)
+
+    def __call__(self, query, upload=None):
+        if "TAP_UPLOAD" in query:
+            return self._cone_join(query, upload)
+        if "ACOS(" in query:
+            return self._acos(query)
+        if "GROUP BY" in query:
+            return self._centres()
+        field = re.search(r"Field = '([^']*)'", query)
+        if field is None:
+            raise ValueError("FakeSplusServer: unsupported query")
+        rows = np.arange(len(self.catalog))[self.field_rows.get(field.group(1), slice(0, 0))]
+        rows = rows[self._filter(query, rows)]
+        self._count("field", returned=len(rows))
+        return self._result(query, rows)
+
+    def _cone_join(self, query, upload):
+        n = len(upload)
+        if self.max_upload_rows is not None and n > self.max_upload_rows:
+            self._reject("413 Request Entity Too Large: upload exceeds the maximum size")
+        circle = re.search(r"CIRCLE\('ICRS', tap\.(\w+), tap\.(\w+), ([-+0-9.eE]+)\)", query)
+        ra_col, dec_col, radius = circle.group(1), circle.group(2), float(circle.group(3))
+        up_idx, rows, _ = self.matcher.match_all(np.asarray(upload[ra_col], dtype=float),
+                                                 np.asarray(upload[dec_col], dtype=float), radius * 3600.0)
+        if re.search(r"FROM TAP_UPLOAD\.upload AS tap\s+LEFT OUTER JOIN", query):
+            unmatched = np.setdiff1d(np.arange(n), up_idx)
+            up_idx = np.concatenate((up_idx, unmatched))
+            rows = np.concatenate((rows, np.full(len(unmatched), -1)))
+        if "\nWHERE " in query:
+            keep = self._filter(query, rows)
+            up_idx, rows = up_idx[keep], rows[keep]
+        if "GROUP BY" in query:
+            return self._summary(query, upload, up_idx, rows, ra_col, dec_col)
+        self._count("upload", uploaded=n, returned=len(rows))
+        return self._result(query, rows, upload_rows=up_idx, upload=upload)
+
+    def _summary(self, query, upload, up_idx, rows, ra_col, dec_col):
+        select = query.split("SELECT", 1)[1].split("FROM TAP_UPLOAD", 1)[0]
+        frame = pd.DataFrame({"_upload": up_idx})
+        aggregations = {}
+        for item in select.split(",\n"):
+            item = item.strip()
+            name = item.rpartition(" AS ")[2]
+            if item.startswith("tap."):
+                key = item[len("tap."):]
+                frame[key] = np.asarray(upload[key])[up_idx]
+                aggregations[key] = "first"
+            elif item.startswith("COUNT("):
+                frame[name] = 1
+                aggregations[name] = "sum"
+            elif item.startswith("MIN(DISTANCE("):
+                chord = np.linalg.norm(radec_to_xyz(self.ra[rows], self.dec[rows]) -
+                                       radec_to_xyz(np.asarray(upload[ra_col])[up_idx],
+                                                    np.asarray(upload[dec_col])[up_idx]), axis=1)
+                frame[name] = chord_to_arcsec(chord)
+                aggregations[name] = "min"
+            else:
+                func, column = re.match(r"(MIN|MAX)\(\w+\.(\w+)\)", item).groups()
+                frame[name] = self._values(column, rows)
+                aggregations[name] = func.lower()
+        result = frame.groupby("_upload", sort=True).agg(aggregations)
+        if self.max_result_rows is not None and len(result) > self.max_result_rows:
+            self._reject("Query result size limit exceeded")
+        self._count("summary", uploaded=len(upload), returned=len(result))
+        return Table({name: result[name].to_numpy() for name in aggregations})
+
+    def _centres(self):
+        # Mean unit vector of each field's detections
+        xyz = radec_to_xyz(self.ra, self.dec)
+        names = list(self.field_rows)
+        means = np.array([xyz[self.field_rows[n]].mean(axis=0) for n in names]).reshape(-1, 3)
+        self._count("field", returned=len(names))
+        return Table({"Field": np.asarray(names, dtype=str), "x": means[:, 0], "y": means[:, 1], "z": means[:, 2]})
+
+    def _acos(self, query):
+        # dual.RA/DEC of the whole table go through the ACOS expression, as on the server
+        dec0 = float(re.search(r"SIN\(RADIANS\(([-+0-9.eE]+)\)\)", query).group(1))
+        ra0 = float(re.search(r"dual\.RA - ([-+0-9.eE]+)", query).group(1))
+        limit = float(re.search(r"<= ([-+0-9.eE]+)", query).group(1))
+        d0, d, dra = np.radians(dec0), np.radians(self.dec), np.radians(self.ra - ra0)
+        cos_sep = np.sin(d0) * np.sin(d) + np.cos(d0) * np.cos(d) * np.cos(dra)
+        sep = 60 * 60 * 2.0 * np.degrees(np.arccos(np.clip(cos_sep, -1.0, 1.0)))
+        rows = np.flatnonzero(sep <= limit)
+        self._count("acos", returned=len(rows))
+        return self._result(query, rows)
+
+
+# Servers built by FakeServerFactory, one per catalog and process
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+class FakeServerFactory:
+    """Picklable ``connect()`` for distributed runs, returning connections to a :class:`FakeSplusServer`.
+
+    Every process (each Dask worker and the client) rebuilds the same
+    ``synthetic_splus(n_rows, n_fields, seed)`` catalog once, so all of them
+    answer queries identically. ``connection`` sets latency and failures.
+    """
+
+    def __init__(self, n_rows, n_fields=None, seed=0, **connection):
+        self.n_rows = n_rows
+        self.n_fields = n_fields
+        self.seed = seed
+        self.connection = connection
+
+    def server(self):
+        key = (self.n_rows, self.n_fields, self.seed)
+        with _servers_lock:
+            if key not in _servers:
+                _servers[key] = FakeSplusServer(synthetic_splus(self.n_rows, self.n_fields, self.seed))
+            return _servers[key]
+
+    def __call__(self):
+        return self.server().connect(**self.connection)
+
+    def __dask_tokenize__(self):
+        return ("FakeServerFactory", self.n_rows, self.n_fields, self.seed, sorted(self.connection.items()))
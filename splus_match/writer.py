@@ -0,0 +1,73 @@
+"""Append-only output sink for crossmatch results.
+
+Each field or chunk is written straight to disk as it arrives, so the full
+result table is never accumulated in memory. Parquet (one row group per
+write, with column statistics) or CSV is written, following the file
+suffix. Batches may be pandas DataFrames or Arrow tables.
+"""
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class StreamingWriter:
+    """Write DataFrame batches to ``path`` one at a time.
+
+    ``fmt`` is ``"parquet"`` or ``"csv"``; by default it follows the file
+    suffix.
+    """
+
+    def __init__(self, path, fmt=None):
+        path = Path(path)
+        if fmt is None:
+            fmt = "parquet" if path.suffix == ".parquet" else "csv"
+        self.path = path
+        self.fmt = fmt
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+        self._columns = None
+
+    def write(self, df):
+        if df is None or len(df) == 0:
+            return
+        if self.fmt == "parquet":
+            self._write_parquet(df)
+        else:
+            self._write_csv(df)
+        self.rows += len(df)
+
+    def _write_parquet(self, df):
+        if isinstance(df, pa.Table):
+            table = df
+        else:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema.remove_metadata()
+            self._writer = pq.ParquetWriter(self.path, self._schema, write_statistics=True)
+        elif not table.schema.equals(self._schema, check_metadata=False):
+            # Later batches may infer different types (e.g. an all-null column)
+            table = table.select(self._schema.names).cast(self._schema, safe=False)
+        self._writer.write_table(table)
+
+    def _write_csv(self, df):
+        if isinstance(df, pa.Table):
+            df = df.to_pandas()
+        if self._columns is None:
+            self._columns = list(df.columns)
+            df.to_csv(self.path, index=False)
+        else:
+            df[self._columns].to_csv(self.path, mode="a", header=False, index=False)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,54 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from splus_match.cache import FieldCache
+
+TEMPLATE = "SELECT ID, RA, DEC, r_PStotal FROM idr5.idr5_dual WHERE Field = '{field}'"
+
+
+def field_table(seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"ID": np.arange(1000), "RA": rng.random(1000), "DEC": rng.random(1000)})
+
+
+def test_least_recently_used_fields_are_evicted(tmp_path):
+    cache = FieldCache(tmp_path, max_bytes=10**9)
+    for i, field in enumerate(["A", "B", "C"]):
+        cache.put("idr5", field, TEMPLATE, field_table(i))
+        # Distinct last-used times, oldest first
+        os.utime(cache.path("idr5", field, TEMPLATE), (time.time() - 100 + i, time.time() - 100 + i))
+    sizes = {f: cache.path("idr5", f, TEMPLATE).stat().st_size for f in "ABC"}
+
+    # Reading A makes B the least recently used
+    assert cache.get("idr5", "A", TEMPLATE) is not None
+    cache.max_bytes = sum(sizes.values()) + sizes["A"] // 2
+    cache.put("idr5", "D", TEMPLATE, field_table(3))
+    cached = [f for f in "ABCD" if cache.path("idr5", f, TEMPLATE).exists()]
+    assert cached == ["A", "C", "D"]
+    assert cache.stats["evictions"] == 1
+
+
+def test_evicts_until_under_the_limit(tmp_path):
+    cache = FieldCache(tmp_path, max_bytes=0)
+    cache.put("idr5", "A", TEMPLATE, field_table(0))
+    assert not cache.path("idr5", "A", TEMPLATE).exists()
+    assert cache.get("idr5", "A", TEMPLATE) is None
+
+
+def test_changed_query_misses(tmp_path):
+    cache = FieldCache(tmp_path)
+    df = field_table(0)
+    cache.put("idr5", "A", TEMPLATE, df)
+    # Whitespace and comments do not change the key
+    same = "-- r band only\n" + TEMPLATE.replace(" FROM", "\n    FROM")
+    pd.testing.assert_frame_equal(cache.get("idr5", "A", same), df)
+    assert cache.stats["hits"] == 1
+    # Other columns, another field or another release do
+    assert cache.get("idr5", "A", TEMPLATE.replace("r_PStotal", "g_PStotal")) is None
+    assert cache.get("idr5", "B", TEMPLATE) is None
+    assert cache.get("idr4", "A", TEMPLATE) is None
+    assert cache.stats["misses"] == 3
+    assert cache.split("idr5", ["A", "B"], TEMPLATE) == (["A"], ["B"])
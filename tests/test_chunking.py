@@ -0,0 +1,100 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from splus_match.chunking import AdaptiveChunker, bbox_predicate
+from splus_match.scheduler import QueryScheduler
+from splus_match.testing import FakeConnection
+
+
+def size_limited(max_rows):
+    # Rejects uploads over max_rows like the server, returns one row per source otherwise
+    def handler(query, upload):
+        if len(upload) > max_rows:
+            raise RuntimeError("413 Request Entity Too Large: upload exceeds the maximum size")
+        return upload
+    return handler
+
+
+def run_chunker(chunker, n, max_rows, concurrency=1):
+    df = pd.DataFrame({"RA": range(n), "DEC": range(n)})
+    conn = FakeConnection(handler=size_limited(max_rows))
+    with QueryScheduler(conn, max_concurrency=concurrency, retries=0, verbose=False) as scheduler:
+        chunks = list(chunker.run(scheduler, "query", df))
+    return chunks, conn
+
+
+def test_every_row_is_uploaded_once():
+    chunker = AdaptiveChunker(initial=100, fast_seconds=1.0)
+    chunks, _ = run_chunker(chunker, 4000, 150, concurrency=4)
+    assert all(c.error is None for c in chunks)
+    assert all(c.stop - c.start <= 150 for c in chunks)
+    covered = sorted((c.start, c.stop) for c in chunks)
+    assert covered[0][0] == 0 and covered[-1][1] == 4000
+    assert all(a[1] == b[0] for a, b in zip(covered, covered[1:]))
+
+
+def test_rejections_lower_the_limit():
+    chunker = AdaptiveChunker(initial=100, fast_seconds=1.0)
+    chunks, conn = run_chunker(chunker, 4000, 150)
+    # 100 is accepted, 200 rejected: the limit is bisected to 150 and kept there
+    assert chunker.max_size == 150
+    assert chunker.stats["splits"] <= 2
+    assert conn.calls == len(chunks) + chunker.stats["splits"]
+
+
+def test_rejected_pieces_are_split_again():
+    # The first chunk is far above the limit: its pieces keep being split
+    # until they fit, each rejection lowering the limit
+    chunker = AdaptiveChunker(initial=1000, fast_seconds=1.0)
+    chunks, _ = run_chunker(chunker, 1000, 100)
+    assert all(c.error is None for c in chunks)
+    assert chunker.max_size <= 100
+    assert chunker.stats["splits"] <= 5
+
+
+def evaluate(clause, ra, dec):
+    # Evaluate a bbox_predicate clause on arrays of positions
+    mask = np.ones(len(ra), dtype=bool)
+    for column, lo, hi in re.findall(r"s\.(RA|DEC) BETWEEN ([-0-9.]+) AND ([-0-9.]+)", clause):
+        values = ra if column == "RA" else dec
+        mask &= (values >= float(lo)) & (values <= float(hi))
+    for lo, hi in re.findall(r"\(s\.RA >= ([-0-9.]+) OR s\.RA <= ([-0-9.]+)\)", clause):
+        mask &= (ra >= float(lo)) | (ra <= float(hi))
+    return mask
+
+
+def around(ra, dec, radius_deg, n, rng):
+    # Random positions within radius_deg of each (ra, dec), by bearing and distance on the sphere
+    ra, dec = np.radians(np.repeat(ra, n)), np.radians(np.repeat(dec, n))
+    distance = np.radians(radius_deg) * np.sqrt(rng.random(len(ra))) * 0.999
+    bearing = rng.random(len(ra)) * 2 * np.pi
+    dec2 = np.arcsin(np.sin(dec) * np.cos(distance) + np.cos(dec) * np.sin(distance) * np.cos(bearing))
+    ra2 = ra + np.arctan2(np.sin(bearing) * np.sin(distance) * np.cos(dec),
+                          np.cos(distance) - np.sin(dec) * np.sin(dec2))
+    return np.mod(np.degrees(ra2), 360.0), np.degrees(dec2)
+
+
+@pytest.mark.parametrize("ra_centre, dec_centre, wraps", [
+    (0.0, 0.0, True),      # the chunk straddles RA = 0
+    (0.0, 80.0, True),     # and is padded more at high declination
+    (180.0, -30.0, False),
+    (0.0, 89.5, None),     # polar cap: no RA range at all
+])
+def test_bbox_predicate_keeps_every_neighbour(ra_centre, dec_centre, wraps):
+    rng = np.random.default_rng(0)
+    radius = 0.5
+    chunk = pd.DataFrame({"RA": np.mod(ra_centre + rng.uniform(-1.0, 1.0, 50), 360.0),
+                          "DEC": dec_centre + rng.uniform(-0.3, 0.3, 50)})
+    clause = bbox_predicate(chunk, "RA", "DEC", radius, "s")
+    assert ("OR" in clause) is bool(wraps)
+    assert ("s.RA" in clause) is (wraps is not None)
+
+    # Brute force: every position within the radius of a chunk source passes
+    ra, dec = around(chunk["RA"].values, chunk["DEC"].values, radius, 200, rng)
+    assert evaluate(clause, ra, dec).all()
+    # and positions far away in RA are pruned, except at the pole
+    far = evaluate(clause, np.mod(ra + 90.0, 360.0), dec)
+    assert far.all() if wraps is None else not far.any()
@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from splus_match import strategies
+from splus_match.testing import FakeServerFactory, synthetic_galex
+
+distributed = pytest.importorskip("distributed")
+
+from splus_match.distributed import run_field_dask  # noqa: E402
+
+
+def sorted_rows(path):
+    df = pd.read_parquet(path)
+    return df.sort_values(["GALEX_RA", "GALEX_DEC", "ID"]).reset_index(drop=True)
+
+
+def test_dask_matches_run_field(tmp_path):
+    connect = FakeServerFactory(100000, n_fields=6, failure_rate=0.05, seed=0)
+    server = connect.server()
+    galex = synthetic_galex(server.catalog, 1000)
+    common = dict(release="idr5", radius_arcsec=2.0, ra_col="GALEX_RA", dec_col="GALEX_DEC",
+                  photometry=("PStotal",), mode="best_right", fields=server.field_table(), retries=10, rate=None)
+
+    expected = strategies.run_field(galex, connect(), tmp_path / "pipeline.parquet", cache_dir=tmp_path / "cache",
+                                    match_workers=1, **common)
+    with distributed.LocalCluster(n_workers=2, threads_per_worker=1, dashboard_address=None) as cluster, \
+            distributed.Client(cluster) as client:
+        stats = run_field_dask(galex, tmp_path / "dask.parquet", client=client, connect=connect,
+                               fields_per_task=2, cache_dir=tmp_path / "cache", **common)
+
+    assert stats["failed"] == 0
+    assert stats["rows"] == expected["rows"] > 0
+    pd.testing.assert_frame_equal(sorted_rows(stats["output"]), sorted_rows(expected["output"]))
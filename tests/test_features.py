@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from splus_match import cli
+from splus_match.features import ZeroPoints, add_features, feature_bands, parse_feature
+
+
+def photometry():
+    return pd.DataFrame({
+        "Field": ["F1", "F1", "F2"],
+        "r_PStotal": [17.0, 99.0, 17.0],
+        "e_r_PStotal": [0.03, 0.5, 0.03],
+        "J0660_PStotal": [16.5, 16.5, 16.5],
+        "e_J0660_PStotal": [0.04, 0.04, 0.04],
+        "i_PStotal": [16.8, 16.8, 16.8],
+        "e_i_PStotal": [0.02, 0.02, 0.02],
+    })
+
+
+def zero_point_table():
+    return pd.DataFrame({"Field": ["F1"], "ZP_r": [0.1], "eZP_r": [0.01],
+                         "ZP_J0660": [-0.2], "eZP_J0660": [0.02], "ZP_i": [0.0]})
+
+
+def test_parse_feature():
+    assert parse_feature("r-J0660") == ("r-J0660", {"r": 1.0, "J0660": -1.0}, 0.0)
+    name, terms, constant = parse_feature("halpha=(r-J0660)-0.25*(r-i)")
+    assert name == "halpha" and terms == {"r": 0.75, "J0660": -1.0, "i": 0.25} and constant == 0.0
+    assert feature_bands(["r-J0660", "g-r"]) == ["J0660", "g", "r"]
+    with pytest.raises(ValueError):
+        parse_feature("r*i")
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_values_and_errors(arrow):
+    table = photometry()
+    table = pa.Table.from_pandas(table) if arrow else table
+    out = add_features(table, ["r-J0660", "halpha=(r-J0660)-0.25*(r-i)"])
+    out = out.to_pandas() if arrow else out
+    # 17.0 - 16.5, sqrt(0.03**2 + 0.04**2)
+    assert out["r-J0660_PStotal"][0] == pytest.approx(0.5, abs=1e-6)
+    assert out["e_r-J0660_PStotal"][0] == pytest.approx(0.05, abs=1e-6)
+    # 0.5 - 0.25 * (17.0 - 16.8), sqrt(0.75**2 * 0.03**2 + 0.04**2 + 0.25**2 * 0.02**2)
+    assert out["halpha_PStotal"][0] == pytest.approx(0.45, abs=1e-6)
+    assert out["e_halpha_PStotal"][0] == pytest.approx(0.0461655, abs=1e-6)
+    # r = 99 is a non-detection
+    assert np.isnan(out["r-J0660_PStotal"][1]) and np.isnan(out["e_r-J0660_PStotal"][1])
+    assert out["r-J0660_PStotal"].dtype == np.float32
+
+
+def test_zero_points_per_field():
+    out = add_features(photometry(), ["r-J0660"], zero_points=ZeroPoints(zero_point_table()))
+    # (17.0 + 0.1) - (16.5 - 0.2), sqrt(0.03**2 + 0.01**2 + 0.04**2 + 0.02**2)
+    assert out["r-J0660_PStotal"][0] == pytest.approx(0.8, abs=1e-6)
+    assert out["e_r-J0660_PStotal"][0] == pytest.approx(0.0547723, abs=1e-6)
+    # F2 is not in the zero-point table
+    assert np.isnan(out["r-J0660_PStotal"][2])
+
+
+def test_zero_point_check():
+    zero_points = ZeroPoints(zero_point_table())
+    zero_points.check(["r", "J0660"], ["F1"])
+    with pytest.raises(ValueError, match="g"):
+        zero_points.check(["g", "r"])
+    with pytest.raises(ValueError, match="F2"):
+        zero_points.check(["r"], ["F1", "F2"])
+
+
+def test_cli_checks_zero_points_before_querying(tmp_path, monkeypatch, capsys):
+    fields = pd.DataFrame({"Field": ["F1", "F2"], "RA": [150.0, 160.0], "DEC": [-20.0, -20.0]})
+    fields.to_csv(tmp_path / "fields.csv", index=False)
+    zero_point_table().to_csv(tmp_path / "zps.csv", index=False)
+    pd.DataFrame({"GALEX_RA": [150.0, 160.0], "GALEX_DEC": [-20.0, -20.0]}).to_csv(tmp_path / "in.csv", index=False)
+
+    def connect():
+        raise AssertionError("queried before checking the zero points")
+    monkeypatch.setattr(cli, "connect", connect)
+    with pytest.raises(SystemExit):
+        cli.main([str(tmp_path / "in.csv"), "--out", str(tmp_path / "out.parquet"), "--strategy", "field",
+                  "--ra-col", "GALEX_RA", "--dec-col", "GALEX_DEC", "--fields", str(tmp_path / "fields.csv"),
+                  "--features", "r-J0660", "--zero-points", str(tmp_path / "zps.csv")])
+    assert "F2" in capsys.readouterr().err
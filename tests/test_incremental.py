@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from splus_match.incremental import MatchStore, run_incremental, source_hashes
+from splus_match.testing import FakeConnection, FakeSplusServer, synthetic_galex, synthetic_splus
+
+
+def catalog(ids, ra, dec):
+    return pd.DataFrame({"GALEX_ID": ids, "GALEX_RA": ra, "GALEX_DEC": dec})
+
+
+def hashes(df):
+    return source_hashes(df, "GALEX_ID", "GALEX_RA", "GALEX_DEC")
+
+
+def test_diff_finds_new_moved_and_removed(tmp_path):
+    store = MatchStore(tmp_path)
+    old = catalog(["a", "b", "c"], [10.0, 20.0, 30.0], [-1.0, -2.0, -3.0])
+    store.commit("idr5", 2.0, "s", "upload", old["GALEX_ID"].tolist(), hashes(old), None, 0)
+
+    # b moved, c removed, d new; a is rewritten below the hashing precision
+    new = catalog(["a", "b", "d"], [10.00000001, 20.001, 40.0], [-1.0, -2.0, -4.0])
+    changed, removed = store.diff(new["GALEX_ID"].tolist(), hashes(new), "idr5", 2.0, "s")
+    assert changed.tolist() == [False, True, True]
+    assert removed == ["c"]
+    # Other releases, radii and settings are separate
+    changed, _ = store.diff(new["GALEX_ID"].tolist(), hashes(new), "idr5", 2.0, "other")
+    assert changed.all()
+    store.close()
+
+
+def write_batch(store, name, ids):
+    path = store.directory / name
+    pd.DataFrame({"GALEX_ID": ids, "r_PStotal": np.arange(len(ids), dtype=float)}).to_parquet(path)
+    return name
+
+
+def test_commit_repoints_sources_and_export_keeps_current_rows(tmp_path):
+    store = MatchStore(tmp_path / "store")
+    first = catalog(["a", "b"], [1.0, 2.0], [0.0, 0.0])
+    store.commit("idr5", 2.0, "s", "upload", ["a", "b"], hashes(first), write_batch(store, "1.parquet", ["a", "b"]), 2)
+    # b is matched again and a removed: the first batch holds no current rows
+    store.commit("idr5", 2.0, "s", "upload", ["b"], hashes(first)[1:], write_batch(store, "2.parquet", ["b"]), 1,
+                 removed=["a"])
+    assert [shard for _, shard in store.batches("idr5", 2.0, "s")] == ["2.parquet"]
+    assert store.prune("idr5", 2.0, "s") == 1
+    assert not (store.directory / "1.parquet").exists()
+
+    out = tmp_path / "out.parquet"
+    writer = store.export(out, "idr5", 2.0, "s", "GALEX_ID")
+    assert writer.path == out and writer.rows == 1
+    assert pd.read_parquet(out)["GALEX_ID"].tolist() == ["b"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out.parquet", "store"]
+    store.close()
+
+
+def test_failed_export_keeps_the_previous_output(tmp_path):
+    store = MatchStore(tmp_path / "store")
+    first = catalog(["a"], [1.0], [0.0])
+    store.commit("idr5", 2.0, "s", "upload", ["a"], hashes(first), write_batch(store, "1.parquet", ["a"]), 1)
+    out = tmp_path / "out.parquet"
+    store.export(out, "idr5", 2.0, "s", "GALEX_ID")
+    with pytest.raises(KeyError):
+        store.export(out, "idr5", 2.0, "s", "MISSING_ID")
+    assert pd.read_parquet(out)["GALEX_ID"].tolist() == ["a"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out.parquet", "store"]
+    store.close()
+
+
+def test_check_schema_rejects_other_columns(tmp_path):
+    store = MatchStore(tmp_path)
+    first = catalog(["a"], [1.0], [0.0])
+    store.commit("idr5", 2.0, "s", "upload", ["a"], hashes(first), write_batch(store, "1.parquet", ["a"]), 1)
+    pd.DataFrame({"GALEX_ID": ["b"], "g_PStotal": [1.0]}).to_parquet(tmp_path / "2.parquet")
+    with pytest.raises(ValueError, match="columns"):
+        store.check_schema("idr5", 2.0, "s", tmp_path / "2.parquet")
+    store.close()
+
+
+def test_incremental_upload_commits_once_resumed(tmp_path):
+    server = FakeSplusServer(synthetic_splus(50000, 4))
+    galex = synthetic_galex(server.catalog, 2000)
+    galex.insert(0, "GALEX_ID", [f"G{i}" for i in range(len(galex))])
+    calls = []
+
+    def flaky(query, upload):
+        calls.append(query)
+        if len(calls) > 3:
+            raise ConnectionError("503 Service Unavailable")
+        return server(query, upload)
+
+    options = dict(id_col="GALEX_ID", ra_col="GALEX_RA", dec_col="GALEX_DEC", bands=("r",), mode="best_left",
+                   initial_chunk=200, max_concurrency=1, rate=None, retries=0)
+    out = tmp_path / "matches.parquet"
+    stats = run_incremental(galex, out, "upload", tmp_path / "store", conn=FakeConnection(handler=flaky), **options)
+    assert stats["failed"] and stats["matched"] == 0
+    stats = run_incremental(galex, out, "upload", tmp_path / "store", conn=server.connect(), **options)
+    assert stats["matched"] == len(galex) and not stats.get("failed")
+    rows = stats["rows"]
+
+    # Nothing changed: everything is reused
+    stats = run_incremental(galex, out, "upload", tmp_path / "store", conn=server.connect(), **options)
+    assert stats["matched"] == 0 and stats["reused"] == len(galex) and stats["rows"] == rows
+    # One source moved by 10 arcsec is matched again
+    moved = galex.copy()
+    moved.loc[0, "GALEX_DEC"] += 10 / 3600.0
+    stats = run_incremental(moved, out, "upload", tmp_path / "store", conn=server.connect(), **options)
+    assert stats["matched"] == 1 and stats["reused"] == len(galex) - 1
+    assert pd.read_parquet(out)["GALEX_ID"].is_unique
@@ -0,0 +1,68 @@
+import pandas as pd
+import pytest
+
+from splus_match.inputs import SOURCE_ROW, avoid_clashes, load_catalog, rejoin_columns
+
+
+def write_input(tmp_path):
+    # Input columns named like S-PLUS ones (ID, RA, DEC, Field)
+    path = tmp_path / "input.csv"
+    pd.DataFrame({"ID": ["G0", "G1", "G2"], "RA": [10.0, 20.0, 30.0], "DEC": [-1.0, -2.0, -3.0],
+                  "NUVmag": [20.5, 21.0, 21.5], "Field": ["g0", "g1", "g2"]}).to_csv(path, index=False)
+    return path
+
+
+def test_load_catalog_and_avoid_clashes(tmp_path):
+    local = load_catalog(write_input(tmp_path), "RA", "DEC")
+    assert list(local.columns) == [SOURCE_ROW, "RA", "DEC"]
+    local, names = avoid_clashes(local, ["RA", "DEC"], ["Field", "id", "ra", "dec"])
+    assert names == {"RA": "local_RA", "DEC": "local_DEC"}
+    assert list(local.columns) == [SOURCE_ROW, "local_RA", "local_DEC"]
+
+
+@pytest.mark.parametrize("suffix", [".parquet", ".csv"])
+def test_rejoin_by_source_row(tmp_path, suffix):
+    path = write_input(tmp_path)
+    # Matches of sources 2, 0 and 2 again, with the S-PLUS ID, RA, DEC and Field
+    output = pd.DataFrame({SOURCE_ROW: [2, 0, 2], "local_RA": [30.0, 10.0, 30.0], "local_DEC": [-3.0, -1.0, -3.0],
+                           "Field": ["F1", "F1", "F2"], "ID": [7, 8, 9], "RA": [30.0001, 10.0001, 30.0002],
+                           "DEC": [-3.0, -1.0, -3.0]})
+    out = tmp_path / f"out{suffix}"
+    output.to_parquet(out) if suffix == ".parquet" else output.to_csv(out, index=False)
+
+    added = rejoin_columns(out, path, names={"RA": "local_RA", "DEC": "local_DEC"})
+    assert added == ["local_ID", "NUVmag", "local_Field"]
+    df = pd.read_parquet(out) if suffix == ".parquet" else pd.read_csv(out)
+    assert list(df.columns) == list(output.columns) + added
+    assert df["local_ID"].tolist() == ["G2", "G0", "G2"]
+    assert df["NUVmag"].tolist() == [21.5, 20.5, 21.5]
+    assert df["local_Field"].tolist() == ["g2", "g0", "g2"]
+    # The S-PLUS columns are untouched
+    assert df["ID"].tolist() == [7, 8, 9] and df["Field"].tolist() == ["F1", "F1", "F2"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["input.csv", f"out{suffix}"]
+
+
+@pytest.mark.parametrize("suffix", [".parquet", ".csv"])
+def test_rejoin_by_id(tmp_path, suffix):
+    path = write_input(tmp_path)
+    output = pd.DataFrame({"local_ID": ["G1", "G2"], "local_RA": [20.0, 30.0], "local_DEC": [-2.0, -3.0],
+                           "r_PStotal": [17.0, 18.0]})
+    out = tmp_path / f"out{suffix}"
+    output.to_parquet(out) if suffix == ".parquet" else output.to_csv(out, index=False)
+
+    added = rejoin_columns(out, path, columns=["NUVmag", "Field"], key="ID",
+                           names={"ID": "local_ID", "RA": "local_RA", "DEC": "local_DEC"})
+    assert added == ["NUVmag", "Field"]
+    df = pd.read_parquet(out) if suffix == ".parquet" else pd.read_csv(out)
+    assert df["NUVmag"].tolist() == [21.0, 21.5]
+    assert df["Field"].tolist() == ["g1", "g2"]
+
+
+def test_rejoin_unknown_id_keeps_the_output(tmp_path):
+    path = write_input(tmp_path)
+    out = tmp_path / "out.parquet"
+    pd.DataFrame({"ID": ["G1", "G9"], "r_PStotal": [17.0, 18.0]}).to_parquet(out)
+    with pytest.raises(KeyError):
+        rejoin_columns(out, path, columns=["NUVmag"], key="ID")
+    assert list(pd.read_parquet(out).columns) == ["ID", "r_PStotal"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["input.csv", "out.parquet"]
@@ -0,0 +1,103 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from splus_match import scheduler as scheduler_module
+from splus_match.scheduler import QueryScheduler, QueryTimeout
+from splus_match.testing import FakeConnection
+
+
+def run_all(scheduler, n):
+    return list(scheduler.run((i, f"query {i}", None) for i in range(n)))
+
+
+def test_concurrency_cap():
+    conn = FakeConnection(latency=0.05, jitter=0.02, seed=0)
+    with QueryScheduler(conn, max_concurrency=3, retries=0, verbose=False) as scheduler:
+        results = run_all(scheduler, 30)
+    assert sorted(r.key for r in results) == list(range(30))
+    assert all(r.error is None for r in results)
+    assert conn.max_in_flight == 3
+
+
+def test_retries_transient_failures():
+    conn = FakeConnection(latency=0.001, failure_rate=0.3, seed=3)
+    with QueryScheduler(conn, max_concurrency=4, retries=20, backoff=0.001, verbose=False) as scheduler:
+        results = run_all(scheduler, 50)
+    assert all(r.error is None for r in results)
+    assert conn.failures > 0
+    assert scheduler.stats["retries"] == conn.failures
+    assert conn.calls == 50 + conn.failures
+    assert sum(r.attempts for r in results) == conn.calls
+
+
+def test_backoff_delays(monkeypatch):
+    delays = []
+    # Only the scheduler's sleeps are recorded, not the connection's
+    monkeypatch.setattr(scheduler_module, "time", SimpleNamespace(sleep=delays.append, monotonic=time.monotonic,
+                                                                  perf_counter=time.perf_counter))
+    conn = FakeConnection(failure_rate=1.0, seed=0)
+    scheduler = QueryScheduler(conn, max_concurrency=1, retries=5, backoff=1.0, max_backoff=4.0, verbose=False)
+    with pytest.raises(ConnectionError):
+        scheduler.query("query")
+    scheduler.close()
+    assert conn.calls == 6
+    assert len(delays) == 5
+    # Exponential backoff with jitter in [d/2, d], capped at max_backoff
+    for attempt, delay in enumerate(delays):
+        d = min(4.0, 2.0 ** attempt)
+        assert d / 2 <= delay <= d
+
+
+def test_non_retryable_error_is_not_retried():
+    conn = FakeConnection(failure_rate=1.0, failure=lambda: ValueError("syntax error in ADQL"), seed=0)
+    with QueryScheduler(conn, retries=5, backoff=0.001, verbose=False) as scheduler:
+        results = run_all(scheduler, 3)
+    assert all(isinstance(r.error, ValueError) for r in results)
+    assert conn.calls == 3
+    assert scheduler.stats["retries"] == 0
+
+
+def test_timeout():
+    conn = FakeConnection(latency=1.0)
+    with QueryScheduler(conn, retries=1, backoff=0.001, timeout=0.05, verbose=False) as scheduler:
+        t0 = time.perf_counter()
+        (result,) = run_all(scheduler, 1)
+        elapsed = time.perf_counter() - t0
+    assert isinstance(result.error, QueryTimeout)
+    # Timed-out attempts are retried, then the error is returned
+    assert conn.calls == 2
+    assert elapsed < 0.9
+
+
+def test_results_in_completion_order():
+    # Query i takes (4 - i) / 20 s, so the last submitted finishes first
+    def handler(query, upload):
+        time.sleep((4 - int(query.split()[1])) / 20.0)
+        return query
+
+    conn = FakeConnection(handler=handler)
+    with QueryScheduler(conn, max_concurrency=5, retries=0, verbose=False) as scheduler:
+        keys = [r.key for r in run_all(scheduler, 5)]
+    assert keys == [4, 3, 2, 1, 0]
+
+
+def test_rate_limit():
+    conn = FakeConnection()
+    with QueryScheduler(conn, max_concurrency=4, rate=20.0, burst=1, retries=0, verbose=False) as scheduler:
+        t0 = time.perf_counter()
+        run_all(scheduler, 11)
+        elapsed = time.perf_counter() - t0
+    # One token up front, then one every 1/20 s
+    assert elapsed >= 10 / 20.0 * 0.9
+
+
+def test_query_runs_in_calling_thread():
+    seen = []
+    conn = FakeConnection(handler=lambda query, upload: seen.append(threading.current_thread()))
+    with QueryScheduler(conn, verbose=False) as scheduler:
+        result, attempts = scheduler.query("query")
+    assert attempts == 1
+    assert seen == [threading.current_thread()]
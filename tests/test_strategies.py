@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from splus_match import strategies
+from splus_match.testing import FakeConnection, FakeSplusServer, synthetic_galex, synthetic_splus
+
+
+def sorted_rows(path):
+    df = pd.read_parquet(path)
+    return df.sort_values(["GALEX_RA", "GALEX_DEC", "ID"]).reset_index(drop=True)
+
+
+def failing_after(server, n_calls):
+    # Answers like the server for the first n_calls queries, then fails every query
+    calls = []
+
+    def handler(query, upload):
+        calls.append(query)
+        if len(calls) > n_calls:
+            raise ConnectionError("503 Service Unavailable")
+        return server(query, upload)
+    return FakeConnection(handler=handler)
+
+
+UPLOAD = dict(ra_col="GALEX_RA", dec_col="GALEX_DEC", bands=("r",), mode="all", initial_chunk=200,
+              max_concurrency=1, rate=None, retries=0)
+
+
+def test_upload_resumes_after_failed_chunks(tmp_path):
+    server = FakeSplusServer(synthetic_splus(50000, 4))
+    galex = synthetic_galex(server.catalog, 2000)
+    out = tmp_path / "matches.parquet"
+
+    first = strategies.run_upload(galex, failing_after(server, 3), out, **UPLOAD)
+    assert first["failed"] > 0
+    # The rest is cut into new spans; once they are done nothing is left failed
+    second = strategies.run_upload(galex, server.connect(), out, **UPLOAD)
+    assert second["failed"] == 0
+    third = strategies.run_upload(galex, server.connect(), out, **UPLOAD)
+    assert third["failed"] == 0 and third["queries"] == 0
+
+    expected = strategies.run_upload(galex, server.connect(), tmp_path / "clean.parquet", **UPLOAD)
+    pd.testing.assert_frame_equal(sorted_rows(out), sorted_rows(expected["output"]))
+
+
+def overlap_catalog(offsets_arcsec, fields):
+    # S-PLUS detections north of (150, -20) by the given offsets, in the given fields
+    names = sorted(set(fields))
+    order = np.argsort(fields, kind="stable")
+    return pd.DataFrame({
+        "Field": pd.Categorical(np.asarray(fields)[order], categories=names),
+        "ID": np.arange(len(fields), dtype=np.int64)[order],
+        "RA": np.full(len(fields), 150.0),
+        "DEC": -20.0 + np.asarray(offsets_arcsec)[order] / 3600.0,
+    })
+
+
+def local_sources(offsets_arcsec):
+    return pd.DataFrame({"GALEX_RA": np.full(len(offsets_arcsec), 150.0),
+                         "GALEX_DEC": -20.0 + np.asarray(offsets_arcsec) / 3600.0})
+
+
+def pairs(path):
+    # (local offset, S-PLUS offset, rank) in arcsec, rounded
+    df = pd.read_parquet(path).dropna(subset=["RA"])
+    return sorted(zip(np.round((df["GALEX_DEC"] + 20.0) * 3600.0, 1).tolist(),
+                      np.round((df["DEC"] + 20.0) * 3600.0, 1).tolist(), df["match_rank"].tolist()))
+
+
+@pytest.mark.parametrize("mode, expected", [
+    ("all", [(0.0, 0.3, 1), (0.0, 0.6, 2)]),
+    ("best_left", [(0.0, 0.3, 1)]),
+    ("best_right", [(0.0, 0.3, 1), (0.0, 0.6, 2)]),
+    ("mutual", [(0.0, 0.3, 1)]),
+])
+def test_field_modes_span_overlapping_fields(tmp_path, mode, expected):
+    # The local source at 0 has a detection in each of two overlapping fields
+    server = FakeSplusServer(overlap_catalog([0.3, 0.6], ["F1", "F2"]))
+    stats = strategies.run_field(local_sources([0.0, 100.0]), server.connect(), tmp_path / "out.parquet",
+                                 ra_col="GALEX_RA", dec_col="GALEX_DEC", bands=("r",), photometry=("PStotal",),
+                                 mode=mode, fields=server.field_table(), cache_dir=tmp_path / "cache",
+                                 match_workers=1, rate=None)
+    assert stats["failed"] == 0
+    assert pairs(stats["output"]) == expected
+
+
+@pytest.mark.parametrize("mode, expected", [
+    ("all", [(0.0, 0.3, 1), (0.7, 0.3, 1)]),
+    ("best_left", [(0.0, 0.3, 1), (0.7, 0.3, 1)]),
+    ("best_right", [(0.0, 0.3, 1)]),
+    ("mutual", [(0.0, 0.3, 1)]),
+])
+def test_upload_modes_span_chunks(tmp_path, mode, expected):
+    # Two local sources in different chunks share their only S-PLUS neighbour
+    server = FakeSplusServer(overlap_catalog([0.3], ["F1"]))
+    stats = strategies.run_upload(local_sources([0.0, 0.7]), server.connect(), tmp_path / "out.parquet",
+                                  **dict(UPLOAD, mode=mode, initial_chunk=1))
+    assert stats["failed"] == 0 and stats["queries"] == 2
+    assert pairs(stats["output"]) == expected
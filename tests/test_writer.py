@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from splus_match.writer import StreamingWriter
+
+
+def test_parquet_batches_keep_the_first_schema(tmp_path):
+    with StreamingWriter(tmp_path / "out.parquet") as writer:
+        writer.write(pd.DataFrame({"ID": [1, 2], "r_PStotal": [17.5, 18.0], "Field": ["F1", "F1"]}))
+        # An all-null column, reordered columns and narrower types in later batches
+        writer.write(pd.DataFrame({"Field": ["F2"], "r_PStotal": [None], "ID": [3]}))
+        writer.write(pa.table({"ID": pa.array([4], pa.int32()), "r_PStotal": pa.array([19.0], pa.float32()),
+                               "Field": ["F3"]}))
+        writer.write(pd.DataFrame({"ID": [], "r_PStotal": [], "Field": []}))
+    assert writer.fmt == "parquet" and writer.rows == 4
+    df = pd.read_parquet(writer.path)
+    assert list(df.columns) == ["ID", "r_PStotal", "Field"]
+    assert df["ID"].dtype == np.int64 and df["r_PStotal"].dtype == np.float64
+    assert df["ID"].tolist() == [1, 2, 3, 4]
+    assert df["Field"].tolist() == ["F1", "F1", "F2", "F3"]
+    assert np.isnan(df["r_PStotal"][2]) and df["r_PStotal"][3] == 19.0
+
+
+def test_csv_output(tmp_path):
+    with StreamingWriter(tmp_path / "out.csv") as writer:
+        writer.write(pd.DataFrame({"ID": [1], "r_PStotal": [17.5]}))
+        writer.write(pa.table({"r_PStotal": [18.0], "ID": [2]}))
+    assert writer.fmt == "csv" and writer.rows == 2
+    assert (tmp_path / "out.csv").read_text().splitlines() == ["ID,r_PStotal", "1,17.5", "2,18.0"]
+
+
+def test_format_override_and_empty_output(tmp_path):
+    writer = StreamingWriter(tmp_path / "out.dat", fmt="parquet")
+    writer.write(None)
+    writer.close()
+    assert writer.rows == 0 and not writer.path.exists()
+    writer = StreamingWriter(tmp_path / "out.dat", fmt="parquet")
+    writer.write(pd.DataFrame({"ID": [1]}))
+    writer.close()
+    assert pd.read_parquet(writer.path)["ID"].tolist() == [1]